@@ -1,24 +1,38 @@
 try:
     from PyQt6.QtGui import QColor
+    from PyQt6.QtCore import QCoreApplication
 except:
     from PyQt5.QtGui import QColor
+    from PyQt5.QtCore import QCoreApplication
 
+import array
 from krita import (
     Krita,
     DockWidget,
     ManagedColor,
     Canvas
 )
-from .lib_zen import mix, relative_color_shift
+from .lib_zen import (
+    mix_lights,
+    shade_ramp,
+    enable_hsluv_lut,
+    hsluv_lut_enabled,
+    ColorIndex
+)
 from .utils import (
+    SETTINGS_GROUP,
     Light, 
-    q_to_managed_color, 
-    managed_to_q_color,
-    get_managed_color_comps,
-    set_managed_color_comps,
-    get_mixed_colors, 
-    get_color_idx
+    cache_path,
+    q_to_managed_color
 )
+from .color import Rgba, ComponentCodec
+from .sync import SyncEngine
+from .value_histogram import ValueHistogram
+from .palette import PaletteHarvester
+from .state_store import StateStore
+from .render_cache import LruCache, quantize, slider_strips, planes
+from .display_transform import display
+from .tracing import traced
 
 class App():
     default_light_color = QColor.fromRgb(230, 205, 167)
@@ -29,62 +43,175 @@ class App():
         notifier = krita_instance.notifier()
         notifier.setActive(True)
 
+        # approximate, the exact conversions are used unless it's turned on
+        use_lut = krita_instance.readSetting(SETTINGS_GROUP, "hsluv_lut", "false")
+        if use_lut == "true" and not hsluv_lut_enabled():
+            enable_hsluv_lut(cache_path("hsluv_lut.bin"))
+
         self.__dock_widget = dock_widget
         self.__krita_instance = krita_instance
+        self.__sync_engine = SyncEngine(krita_instance)
+        self.__value_histogram = ValueHistogram(krita_instance, dock_widget)
+        self.__value_histogram.changed.connect(self.__on_histogram_changed)
+        self.__palette_harvester = PaletteHarvester(krita_instance, dock_widget)
+        self.__palette_harvester.harvested.connect(self.__on_palette_harvested)
+        self.__state_store = StateStore(cache_path("state.bin"))
+        QCoreApplication.instance().aboutToQuit.connect(self.__state_store.flush)
 
         self.__current_color = current_color if current_color is not None else q_to_managed_color(
             self.canvas,
             QColor.fromRgbF(0.0, 0.0, 0.0, 1)
         )
-
-        self.__main_light = Light(
-            q_to_managed_color(self.canvas, self.default_light_color),
-            0.3
-        )
-        self.__ambient_light = Light(
-            q_to_managed_color(self.canvas, self.default_ambient_color),
-            0.2
-        )
-
-        self.__color_to_match: ManagedColor = None
-        self.__saved_colors = []
+        self.__current_rgba = Rgba.from_managed(self.__current_color)
+
+        # key light first, then the ambient light giving the shadow color
+        self.__lights = [
+            Light(Rgba.from_qcolor(self.default_light_color), 0.3),
+            Light(Rgba.from_qcolor(self.default_ambient_color), 0.2, shadow=True),
+        ]
+
+        self.__color_to_match: Rgba = None
+        self.__saved_colors: list[Rgba] = []
+        # kept in the same order as saved_colors
+        self.__saved_index = ColorIndex()
         self.__contrast = 1.0
         self.__value_range = (0.0, 1.0)
+        # value_range follows the document histogram until set by hand
+        self.__auto_value_range = True
+        # current_color_mix and current_shade_ramp are reused until one of
+        # their inputs changes, see color_mix_key
+        self.__color_version = 0
+        self.__lights_version = 0
+        self.__color_mix: tuple[Rgba, ...] = None
+        self.__color_mix_key: tuple = None
+        self.color_mix_hits = 0
+        self.color_mix_misses = 0
+
+        self.__ramp_steps = int(krita_instance.readSetting(SETTINGS_GROUP, "ramp_steps", "7"))
+        self.__shade_ramps = LruCache(max_entries=1024)
+        self.__shade_ramp: list[Rgba] = None
+        self.__shade_ramp_key: tuple = None
 
     @property
     def krita_instance(self):
         return self.__krita_instance
 
-    def current_color(self, comps: bool = False) -> ManagedColor | list[float]:
-        if not comps:
-            return self.__current_color
+    def current_color(self) -> ManagedColor:
+        """
+        Foreground color as last read from Krita. Only needed to create new
+        ManagedColors in the same color space, everything else uses
+        `current_rgba`.
+        """
+        return self.__current_color
 
-        components = [0.0] * 4
-        rgba = get_managed_color_comps(self.__current_color)
-        comps_len = len(rgba)
+    @property
+    def current_rgba(self) -> Rgba:
+        return self.__current_rgba
 
-        if comps_len == len(components):
-            r, g, b, a = rgba
-            components[0] = r
-            components[1] = g
-            components[2] = b
-            components[3] = a
+    def set_current_color(self, color: ManagedColor, rgba: Rgba = None):
+        self.__current_color = color
+        rgba = rgba if rgba is not None else Rgba.from_managed(color)
+        if rgba != self.__current_rgba:
+            self.__current_rgba = rgba
+            self.__color_version += 1
 
-        return components
+    @property
+    def display_sampling(self) -> bool:
+        """Whether `refresh_display_transform` has to be called again."""
+        return display.sampling
+
+    @traced("App.refresh_display_transform")
+    def refresh_display_transform(self) -> bool:
+        """
+        Follows the display transform of the active canvas, see
+        `DisplayTransform`. When it changed, the cached strips and planes
+        are dropped and the next sync renders everything again. Returns
+        whether it changed.
+        """
+        changed = display.update(self.canvas, self.__current_color)
+        if display.sampling:
+            # a new transform is sampled over the next ticks
+            self.__sync_engine.wake()
+        if not changed:
+            return False
+
+        slider_strips.clear()
+        planes.clear()
+        self.__sync_engine.invalidate_view()
+        return True
 
-    def set_current_color(self, color: ManagedColor):
-        self.__current_color = color
+    @property
+    def codec(self) -> ComponentCodec | None:
+        """Codec of the foreground color's color space, see `SyncEngine.codec`."""
+        return self.__sync_engine.codec
+
+    def new_managed_color(self, rgba: Rgba) -> ManagedColor:
+        return rgba.to_managed(self.__current_color, self.codec)
+
+    @property
+    def sync_engine(self) -> SyncEngine:
+        return self.__sync_engine
+
+    @property
+    def value_histogram(self) -> ValueHistogram:
+        return self.__value_histogram
 
     @property
-    def main_light(self) -> Light:
-        return self.__main_light
+    def palette_harvester(self) -> PaletteHarvester:
+        return self.__palette_harvester
 
     @property
-    def ambient_light(self) -> Light:
-        return self.__ambient_light
+    def state_store(self) -> StateStore:
+        return self.__state_store
+
+    @traced("App.restore_state")
+    def restore_state(self):
+        """Loads the lights, saved colors, value range and contrast stored last time."""
+        state = self.__state_store.state
+
+        lights = self.__lights
+        for slot in sorted(state.lights):
+            if slot <= len(lights):
+                lights[slot:slot + 1] = [Light(*state.lights[slot])]
+        if state.light_count is not None:
+            del lights[max(state.light_count, 1):]
+        self.__lights_version += 1
+
+        self.__saved_colors.clear()
+        self.__saved_index.clear()
+        kept = []
+        for color, profile in zip(state.saved_colors, state.saved_profiles):
+            # a duplicate would leave saved_colors out of step with the index
+            _, added = self.__saved_index.insert(color.rgb)
+            if added:
+                self.__saved_colors.append(color)
+                kept.append((color, profile))
+        if len(kept) != len(state.saved_colors):
+            # the store removes by position too, it drops the duplicates as well
+            self.__state_store.clear_saved_colors()
+            for color, profile in kept:
+                self.__state_store.add_saved_color(color, profile)
+
+        if state.contrast is not None:
+            self.__contrast = state.contrast
+        if state.auto_value_range is not None:
+            self.__value_range = state.value_range
+            self.__auto_value_range = state.auto_value_range
+            if self.__auto_value_range:
+                self.apply_histogram_value_range()
+
+    def profile_name(self) -> str:
+        """Model, depth and profile of the foreground color, as stored with colors."""
+        color = self.__current_color
+        return f"{color.colorModel()}/{color.colorDepth()}/{color.colorProfile()}"
 
     @property
-    def saved_colors(self) -> list[QColor]:
+    def lights(self) -> tuple[Light, ...]:
+        """Changed through `add_light`, `remove_light` and `try_update_light`."""
+        return tuple(self.__lights)
+
+    @property
+    def saved_colors(self) -> list[Rgba]:
         return self.__saved_colors
 
     @property
@@ -102,6 +229,7 @@ class App():
     @contrast.setter
     def contrast(self, value: float):
         self.__contrast = value
+        self.__state_store.set_contrast(value)
 
     @property
     def value_range(self) -> tuple[float, float]:
@@ -110,13 +238,48 @@ class App():
     @value_range.setter
     def value_range(self, value: tuple[float, float]):
         self.__value_range = value
+        self.__state_store.set_value_range(value, self.__auto_value_range)
+
+    @property
+    def auto_value_range(self) -> bool:
+        return self.__auto_value_range
+
+    @auto_value_range.setter
+    def auto_value_range(self, value: bool):
+        self.__auto_value_range = value
+        if value:
+            self.apply_histogram_value_range()
+        self.__state_store.set_value_range(self.__value_range, value)
 
     @property
-    def color_to_match(self) -> ManagedColor:
+    def ramp_steps(self) -> int:
+        """Colors in a `shade_ramp`."""
+        return self.__ramp_steps
+
+    @ramp_steps.setter
+    def ramp_steps(self, value: int):
+        self.__ramp_steps = value
+        self.__krita_instance.writeSetting(SETTINGS_GROUP, "ramp_steps", str(value))
+
+    @property
+    def shade_ramps(self) -> LruCache:
+        return self.__shade_ramps
+
+    def apply_histogram_value_range(self):
+        proposed = self.__value_histogram.proposed_range()
+        if proposed is not None:
+            self.__value_range = proposed
+
+    def __on_histogram_changed(self):
+        if self.__auto_value_range:
+            self.apply_histogram_value_range()
+
+    @property
+    def color_to_match(self) -> Rgba:
         return self.__color_to_match
 
     @color_to_match.setter
-    def color_to_match(self, color: ManagedColor):
+    def color_to_match(self, color: Rgba):
         self.__color_to_match = color
 
     def foregroundColor(self) -> ManagedColor:
@@ -126,63 +289,223 @@ class App():
         else:
             raise ValueError('no active canvas.')
 
-    def sync(self):
-        canvas = self.canvas
-        if canvas is None or canvas.view() is None:
-            return
+    @traced("App.sync")
+    def sync(self, size: tuple[int, int] = None) -> bool:
+        polled = self.__sync_engine.poll(self.__lights, size)
+        if polled is None:
+            return False
+
+        color_fg, rgba = polled
+        self.set_current_color(color_fg, rgba)
+        return True
+
+    def light_inputs(self) -> list[tuple[tuple, float, bool]]:
+        """The lights as lib_zen takes them."""
+        return [light.inputs() for light in self.__lights]
+
+    def mix_with_lights(self, colors: list[Rgba]) -> list[list[Rgba]]:
+        """
+        The mix of every color with every light, one row per color, in a
+        single lib_zen call.
+        """
+        packed = array.array("d", [c for color in colors for c in color.rgb])
+        mixed = mix_lights(packed, self.light_inputs())
+
+        count = len(self.__lights)
+        return [
+            [
+                color.with_rgb(mixed[at:at + 3])
+                for at in range(i * count * 3, (i + 1) * count * 3, 3)
+            ]
+            for i, color in enumerate(colors)
+        ]
 
-        active_view = self.krita_instance.activeWindow().activeView()
-        color_fg = active_view.foregroundColor()
-        color_bg = active_view.backgroundColor()
-
-        self.set_current_color(color_fg)
+    @property
+    def color_mix_key(self) -> tuple:
+        """Changes whenever the foreground color or a light changed."""
+        return (
+            self.__color_version,
+            self.__lights_version,
+            *(light.version for light in self.__lights)
+        )
 
     @property
-    def current_color_mix(self) -> tuple[ManagedColor, ManagedColor, ManagedColor]:
-        managed_color = self.current_color()
+    def current_color_mix(self) -> tuple[Rgba, ...]:
+        """
+        The foreground color followed by its mix with each light. Only
+        computed again once `color_mix_key` changed, see `color_mix_stats`.
+        """
+        key = self.color_mix_key
+        if key == self.__color_mix_key:
+            self.color_mix_hits += 1
+            return self.__color_mix
+
+        self.color_mix_misses += 1
+        color = self.__current_rgba
+        self.__color_mix = (color, *self.mix_with_lights([color])[0])
+        self.__color_mix_key = key
+        return self.__color_mix
+
+    def offer_color_mix(
+        self,
+        rgb: tuple[float, float, float],
+        lights: list[tuple[tuple, float, bool]],
+        mixes: list[tuple[float, float, float]]
+    ):
+        """
+        Takes `mixes` of `rgb` with `lights`, computed elsewhere (e.g. by
+        the `FrameWorker`), as `current_color_mix` if they are still the
+        current ones, so they aren't computed again.
+        """
+        key = self.color_mix_key
+        color = self.__current_rgba
+        if key == self.__color_mix_key or rgb != color.rgb or lights != self.light_inputs():
+            return
 
-        illuminated_color = get_mixed_colors(
-            managed_color, 
-            self.__main_light
-        )
-        shadow_color = get_mixed_colors(
-            managed_color, 
-            self.__ambient_light
-        )
-        r, g, b, a = get_managed_color_comps(shadow_color)
-        s_r, s_g, s_b = relative_color_shift((r, g, b), 0.0, 0.2)
-        shadow_color = set_managed_color_comps(shadow_color, [s_r, s_g, s_b, a])
+        self.__color_mix = (color, *(color.with_rgb(mixed) for mixed in mixes))
+        self.__color_mix_key = key
+
+    def color_mix_stats(self) -> dict:
+        lookups = self.color_mix_hits + self.color_mix_misses
 
-        return (managed_color, illuminated_color, shadow_color) 
+        return {
+            "hits": self.color_mix_hits,
+            "misses": self.color_mix_misses,
+            "hit_rate": self.color_mix_hits / lookups if lookups else 0.0,
+        }
 
-    def try_remove_local_color(self, to_remove: ManagedColor):
+    @property
+    def current_shade_ramp(self) -> list[Rgba]:
+        """`shade_ramp` of the foreground color, only looked up again once an input changed."""
+        key = (self.color_mix_key, self.__ramp_steps, self.__contrast)
+        if key != self.__shade_ramp_key:
+            self.__shade_ramp = self.shade_ramp()
+            self.__shade_ramp_key = key
+        return self.__shade_ramp
+
+    def shade_ramp(self, color: Rgba = None) -> list[Rgba]:
+        """
+        `ramp_steps` colors from `color`, the foreground color by default,
+        fully lit by the first lit light, through `color`, to its deepest
+        shadow under the first ambient light. Ramps are cached by quantized
+        color, lights and contrast, so colors seen before cost no lib_zen
+        call.
+        """
+        if color is None:
+            color = self.__current_rgba
+
+        lights = self.__lights
+        key_light = next((light for light in lights if not light.shadow), lights[0])
+        ambient_light = next((light for light in lights if light.shadow), lights[-1])
+
+        key = (
+            quantize(color.rgb),
+            quantize(key_light.color.rgb),
+            key_light.intensity,
+            quantize(ambient_light.color.rgb),
+            ambient_light.intensity,
+            self.__ramp_steps,
+            self.__contrast
+        )
+        ramp = self.__shade_ramps.get(key)
+        if ramp is None:
+            ramp = shade_ramp(
+                color.rgb,
+                (key_light.color.rgb, key_light.intensity),
+                (ambient_light.color.rgb, ambient_light.intensity),
+                self.__ramp_steps,
+                self.__contrast
+            )
+            self.__shade_ramps.put(key, ramp)
+
+        return [color.with_rgb(rgb) for rgb in ramp]
+
+    def harvest_palette(self, count: int, resample: bool = True):
+        """
+        Replaces `saved_colors` with the `count` dominant colors of the
+        active layer or selection, once `palette_harvester` is done.
+        """
+        self.__palette_harvester.harvest(count, resample)
+
+    def __on_palette_harvested(self, colors: list[Rgba]):
+        self.__saved_colors.clear()
+        self.__saved_index.clear()
+        self.__state_store.clear_saved_colors()
+        for color in colors:
+            self.add_saved_color(color)
+
+    def add_saved_color(self, color: Rgba) -> bool:
+        """
+        Saves `color` unless a perceptually identical color (within the
+        index tolerance) is saved already. Returns whether it was added.
+        """
+        _, added = self.__saved_index.insert(color.rgb)
+        if added:
+            self.__saved_colors.append(color)
+            self.__state_store.add_saved_color(color, self.profile_name())
+        return added
+
+    def closest_saved_color(self, color: Rgba = None) -> tuple[int, float] | None:
+        """
+        Position in `saved_colors` of the color closest to `color`, the
+        foreground color by default, and its delta E in CIELUV.
+        """
+        if color is None:
+            color = self.__current_rgba
+        return self.__saved_index.nearest(color.rgb)
+
+    def try_remove_local_color(self, to_remove: Rgba):
         colors = self.__saved_colors
 
-        idx = get_color_idx(to_remove, colors)
-        if idx == -1:
+        # match within the tolerance insert dedups with
+        index = self.__saved_index
+        idx = index.find(to_remove.rgb, index.tolerance)
+        if idx is None:
             raise ValueError("id not found in local_color list")
 
-        if len(colors) > 1:
-            colors[idx], colors[-1] = colors[-1], colors[idx]
+        self.__saved_index.swap_remove(idx)
+        self.__state_store.remove_saved_color(idx)
+        colors[idx], colors[-1] = colors[-1], colors[idx]
         colors.pop()
 
-    def try_set_foreground_color(self, color: ManagedColor) -> ManagedColor:
+    def try_set_foreground_color(self, color: Rgba):
         canvas = self.canvas
         if canvas is not None:
-            canvas.view().setForeGroundColor(color)
+            canvas.view().setForeGroundColor(self.new_managed_color(color))
+            self.__sync_engine.wake()
         else:
             raise ValueError('No active canvas')
 
-    #TODO: refactor to be able to add more light colors?
-    # do i even need more than 3 light sources?
-    def try_update_main_light(self) -> ManagedColor:
-        managed_color = self.foregroundColor()
-        self.__main_light.color = managed_color
-
-        return managed_color
-
-    def try_update_ambient_light(self) -> ManagedColor:
-        managed_color = self.foregroundColor()
-        self.__ambient_light.color = managed_color
-
-        return managed_color
+    def try_update_light(self, idx: int) -> Rgba:
+        """Gives the light at `idx` the foreground color."""
+        color = Rgba.from_managed(self.foregroundColor(), self.codec)
+        self.__lights[idx].color = color
+        self.__store_light(idx)
+
+        return color
+
+    def add_light(self, color: Rgba, intensity: float = 0.2, shadow: bool = False) -> int:
+        """Adds a light, e.g. a rim or bounce light, and returns its index."""
+        self.__lights.append(Light(color, intensity, shadow))
+        self.__lights_version += 1
+        idx = len(self.__lights) - 1
+        self.__store_light(idx)
+        self.__state_store.set_light_count(len(self.__lights))
+
+        return idx
+
+    def remove_light(self, idx: int):
+        """Removes the light at `idx`, the last light is kept."""
+        if len(self.__lights) == 1:
+            raise ValueError("can't remove the last light")
+
+        self.__lights.pop(idx)
+        self.__lights_version += 1
+        # the lights after it moved down a slot
+        for slot in range(idx, len(self.__lights)):
+            self.__store_light(slot)
+        self.__state_store.set_light_count(len(self.__lights))
+
+    def __store_light(self, slot: int):
+        light = self.__lights[slot]
+        self.__state_store.set_light(slot, light.color, light.intensity, light.shadow)
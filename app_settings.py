@@ -1,9 +1,27 @@
 try:
-    from PyQt6.QtWidgets import QDialogButtonBox, QLabel, QVBoxLayout, QHBoxLayout, QSpinBox
+    from PyQt6.QtWidgets import (
+        QDialogButtonBox,
+        QLabel,
+        QVBoxLayout,
+        QHBoxLayout,
+        QSpinBox,
+        QCheckBox,
+        QPushButton,
+        QFileDialog
+    )
     from PyQt6.QtGui import QIntValidator
     from PyQt6.QtCore import Qt
 except:
-    from PyQt5.QtWidgets import QDialogButtonBox, QLabel, QVBoxLayout, QHBoxLayout, QSpinBox
+    from PyQt5.QtWidgets import (
+        QDialogButtonBox,
+        QLabel,
+        QVBoxLayout,
+        QHBoxLayout,
+        QSpinBox,
+        QCheckBox,
+        QPushButton,
+        QFileDialog
+    )
     from PyQt5.QtGui import QIntValidator
     from PyQt5.QtCore import Qt
 import krita
@@ -12,7 +30,8 @@ from .app import App
 from .dialog import Dialog
 from .range_slider import RangeSlider
 from .lib_zen import saturation_shift
-from .utils import copy_managed_color
+from .color import Rgba
+from .tracing import tracer
 
 class AppSettingsUI(object):
     def __init__(self, app: App):
@@ -33,16 +52,49 @@ class AppSettingsUI(object):
     def accept(_):
         pass
 
+    def add_tracing_ui(self):
+        tracing_row = QHBoxLayout()
+        summary = QLabel(tracer.summary_text())
+        summary.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+
+        enabled = QCheckBox(i18n('record trace'))
+        enabled.setChecked(tracer.enabled)
+
+        def toggle(state):
+            tracer.enabled = enabled.isChecked()
+
+        def export():
+            path, _ = QFileDialog.getSaveFileName(
+                self.main_dialog,
+                i18n('export trace'),
+                'zen_picker_trace.json',
+                'Chrome trace (*.json)'
+            )
+            if path:
+                tracer.export_chrome_trace(path)
+
+        export_button = QPushButton(i18n('export trace'))
+        export_button.clicked.connect(export)
+
+        clear_button = QPushButton(i18n('clear'))
+        clear_button.clicked.connect(lambda: (tracer.clear(), summary.setText(tracer.summary_text())))
+
+        enabled.stateChanged.connect(toggle)
+
+        tracing_row.addWidget(enabled)
+        tracing_row.addWidget(export_button)
+        tracing_row.addWidget(clear_button)
+
+        self.vbox.addLayout(tracing_row)
+        self.vbox.addWidget(summary)
+
     def initialize(self):
         self.vbox.addLayout(self.hbox)
         self.hbox.addWidget(QLabel(i18n('image value range:')))
         self.line_edit = QSpinBox()
 
-        left = copy_managed_color(self.app.current_color())
-        left.setComponents([0.0, 0.0, 0.0, 1.0])
-
-        right = copy_managed_color(self.app.current_color())
-        right.setComponents([1.0, 1.0, 1.0, 1.0])
+        left = Rgba(0.0, 0.0, 0.0)
+        right = Rgba(1.0, 1.0, 1.0)
 
         (lower, upper) = self.app.value_range
 
@@ -63,9 +115,23 @@ class AppSettingsUI(object):
         #     upper
         # )
 
+        auto_range = QCheckBox(i18n('from image'))
+        auto_range.setToolTip(i18n('follow the lightness histogram of the active document'))
+        auto_range.setChecked(self.app.auto_value_range)
+
+        def toggle_auto_range(state):
+            self.app.auto_value_range = auto_range.isChecked()
+            value_slider.update_histogram()
+
+        auto_range.stateChanged.connect(toggle_auto_range)
+        value_slider.edited.connect(lambda: auto_range.setChecked(False))
+        self.hbox.addWidget(auto_range)
+
         self.vbox.addWidget(value_slider)
         value_slider.show()
 
+        self.add_tracing_ui()
+
         self.vbox.addWidget(self.button_box)
 
         self.main_dialog.show()
@@ -0,0 +1,230 @@
+"""
+Minimal stand-in for Krita's `krita` module, enough to construct and drive
+ZenDocker outside of Krita. Only used by the benchmarks in this directory.
+"""
+try:
+    from PyQt6.QtGui import QColor, QIcon
+    from PyQt6.QtWidgets import QDockWidget, QMainWindow
+    from PyQt6.QtCore import QByteArray, QRect
+except:
+    from PyQt5.QtGui import QColor, QIcon
+    from PyQt5.QtWidgets import QDockWidget, QMainWindow
+    from PyQt5.QtCore import QByteArray, QRect
+
+DEFAULT_PROFILE = "sRGB-elle-V2-srgbtrc.icc"
+
+class ManagedColor():
+    # instances created and component reads so far, lets benchmarks count
+    # allocations and Krita calls
+    created = 0
+    component_reads = 0
+
+    def __init__(self, model: str, depth: str, profile: str):
+        ManagedColor.created += 1
+        self.__model = model or "RGBA"
+        self.__depth = depth or "U8"
+        self.__profile = profile or DEFAULT_PROFILE
+        # native order, BGRA for integer RGBA like Krita, RGBA for float
+        self.__components = [0.0, 0.0, 0.0, 1.0]
+
+    @staticmethod
+    def fromQColor(qcolor: QColor, canvas=None) -> "ManagedColor":
+        color = ManagedColor("RGBA", "U8", DEFAULT_PROFILE)
+        r, g, b, a = qcolor.getRgbF()
+        color.setComponents([b, g, r, a])
+        return color
+
+    def colorModel(self) -> str:
+        return self.__model
+
+    def colorDepth(self) -> str:
+        return self.__depth
+
+    def colorProfile(self) -> str:
+        return self.__profile
+
+    def components(self) -> list[float]:
+        ManagedColor.component_reads += 1
+        return list(self.__components)
+
+    def componentsOrdered(self) -> list[float]:
+        ManagedColor.component_reads += 1
+        c = self.__components
+        if self.__model == "RGBA" and self.__depth in ("U8", "U16"):
+            return [c[2], c[1], c[0], c[3]]
+        return list(c)
+
+    def setComponents(self, components: list[float]):
+        self.__components = list(components)
+
+    def colorForCanvas(self, canvas) -> QColor:
+        r, g, b, a = self.componentsOrdered()
+        return QColor.fromRgbF(r, g, b, a)
+
+    def copy(self) -> "ManagedColor":
+        color = ManagedColor(self.__model, self.__depth, self.__profile)
+        color.setComponents(self.__components)
+        return color
+
+class View():
+    def __init__(self):
+        self.__foreground = ManagedColor("RGBA", "U8", DEFAULT_PROFILE)
+        self.__background = ManagedColor("RGBA", "U8", DEFAULT_PROFILE)
+        self.__background.setComponents([1.0, 1.0, 1.0, 1.0])
+        self.set_foreground_calls = 0
+
+    def foregroundColor(self) -> ManagedColor:
+        return self.__foreground.copy()
+
+    def backgroundColor(self) -> ManagedColor:
+        return self.__background.copy()
+
+    def setForeGroundColor(self, color: ManagedColor):
+        self.set_foreground_calls += 1
+        self.__foreground = color.copy()
+
+    def canvas(self) -> "Canvas":
+        return Canvas(self)
+
+class Canvas():
+    def __init__(self, view: View):
+        self.__view = view
+
+    def view(self) -> View:
+        return self.__view
+
+class Node():
+    """A single layer covering its whole document."""
+    def __init__(self, document: "Document"):
+        self.__document = document
+
+    def bounds(self) -> QRect:
+        return QRect(0, 0, self.__document.width(), self.__document.height())
+
+    def pixelData(self, x: int, y: int, width: int, height: int) -> QByteArray:
+        return self.__document.pixelData(x, y, width, height)
+
+class Document():
+    """
+    RGBA document whose projection is a fixed pattern, `paint` changes the
+    pixels of a region.
+    """
+    bytes_per_pixel = {"U8": 4, "U16": 8, "F16": 8, "F32": 16}
+
+    def __init__(self, width: int = 1024, height: int = 1024, depth: str = "U8"):
+        self.__width = width
+        self.__height = height
+        self.__depth = depth
+        self.__painted: list[tuple[int, int, int, int, int]] = []
+        self.__node = Node(self)
+        self.pixel_data_calls = 0
+
+    def width(self) -> int:
+        return self.__width
+
+    def height(self) -> int:
+        return self.__height
+
+    def colorModel(self) -> str:
+        return "RGBA"
+
+    def colorDepth(self) -> str:
+        return self.__depth
+
+    def activeNode(self) -> Node:
+        return self.__node
+
+    def selection(self):
+        return None
+
+    def paint(self, x: int, y: int, width: int, height: int, seed: int = 1):
+        self.__painted.append((x, y, width, height, seed))
+
+    def pixelData(self, x: int, y: int, width: int, height: int) -> QByteArray:
+        self.pixel_data_calls += 1
+        seed = 0
+        for px, py, pw, ph, painted_seed in self.__painted:
+            if px < x + width and x < px + pw and py < y + height and y < py + ph:
+                seed += painted_seed
+
+        bpp = self.bytes_per_pixel[self.__depth]
+        size = width * height * bpp
+        # the last byte keeps alpha positive at every depth
+        pixel = bytes((x * 7 + y * 13 + seed * 29 + i * 61) % 256 for i in range(bpp - 1)) + b"\x3f"
+        return QByteArray((pixel * (size // bpp + 1))[:size])
+
+class Window():
+    def __init__(self):
+        self.__view = View()
+        self.__qwindow = None
+
+    def activeView(self) -> View:
+        return self.__view
+
+    def qwindow(self) -> QMainWindow:
+        if self.__qwindow is None:
+            self.__qwindow = QMainWindow()
+        return self.__qwindow
+
+class Notifier():
+    def setActive(self, active: bool):
+        pass
+
+class Krita():
+    __instance = None
+
+    def __init__(self):
+        self.__window = Window()
+        self.__document = Document()
+        self.__notifier = Notifier()
+        self.__settings = {}
+        self.dock_widget_factories = []
+
+    @staticmethod
+    def instance() -> "Krita":
+        if Krita.__instance is None:
+            Krita.__instance = Krita()
+        return Krita.__instance
+
+    def activeWindow(self) -> Window:
+        return self.__window
+
+    def activeDocument(self) -> Document:
+        return self.__document
+
+    def setActiveDocument(self, document: Document):
+        self.__document = document
+
+    def notifier(self) -> Notifier:
+        return self.__notifier
+
+    def icon(self, name: str) -> QIcon:
+        return QIcon()
+
+    def readSetting(self, group: str, name: str, default: str) -> str:
+        return self.__settings.get((group, name), default)
+
+    def writeSetting(self, group: str, name: str, value: str):
+        self.__settings[(group, name)] = value
+
+    def addDockWidgetFactory(self, factory):
+        self.dock_widget_factories.append(factory)
+
+class DockWidget(QDockWidget):
+    def canvas(self) -> Canvas:
+        return Krita.instance().activeWindow().activeView().canvas()
+
+    def canvasChanged(self, canvas):
+        pass
+
+class DockWidgetFactoryBase():
+    DockRight = 1
+
+    class DockPosition():
+        DockRight = 1
+
+class DockWidgetFactory():
+    def __init__(self, id: str, position, widget_class):
+        self.id = id
+        self.position = position
+        self.widget_class = widget_class
@@ -0,0 +1,554 @@
+"""
+Headless zen_picker benchmarks.
+
+Runs the docker against the `krita` stand-in next to this file on an
+offscreen Qt platform. lib_zen has to be built into the plugin directory
+first (`just update` or `just distribute`).
+
+    python bench/run.py                          # print results as json
+    python bench/run.py --output base.json       # store a baseline
+    python bench/run.py --compare base.json      # exit 1 on regressions
+    python bench/run.py --trace trace.json       # also export a chrome trace
+
+Exits 1 when the plugin's share of Krita's startup (importing the plugin and
+creating the hidden docker) goes over `--startup-budget` milliseconds.
+"""
+import argparse
+import array
+import builtins
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+BENCH_DIR = Path(__file__).resolve().parent
+PLUGIN_DIR = BENCH_DIR.parent
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, str(BENCH_DIR))
+
+try:
+    from PyQt6.QtWidgets import QApplication
+    from PyQt6.QtCore import QPoint
+except:
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QPoint
+
+import krita
+
+def load_plugin():
+    """Imports the plugin as the `zen_picker` package, like Krita does."""
+    builtins.i18n = lambda text: text
+    builtins.Application = krita.Krita.instance()
+
+    spec = importlib.util.spec_from_file_location(
+        "zen_picker",
+        PLUGIN_DIR / "__init__.py",
+        submodule_search_locations=[str(PLUGIN_DIR)]
+    )
+    package = importlib.util.module_from_spec(spec)
+    sys.modules["zen_picker"] = package
+    spec.loader.exec_module(package)
+
+    return package
+
+class MouseEvent():
+    def __init__(self, x: int, y: int):
+        self.__pos = QPoint(x, y)
+
+    def pos(self) -> QPoint:
+        return self.__pos
+
+def measure(fn: Callable[[], None], iterations: int, warmup: int = 10) -> dict:
+    for _ in range(warmup):
+        fn()
+
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - start)
+
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "mean_us": statistics.fmean(samples) / 1000,
+        "median_us": samples[len(samples) // 2] / 1000,
+        "p95_us": samples[int(len(samples) * 0.95)] / 1000,
+        "min_us": samples[0] / 1000,
+    }
+
+def count_managed_colors(fn: Callable[[], None], calls: int = 20) -> tuple[float, float]:
+    """
+    Average ManagedColor instances created and component reads per call of
+    `fn`.
+    """
+    created = krita.ManagedColor.created
+    reads = krita.ManagedColor.component_reads
+    for _ in range(calls):
+        fn()
+    return (
+        (krita.ManagedColor.created - created) / calls,
+        (krita.ManagedColor.component_reads - reads) / calls
+    )
+
+def colors(count: int) -> list[list[float]]:
+    """Deterministic spread of BGRA components."""
+    return [
+        [((i * 37) % 255) / 255, ((i * 91) % 255) / 255, ((i * 53) % 255) / 255, 1.0]
+        for i in range(count)
+    ]
+
+def bench_startup(import_ns: int, budget_ms: float) -> dict:
+    """
+    What the plugin adds to Krita's launch: the import (which registers the
+    docker factory) and creating the docker, which Krita does for every
+    window whether the docker is shown or not. Building the UI on first show
+    is reported but not part of the budget.
+    """
+    zen_picker = importlib.import_module("zen_picker.zen_picker")
+
+    start = time.perf_counter_ns()
+    docker = zen_picker.ZenDocker()
+    construct_ns = time.perf_counter_ns() - start
+
+    start = time.perf_counter_ns()
+    docker.resize(320, 480)
+    docker.show()
+    QApplication.processEvents()
+    first_show_ns = time.perf_counter_ns() - start
+    docker.hide()
+
+    startup_ms = (import_ns + construct_ns) / 1e6
+    return {
+        "startup": {
+            "plugin_import_ms": import_ns / 1e6,
+            "docker_construct_ms": construct_ns / 1e6,
+            "first_show_ms": first_show_ns / 1e6,
+            "startup_ms": startup_ms,
+            "budget_ms": budget_ms,
+            "within_budget": startup_ms <= budget_ms,
+            "factories_registered": len(krita.Krita.instance().dock_widget_factories),
+        }
+    }
+
+def bench_docker(package, iterations: int) -> dict:
+    zen_picker = importlib.import_module("zen_picker.zen_picker")
+    render_cache = importlib.import_module("zen_picker.render_cache")
+
+    docker = zen_picker.ZenDocker()
+    docker.resize(320, 480)
+    docker.show()
+    QApplication.processEvents()
+
+    view = krita.Krita.instance().activeWindow().activeView()
+    palette = colors(64)
+    state = {"i": 0}
+
+    def next_color():
+        color = view.foregroundColor()
+        color.setComponents(palette[state["i"] % len(palette)])
+        view.setForeGroundColor(color)
+        state["i"] += 1
+
+    results = {}
+
+    def sync_changed():
+        next_color()
+        docker.Sync()
+    results["sync_tick_changed"] = measure(sync_changed, iterations)
+    # next_color itself creates two and reads none
+    created, reads = count_managed_colors(sync_changed)
+    results["sync_tick_changed"]["managed_colors_per_call"] = created - 2
+    results["sync_tick_changed"]["component_reads_per_call"] = reads
+
+    def sync_frame():
+        # until the worker's frame is shown, not just submitted
+        next_color()
+        docker.Sync()
+        rgb = docker.app.current_rgba.rgb
+        while docker.sliders[0].rgb != rgb:
+            QApplication.processEvents()
+    results["sync_frame_latency"] = measure(sync_frame, iterations)
+    results["sync_frame_latency"]["frame_worker"] = docker.frame_worker.stats()
+
+    docker.Sync()
+    results["sync_tick_unchanged"] = measure(docker.Sync, iterations)
+
+    # memoized until the foreground color or a light changes
+    results["current_color_mix"] = measure(lambda: docker.app.current_color_mix, iterations)
+    results["current_color_mix"]["cache"] = docker.app.color_mix_stats()
+
+    # foreground components to Rgba and back, per color space
+    color = importlib.import_module("zen_picker.color")
+    rgba = color.Rgba(0.8, 0.3, 0.1, 1.0)
+    for model, depth in (("RGBA", "U8"), ("RGBA", "F32"), ("CMYKA", "U8"), ("LABA", "U16")):
+        codec = color.find_codec(model, depth)
+        comps = codec.encode(rgba)
+        results[f"codec_{model}_{depth}"] = {
+            "decode": measure(lambda codec=codec, comps=comps: codec.decode(comps), iterations),
+            "encode": measure(lambda codec=codec: codec.encode(rgba), iterations),
+        }
+
+    slider = docker.sliders[3]
+    docker.Sync()
+
+    def repaint_uncached():
+        render_cache.slider_strips.clear()
+        slider.need_redraw = True
+        slider.repaint()
+    results["slider_repaint_uncached"] = measure(repaint_uncached, iterations)
+
+    def repaint_cached():
+        slider.need_redraw = True
+        slider.repaint()
+    results["slider_repaint_cached"] = measure(repaint_cached, iterations)
+
+    def repaint_all():
+        for s in docker.sliders:
+            s.need_redraw = True
+            s.repaint()
+    results["sliders_repaint_all"] = measure(repaint_all, iterations)
+
+    width = slider.width()
+    y = slider.height() // 2
+
+    def drag():
+        slider.mousePressEvent(MouseEvent(0, y))
+        for x in range(0, width, 4):
+            slider.mouseMoveEvent(MouseEvent(x, y))
+        slider.mouseReleaseEvent(MouseEvent(width - 1, y))
+    calls_before = view.set_foreground_calls
+    results["slider_drag"] = measure(drag, max(iterations // 10, 1), warmup=1)
+    results["slider_drag"]["set_foreground_calls_per_drag"] = (
+        (view.set_foreground_calls - calls_before) / (max(iterations // 10, 1) + 1)
+    )
+    # the view copies every color it is handed
+    created, reads = count_managed_colors(drag, 2)
+    results["slider_drag"]["managed_colors_per_drag"] = (
+        created - results["slider_drag"]["set_foreground_calls_per_drag"]
+    )
+    results["slider_drag"]["component_reads_per_drag"] = reads
+    results["slider_drag"]["throttle"] = slider.drag.throttle.stats()
+
+    results["slider_drag_tablet"] = tablet_drag(slider, view)
+
+    results["sync_engine"] = docker.app.sync_engine.stats()
+    results["slider_strips"] = render_cache.slider_strips.stats()
+    results["shade_ramps"] = docker.app.shade_ramps.stats()
+
+    docker.close()
+    return results
+
+def tablet_drag(slider, view, moves: int = 100, rate_hz: int = 500) -> dict:
+    """
+    Drags across `slider` with moves paced like a `rate_hz` tablet, letting
+    the event loop run in between, and reports foreground updates and input
+    latency.
+    """
+    tracing = importlib.import_module("zen_picker.tracing")
+    tracer = tracing.tracer
+    enabled, latency = tracer.enabled, tracer.input_latency
+    tracer.enabled, tracer.input_latency = True, tracing.LatencyHistogram()
+
+    width = slider.width()
+    y = slider.height() // 2
+    period_ns = 1_000_000_000 // rate_hz
+    calls_before = view.set_foreground_calls
+
+    start = time.perf_counter_ns()
+    slider.mousePressEvent(MouseEvent(0, y))
+    for i in range(1, moves):
+        while time.perf_counter_ns() - start < i * period_ns:
+            QApplication.processEvents()
+        slider.mouseMoveEvent(MouseEvent(i * width // moves, y))
+    slider.mouseReleaseEvent(MouseEvent(width - 1, y))
+
+    result = {
+        "moves": moves + 1,
+        "rate_hz": rate_hz,
+        "set_foreground_calls": view.set_foreground_calls - calls_before,
+        "latency_p50_us": tracer.input_latency.percentile(50) / 1000,
+        "latency_p99_us": tracer.input_latency.percentile(99) / 1000,
+    }
+    tracer.enabled, tracer.input_latency = enabled, latency
+    return result
+
+def bench_histogram(package, size: int) -> dict:
+    """
+    Builds the value histogram of a `size` x `size` 16 bit document tick by
+    tick, then rescans it unchanged and after painting a small region. Each
+    tick blocks the Qt thread for its reads only, `max_tick_ms`, tiles are
+    counted on a worker until the next tick.
+    """
+    value_histogram = importlib.import_module("zen_picker.value_histogram")
+    instance = krita.Krita.instance()
+    previous = instance.activeDocument()
+    document = krita.Document(size, size, "U16")
+    instance.setActiveDocument(document)
+    histogram = value_histogram.ValueHistogram(instance)
+
+    def ticks_until(done: Callable[[], bool]) -> dict:
+        durations = []
+        total_start = time.perf_counter_ns()
+        while not done():
+            start = time.perf_counter_ns()
+            histogram.tick()
+            durations.append(time.perf_counter_ns() - start)
+            # the counted pass is delivered through the event loop
+            while histogram.busy:
+                QApplication.processEvents()
+        return {
+            "ticks": len(durations),
+            "total_ms": (time.perf_counter_ns() - total_start) / 1e6,
+            "qt_thread_ms": sum(durations) / 1e6,
+            "max_tick_ms": max(durations, default=0) / 1e6,
+        }
+
+    results = {}
+    results["histogram_build"] = ticks_until(
+        lambda: histogram.engine is not None and histogram.engine.complete
+    )
+    results["histogram_build"]["size"] = size
+
+    tiles = histogram.engine.tile_count
+    reads = document.pixel_data_calls
+    results["histogram_rescan_unchanged"] = ticks_until(
+        lambda: document.pixel_data_calls - reads >= tiles
+    )
+
+    # found by the round robin rescan, there is no region signal
+    document.paint(size // 3, size // 3, 300, 300)
+    version = histogram.engine.version
+    results["histogram_region_update"] = ticks_until(
+        lambda: histogram.engine.version != version
+    )
+
+    instance.setActiveDocument(previous)
+    return results
+
+def bench_palette(package, size: int) -> dict:
+    """
+    Harvests palettes from a `size` x `size` document: sampling plus
+    clustering, then clustering the kept samples into more colors.
+    """
+    palette = importlib.import_module("zen_picker.palette")
+    instance = krita.Krita.instance()
+    previous = instance.activeDocument()
+    instance.setActiveDocument(krita.Document(size, size, "U8"))
+    harvester = palette.PaletteHarvester(instance)
+
+    def harvest(count: int, resample: bool) -> dict:
+        harvested = []
+        harvester.harvested.connect(harvested.append)
+
+        start = time.perf_counter_ns()
+        harvester.harvest(count, resample)
+        # the Qt thread only blocks for sampling, clustering runs on a worker
+        blocked_ns = time.perf_counter_ns() - start
+        while not harvested:
+            QApplication.processEvents()
+            time.sleep(0.001)
+        total_ns = time.perf_counter_ns() - start
+
+        harvester.harvested.disconnect(harvested.append)
+        return {
+            "colors": len(harvested[0]),
+            "total_ms": total_ns / 1e6,
+            "qt_thread_ms": blocked_ns / 1e6,
+        }
+
+    results = {
+        "palette_harvest": harvest(8, True),
+        "palette_recluster": harvest(16, False),
+    }
+    results["palette_harvest"]["megapixels"] = size * size / 1e6
+    results["palette_harvest"]["samples"] = harvester.sample_count
+
+    instance.setActiveDocument(previous)
+    return results
+
+def bench_lib_zen(package, iterations: int) -> dict:
+    lib_zen = importlib.import_module("zen_picker.lib_zen")
+
+    rgb = (176 / 255, 95 / 255, 110 / 255)
+    other = (73 / 255, 120 / 255, 234 / 255)
+    scanline = bytearray(320 * 4)
+
+    # a large saved color palette, spread over the RGB cube
+    index = lib_zen.ColorIndex()
+    for i in range(20000):
+        index.insert(((i * 0.618034) % 1.0, (i * 0.414214) % 1.0, (i * 0.732051) % 1.0))
+
+    # 100k packed RGB colors for the batch variants, converted in place
+    batch = array.array("d", (((i * 0.618034) % 1.0) for i in range(300_000)))
+    batch_out = array.array("d", bytes(len(batch) * 8))
+    batch_other = array.array("d", other)
+    # the same colors as float32
+    batch_f32 = array.array("f", batch)
+    batch_f32_out = array.array("f", bytes(len(batch) * 4))
+    gradient = array.array("d", bytes(1000 * 3 * 8))
+    # key, ambient, rim and bounce light
+    lights = [
+        ((230 / 255, 205 / 255, 167 / 255), 0.3, False),
+        (other, 0.2, True),
+        ((1.0, 0.6, 0.3), 0.5, False),
+        ((0.4, 0.8, 0.5), 0.15, False),
+    ]
+    lights_out = array.array("d", bytes(len(batch) * len(lights) * 8))
+    plane = bytearray(320 * 160 * 4)
+    # a gamma 2.2 display transform on the default 17^3 grid
+    steps = [(i / 16) ** (1 / 2.2) for i in range(17)]
+    display_lut = lib_zen.DisplayLut(
+        17,
+        array.array("d", (c for r in steps for g in steps for b in steps for c in (r, g, b)))
+    )
+
+    calls = {
+        "to_hsv": lambda: lib_zen.to_hsv(rgb),
+        "to_hsluv": lambda: lib_zen.to_hsluv(rgb),
+        "match_value": lambda: lib_zen.match_value(rgb, other),
+        "mix": lambda: lib_zen.mix(rgb, other, 0.3),
+        "relative_color_shift": lambda: lib_zen.relative_color_shift(rgb, 0.0, 0.2),
+        "shade_ramp_9": lambda: lib_zen.shade_ramp(rgb, lights[0][:2], lights[1][:2], 9, 1.0),
+        "saturation_shift_uv": lambda: lib_zen.saturation_shift_uv(rgb, 0.5),
+        "slider_scanline_320": lambda: lib_zen.slider_scanline(
+            rgb, lib_zen.SliderChannel.Saturation, True, 320, scanline
+        ),
+        "DisplayLut.apply": lambda: display_lut.apply(rgb),
+        "DisplayLut.apply_pixels_320": lambda: display_lut.apply_pixels(scanline),
+        "generate_color_gradient_1k": lambda: lib_zen.generate_color_gradient(rgb, other, 1000),
+        "generate_color_gradient_batch_1k": lambda: lib_zen.generate_color_gradient_batch(
+            rgb, other, 1000, gradient
+        ),
+        "hue_scanline_320": lambda: lib_zen.hue_scanline(lib_zen.PlaneKind.Hsluv, 320, scanline),
+        "ColorIndex.nearest_20k": lambda: index.nearest(rgb),
+        "ColorIndex.insert_20k": lambda: index.insert(other),
+    }
+    batch_calls = {
+        "to_hsluv_batch_100k": lambda: lib_zen.to_hsluv_batch(batch, batch_out),
+        "to_hsluv_batch_100k_1_thread": lambda: lib_zen.to_hsluv_batch(batch, batch_out, 1),
+        "to_hsluv_batch_100k_f32": lambda: lib_zen.to_hsluv_batch(batch_f32, batch_f32_out),
+        "mix_batch_100k": lambda: lib_zen.mix_batch(batch, batch_other, 0.3, batch_out),
+        "mix_lights_100k_x4": lambda: lib_zen.mix_lights(batch, lights, lights_out),
+        "sv_plane_320x160": lambda: lib_zen.sv_plane(0.6, lib_zen.PlaneKind.Hsluv, 320, 160, plane),
+        "sv_plane_320x160_1_thread": lambda: lib_zen.sv_plane(
+            0.6, lib_zen.PlaneKind.Hsluv, 320, 160, plane, 1
+        ),
+        "DisplayLut.apply_pixels_320x160": lambda: display_lut.apply_pixels(plane),
+    }
+
+    return {
+        **{
+            f"lib_zen.{name}": measure(call, iterations * 10)
+            for name, call in calls.items()
+        },
+        **{
+            f"lib_zen.{name}": measure(call, max(iterations // 10, 1), warmup=1)
+            for name, call in batch_calls.items()
+        },
+    }
+
+def measurements(results: dict, prefix: str = "") -> dict[str, dict]:
+    """Every `measure` result in `results`, nested ones named "parent/child"."""
+    found = {}
+    for name, result in results.items():
+        if not isinstance(result, dict):
+            continue
+        if "median_us" in result:
+            found[prefix + name] = result
+        else:
+            found.update(measurements(result, f"{prefix}{name}/"))
+
+    return found
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    base_results = measurements(baseline.get("results", {}))
+
+    for name, result in measurements(results["results"]).items():
+        base = base_results.get(name)
+        if base is None:
+            continue
+
+        ratio = result["median_us"] / base["median_us"] if base["median_us"] else 1.0
+        status = "REGRESSION" if ratio > 1.0 + tolerance else "ok"
+        print(
+            f"{status:>10} {name:<40} {base['median_us']:>10.2f}us "
+            f"-> {result['median_us']:>10.2f}us ({ratio:.2f}x)",
+            file=sys.stderr
+        )
+
+        if status != "ok":
+            regressions.append(name)
+
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--output", type=Path, help="write results to this file")
+    parser.add_argument("--compare", type=Path, help="baseline results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed median slowdown")
+    parser.add_argument("--trace", type=Path, help="record and export a chrome trace")
+    parser.add_argument("--histogram-size", type=int, default=4096, help="document size for the histogram benchmark")
+    parser.add_argument("--palette-size", type=int, default=10000, help="document size for the palette benchmark")
+    parser.add_argument("--startup-budget", type=float, default=50.0, help="allowed plugin import and docker creation time in ms")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    start = time.perf_counter_ns()
+    package = load_plugin()
+    import_ns = time.perf_counter_ns() - start
+
+    tracer = importlib.import_module("zen_picker.tracing").tracer
+    tracer.enabled = args.trace is not None
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "timestamp": time.time(),
+        },
+        "results": {
+            **bench_startup(import_ns, args.startup_budget),
+            **bench_docker(package, args.iterations),
+            **bench_histogram(package, args.histogram_size),
+            **bench_palette(package, args.palette_size),
+            **bench_lib_zen(package, args.iterations),
+        },
+    }
+
+    if args.trace is not None:
+        tracer.export_chrome_trace(str(args.trace))
+        results["tracing"] = tracer.summary()
+
+    text = json.dumps(results, indent=2)
+    if args.output is not None:
+        args.output.write_text(text)
+    else:
+        print(text)
+
+    startup = results["results"]["startup"]
+    if not startup["within_budget"]:
+        print(
+            f"startup {startup['startup_ms']:.1f}ms over the {startup['budget_ms']:.1f}ms budget",
+            file=sys.stderr
+        )
+        return 1
+
+    if args.compare is not None:
+        baseline = json.loads(args.compare.read_text())
+        if compare(results, baseline, args.tolerance):
+            return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
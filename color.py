@@ -0,0 +1,269 @@
+try:
+    from PyQt6.QtGui import QColor
+except:
+    from PyQt5.QtGui import QColor
+
+from abc import ABC, abstractmethod
+from krita import ManagedColor
+
+class Rgba():
+    """
+    Plain RGBA color in [0, 1] used inside the plugin. Treated as immutable,
+    so instances can be shared freely; ManagedColor is only created or read
+    at the Krita boundary (`from_managed`, `to_managed`), through the
+    `ComponentCodec` of its color space.
+    """
+    __slots__ = ("r", "g", "b", "a")
+
+    def __init__(self, r: float, g: float, b: float, a: float = 1.0):
+        self.r = r
+        self.g = g
+        self.b = b
+        self.a = a
+
+    @staticmethod
+    def from_managed(color: ManagedColor, codec: "ComponentCodec" = None) -> "Rgba":
+        """
+        Decodes `color` with `codec`, which has to match its color space.
+        Looked up from the color space when None, hot paths pass the codec
+        they cached.
+        """
+        if codec is None:
+            codec = codec_for(color)
+        return codec.decode(color.componentsOrdered())
+
+    @staticmethod
+    def from_qcolor(color: QColor) -> "Rgba":
+        return Rgba(*color.getRgbF())
+
+    def write_to(self, color: ManagedColor, codec: "ComponentCodec" = None) -> ManagedColor:
+        """Sets the components of `color`, see `from_managed` for `codec`."""
+        if codec is None:
+            codec = codec_for(color)
+        color.setComponents(codec.encode(self))
+        return color
+
+    def to_managed(self, template: ManagedColor, codec: "ComponentCodec" = None) -> ManagedColor:
+        """New ManagedColor in the model, depth and profile of `template`."""
+        color = ManagedColor(
+            template.colorModel(),
+            template.colorDepth(),
+            template.colorProfile()
+        )
+        return self.write_to(color, codec)
+
+    def to_qcolor(self) -> QColor:
+        return QColor.fromRgbF(self.r, self.g, self.b, self.a)
+
+    @property
+    def rgb(self) -> tuple[float, float, float]:
+        return (self.r, self.g, self.b)
+
+    def with_rgb(self, rgb: tuple[float, float, float]) -> "Rgba":
+        return Rgba(rgb[0], rgb[1], rgb[2], self.a)
+
+    def as_list(self) -> list[float]:
+        return [self.r, self.g, self.b, self.a]
+
+    def __iter__(self):
+        yield self.r
+        yield self.g
+        yield self.b
+        yield self.a
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Rgba):
+            return NotImplemented
+        return (
+            self.r == other.r and self.g == other.g
+            and self.b == other.b and self.a == other.a
+        )
+
+    def __hash__(self) -> int:
+        return hash((self.r, self.g, self.b, self.a))
+
+    def __repr__(self) -> str:
+        return f"Rgba({self.r}, {self.g}, {self.b}, {self.a})"
+
+# linear sRGB to CIE XYZ relative to D50 (Bradford adapted), and back
+SRGB_TO_XYZ_D50 = (
+    (0.4360747, 0.3850649, 0.1430804),
+    (0.2225045, 0.7168786, 0.0606169),
+    (0.0139322, 0.0971045, 0.7141733),
+)
+XYZ_D50_TO_SRGB = (
+    (3.1338561, -1.6168667, -0.4906146),
+    (-0.9787684, 1.9161415, 0.0334540),
+    (0.0719453, -0.2289914, 1.4052427),
+)
+D50_WHITE = (0.96422, 1.0, 0.82521)
+# Rec. 709 luma of a gray document
+LUMA = (0.2126, 0.7152, 0.0722)
+
+LAB_EPSILON = (6 / 29) ** 3
+LAB_KAPPA = 3 * (6 / 29) ** 2
+
+def transform(matrix: tuple, v: tuple[float, float, float]) -> tuple[float, float, float]:
+    return (
+        matrix[0][0] * v[0] + matrix[0][1] * v[1] + matrix[0][2] * v[2],
+        matrix[1][0] * v[0] + matrix[1][1] * v[1] + matrix[1][2] * v[2],
+        matrix[2][0] * v[0] + matrix[2][1] * v[1] + matrix[2][2] * v[2],
+    )
+
+def srgb_to_linear(c: float) -> float:
+    if c <= 0.04045:
+        return c / 12.92
+    return ((c + 0.055) / 1.055) ** 2.4
+
+def linear_to_srgb(c: float) -> float:
+    if c <= 0.0031308:
+        return c * 12.92
+    return 1.055 * c ** (1 / 2.4) - 0.055
+
+def xyz_to_rgb(xyz: tuple[float, float, float]) -> tuple[float, float, float]:
+    r, g, b = transform(XYZ_D50_TO_SRGB, xyz)
+    return (
+        linear_to_srgb(min(max(r, 0.0), 1.0)),
+        linear_to_srgb(min(max(g, 0.0), 1.0)),
+        linear_to_srgb(min(max(b, 0.0), 1.0)),
+    )
+
+def rgb_to_xyz(rgb: tuple[float, float, float]) -> tuple[float, float, float]:
+    return transform(
+        SRGB_TO_XYZ_D50,
+        (srgb_to_linear(rgb[0]), srgb_to_linear(rgb[1]), srgb_to_linear(rgb[2]))
+    )
+
+class ComponentCodec(ABC):
+    """
+    Converts the components of one color model and depth to the sRGB-like
+    working space of `Rgba` and back. `decode` takes `componentsOrdered()`,
+    `encode` returns the channel order `setComponents()` takes.
+    """
+    # components including alpha
+    channels = 4
+
+    @abstractmethod
+    def decode(self, comps: list[float]) -> Rgba:
+        pass
+
+    @abstractmethod
+    def encode(self, color: Rgba) -> list[float]:
+        pass
+
+class RgbaCodec(ComponentCodec):
+    """Integer RGB stores BGRA, float RGB stores RGBA."""
+    def __init__(self, bgr: bool):
+        self.bgr = bgr
+
+    def decode(self, comps: list[float]) -> Rgba:
+        return Rgba(comps[0], comps[1], comps[2], comps[3])
+
+    def encode(self, color: Rgba) -> list[float]:
+        if self.bgr:
+            return [color.b, color.g, color.r, color.a]
+        return [color.r, color.g, color.b, color.a]
+
+class GrayCodec(ComponentCodec):
+    channels = 2
+
+    def decode(self, comps: list[float]) -> Rgba:
+        return Rgba(comps[0], comps[0], comps[0], comps[1])
+
+    def encode(self, color: Rgba) -> list[float]:
+        return [LUMA[0] * color.r + LUMA[1] * color.g + LUMA[2] * color.b, color.a]
+
+class CmykCodec(ComponentCodec):
+    """Naive, profile-less CMYK, with full black generation."""
+    channels = 5
+
+    def __init__(self, unit: float):
+        # value of full ink
+        self.unit = unit
+
+    def decode(self, comps: list[float]) -> Rgba:
+        unit = self.unit
+        white = 1.0 - comps[3] / unit
+        return Rgba(
+            (1.0 - comps[0] / unit) * white,
+            (1.0 - comps[1] / unit) * white,
+            (1.0 - comps[2] / unit) * white,
+            comps[4]
+        )
+
+    def encode(self, color: Rgba) -> list[float]:
+        unit = self.unit
+        white = max(color.r, color.g, color.b)
+        if white <= 0.0:
+            return [0.0, 0.0, 0.0, unit, color.a]
+        return [
+            (1.0 - color.r / white) * unit,
+            (1.0 - color.g / white) * unit,
+            (1.0 - color.b / white) * unit,
+            (1.0 - white) * unit,
+            color.a
+        ]
+
+class LabCodec(ComponentCodec):
+    """
+    CIELAB relative to D50, normalized like Krita does at every depth: L
+    from 0 to 100 and a, b from -128 to 127 all map to [0, 1].
+    """
+    def decode(self, comps: list[float]) -> Rgba:
+        fy = (comps[0] * 100.0 + 16.0) / 116.0
+        fx = fy + (comps[1] - 0.5) * 255.0 / 500.0
+        fz = fy - (comps[2] - 0.5) * 255.0 / 200.0
+        xyz = tuple(
+            white * (f ** 3 if f ** 3 > LAB_EPSILON else (f - 4 / 29) * LAB_KAPPA)
+            for white, f in zip(D50_WHITE, (fx, fy, fz))
+        )
+        return Rgba(*xyz_to_rgb(xyz), comps[3])
+
+    def encode(self, color: Rgba) -> list[float]:
+        fx, fy, fz = (
+            t ** (1 / 3) if t > LAB_EPSILON else t / LAB_KAPPA + 4 / 29
+            for t in (c / white for c, white in zip(rgb_to_xyz(color.rgb), D50_WHITE))
+        )
+        return [
+            (116.0 * fy - 16.0) / 100.0,
+            500.0 * (fx - fy) / 255.0 + 0.5,
+            200.0 * (fy - fz) / 255.0 + 0.5,
+            color.a
+        ]
+
+class XyzCodec(ComponentCodec):
+    """CIE XYZ relative to D50."""
+    def decode(self, comps: list[float]) -> Rgba:
+        return Rgba(*xyz_to_rgb((comps[0], comps[1], comps[2])), comps[3])
+
+    def encode(self, color: Rgba) -> list[float]:
+        return [*rgb_to_xyz(color.rgb), color.a]
+
+INTEGER_DEPTHS = ("U8", "U16")
+FLOAT_DEPTHS = ("F16", "F32")
+
+# codec per (colorModel(), colorDepth())
+CODECS: dict[tuple[str, str], ComponentCodec] = {}
+
+def register_codec(model: str, depths: tuple[str, ...], codec: ComponentCodec):
+    for depth in depths:
+        CODECS[(model, depth)] = codec
+
+register_codec("RGBA", INTEGER_DEPTHS, RgbaCodec(bgr=True))
+register_codec("RGBA", FLOAT_DEPTHS, RgbaCodec(bgr=False))
+register_codec("GRAYA", INTEGER_DEPTHS + FLOAT_DEPTHS, GrayCodec())
+register_codec("CMYKA", INTEGER_DEPTHS, CmykCodec(unit=1.0))
+# float CMYK inks go up to 100
+register_codec("CMYKA", FLOAT_DEPTHS, CmykCodec(unit=100.0))
+register_codec("LABA", INTEGER_DEPTHS + FLOAT_DEPTHS, LabCodec())
+register_codec("XYZA", INTEGER_DEPTHS + FLOAT_DEPTHS, XyzCodec())
+
+# unknown color spaces are read like 8 bit RGBA
+DEFAULT_CODEC = CODECS[("RGBA", "U8")]
+
+def find_codec(model: str, depth: str) -> ComponentCodec:
+    return CODECS.get((model, depth), DEFAULT_CODEC)
+
+def codec_for(color: ManagedColor) -> ComponentCodec:
+    """Looks the codec of `color`'s color space up, cache it on hot paths."""
+    return find_codec(color.colorModel(), color.colorDepth())
@@ -5,6 +5,7 @@ try:
         QWidget,
         QScrollArea, 
         QPushButton,
+        QSpinBox,
         QApplication
     )
     from PyQt6.QtGui import QPixmap, QPainter, QColor
@@ -16,24 +17,17 @@ except:
         QWidget,
         QScrollArea, 
         QPushButton,
+        QSpinBox,
         QApplication
     )
     from PyQt5.QtGui import QPixmap, QPainter, QColor
     from PyQt5.QtCore import pyqtSlot, pyqtSignal, Qt
 
-from krita import ManagedColor
-
 from .app import App
-from .lib_zen import mix, relative_color_shift
-from .utils import (
-    q_to_managed_color, 
-    managed_to_q_color, 
-    delete_layout,
-    get_mixed_colors,
-    get_color_idx,
-    get_managed_color_comps,
-    set_managed_color_comps
-)
+from .color import Rgba
+from .display_transform import display
+from .tracing import traced
+from .utils import delete_layout
 
 modes = {
     "add": 1,
@@ -46,6 +40,7 @@ class ColorBtn(QWidget):
     def __init__(self, color: QColor, parent=None):
         super(ColorBtn, self).__init__(parent)
         self.__color = color
+        self.__selected = False
         self.setFixedHeight(20)
 
     @property
@@ -58,14 +53,31 @@ class ColorBtn(QWidget):
         self.__color.setRgbF(r, g, b)
         self.update()
 
+    @property
+    def selected(self) -> bool:
+        return self.__selected
+
+    @selected.setter
+    def selected(self, selected: bool):
+        if selected != self.__selected:
+            self.__selected = selected
+            self.update()
+
     def update_color(self):
         color_sq = QPixmap(self.width(), self.height())
-        color_sq.fill(self.color)
+        # as the canvas shows it
+        color_sq.fill(display.apply_qcolor(self.color))
         image = color_sq.toImage()
 
         painter = QPainter(self)
         painter.drawImage(0, 0, image)
 
+        if self.__selected:
+            # readable on both light and dark colors
+            outline = Qt.GlobalColor.black if self.color.lightnessF() > 0.5 else Qt.GlobalColor.white
+            painter.setPen(outline)
+            painter.drawRect(0, 0, self.width() - 1, self.height() - 1)
+
     def paintEvent(self, event):
         self.update_color()
 
@@ -85,98 +97,128 @@ class ColorManager(QWidget):
 
         self.local_color_col: QVBoxLayout = None
         self.light_color_col: QVBoxLayout = None
-        self.main_light_color_btn: ColorBtn = None
-        self.ambient_light_color_btn: ColorBtn = None
+        self.lights_row: QHBoxLayout = None
+        self.mixes_row: QHBoxLayout = None
+        self.light_btns: list[ColorBtn] = []
+        self.mix_btns: list[ColorBtn] = []
         self.color_lock_btn: QPushButton = None
-
-        self.color_btns = [
-            ColorBtn(QColor.fromRgbF(1.0, 1.0, 1.0), self),
-            ColorBtn(QColor.fromRgbF(1.0, 1.0, 1.0), self),
-            ColorBtn(QColor.fromRgbF(1.0, 1.0, 1.0), self),
-        ]
+        self.add_light_btn: QPushButton = None
+        self.ramp_row: QHBoxLayout = None
+        self.ramp_btns: list[ColorBtn] = []
+        self.ramp_steps_box: QSpinBox = None
+        self.palette_size_box: QSpinBox = None
+        self.saved_colors_row: QHBoxLayout = None
+        self.saved_color_btns: list[ColorBtn] = []
+        # what update_color_row shows, see App.current_color_mix
+        self.shown_color_mix: tuple[Rgba, ...] = None
+        self.shown_ramp: list[Rgba] = None
+
+        self.local_color_btn = ColorBtn(QColor.fromRgbF(1.0, 1.0, 1.0), self)
 
         self.setup_ui()
 
     def setup_ui(self):
+        outer_layout = QVBoxLayout()
+        outer_layout.setAlignment(Qt.AlignTop)
+        self.setLayout(outer_layout)
+
         layout = QHBoxLayout()
         layout.setAlignment(Qt.AlignTop)
-        self.setLayout(layout)
+        outer_layout.addLayout(layout)
 
         self.local_color_col = QVBoxLayout()
         self.light_color_col = QVBoxLayout()
+        self.lights_row = QHBoxLayout()
+        self.mixes_row = QHBoxLayout()
 
-        light_color_top_row = QHBoxLayout()
-
-        self.main_light_color_btn = ColorBtn(
-            managed_to_q_color(self.app.canvas, self.app.main_light.color)
-        )
-        self.main_light_color_btn.clicked.connect(self.slot_update_main_light_color)
-
-        self.ambient_light_color_btn = ColorBtn(
-            managed_to_q_color(self.app.canvas, self.app.ambient_light.color)
-        )
-        self.ambient_light_color_btn.clicked.connect(self.slot_update_ambient_color)
+        local_color_top_row = QHBoxLayout()
 
         self.color_lock_btn = QPushButton()
         self.color_lock_btn.setIcon(self.app.krita_instance.icon("docker_lock_a"))
         self.color_lock_btn.setFixedHeight(20)
         self.color_lock_btn.clicked.connect(self.slot_lock_color)
 
-        layout.addLayout(self.local_color_col)
-        layout.addLayout(self.light_color_col)
+        self.add_light_btn = QPushButton("+")
+        self.add_light_btn.setFixedHeight(20)
+        self.add_light_btn.setToolTip(i18n("add a light with the foreground color"))
+        self.add_light_btn.clicked.connect(self.slot_add_light)
 
-        self.local_color_col.addWidget(self.color_lock_btn)
-        self.light_color_col.addLayout(light_color_top_row)
+        self.local_color_btn.clicked.connect(self.slot_local_color)
 
-        light_color_top_row.addWidget(self.main_light_color_btn)
-        light_color_top_row.addWidget(self.ambient_light_color_btn)
-
-        self.render_row()
+        layout.addLayout(self.local_color_col)
+        layout.addLayout(self.light_color_col)
 
-    @pyqtSlot()
-    def slot_update_main_light_color(self):
-        match QApplication.keyboardModifiers():
-            case Qt.ControlModifier:
-                new_color = self.app.try_update_main_light()
-                self.main_light_color_btn.color = get_managed_color_comps(new_color)
+        self.local_color_col.addLayout(local_color_top_row)
+        self.local_color_col.addWidget(self.local_color_btn)
+        self.light_color_col.addLayout(self.lights_row)
+        self.light_color_col.addLayout(self.mixes_row)
+
+        local_color_top_row.addWidget(self.color_lock_btn)
+        local_color_top_row.addWidget(self.add_light_btn)
+
+        self.render_lights()
+
+        ramp_layout = QHBoxLayout()
+        self.ramp_row = QHBoxLayout()
+        self.ramp_row.setSpacing(1)
+        self.ramp_steps_box = QSpinBox()
+        self.ramp_steps_box.setRange(3, 15)
+        self.ramp_steps_box.setValue(self.app.ramp_steps)
+        self.ramp_steps_box.setToolTip(i18n("shade ramp steps"))
+        self.ramp_steps_box.valueChanged.connect(self.slot_ramp_steps)
+
+        ramp_layout.addLayout(self.ramp_row)
+        ramp_layout.addWidget(self.ramp_steps_box)
+        outer_layout.addLayout(ramp_layout)
+        self.render_ramp()
+
+        palette_row = QHBoxLayout()
+        self.palette_size_box = QSpinBox()
+        self.palette_size_box.setRange(2, 32)
+        self.palette_size_box.setValue(8)
+        self.palette_size_box.setToolTip(i18n("palette size"))
+        # a new size only clusters the samples of the last harvest again
+        self.palette_size_box.valueChanged.connect(
+            lambda count: self.app.harvest_palette(count, resample=False)
+            if self.app.palette_harvester.sample_count else None
+        )
 
-                local_color = q_to_managed_color(self.app.canvas, self.color_btns[0].color)
+        harvest_btn = QPushButton(i18n("harvest palette"))
+        harvest_btn.setToolTip(i18n("replace saved colors with the dominant colors of the active layer or selection"))
+        harvest_btn.clicked.connect(
+            lambda: self.app.harvest_palette(self.palette_size_box.value())
+        )
 
-                new_illuminated = get_mixed_colors(
-                    local_color, 
-                    self.app.main_light,
-                    True,
-                    False
-                )
+        palette_row.addWidget(harvest_btn)
+        palette_row.addWidget(self.palette_size_box)
+        outer_layout.addLayout(palette_row)
 
-                self.color_btns[1].color = new_illuminated
+        self.saved_colors_row = QHBoxLayout()
+        self.saved_colors_row.setSpacing(1)
+        outer_layout.addLayout(self.saved_colors_row)
 
-            case _:
-                self.app.try_set_foreground_color(self.app.main_light.color)
+        self.app.palette_harvester.harvested.connect(self.render_saved_colors)
 
     @pyqtSlot()
-    def slot_update_ambient_color(self):
+    def slot_local_color(self):
+        color = Rgba.from_qcolor(self.local_color_btn.color)
         match QApplication.keyboardModifiers():
             case Qt.ControlModifier:
-                new_color = self.app.try_update_ambient_light()
-                self.ambient_light_color_btn.color = new_color.componentsOrdered()
-
-                local_color = q_to_managed_color(self.app.canvas, self.color_btns[0].color)
-
-                new_shadow = get_mixed_colors(
-                    local_color, 
-                    self.app.main_light,
-                    True,
-                    False
-                )
-
-                r, g, b, a = get_managed_color_comps(local_color)
-                rgb = relative_color_shift((r, g, b), 0.0, 0.2)
+                if self.app.add_saved_color(color):
+                    self.render_saved_colors()
+            case _:
+                self.app.try_set_foreground_color(color)
 
-                self.color_btns[2].color = [*rgb, a]
+    @pyqtSlot()
+    def slot_add_light(self):
+        self.app.add_light(self.app.current_rgba)
+        self.render_lights()
+        self.update_ramp()
 
-            case _:
-                self.app.try_set_foreground_color(self.app.ambient_light.color)
+    @pyqtSlot(int)
+    def slot_ramp_steps(self, steps: int):
+        self.app.ramp_steps = steps
+        self.render_ramp()
 
     @pyqtSlot()
     def slot_lock_color(self):
@@ -186,56 +228,147 @@ class ColorManager(QWidget):
             self.color_lock_btn.setIcon(self.app.krita_instance.icon("docker_lock_b"))
         else:
             self.color_lock_btn.setIcon(self.app.krita_instance.icon("docker_lock_a"))
+            # back to the foreground color, whether it changed or not
+            self.shown_color_mix = None
+            self.shown_ramp = None
+            self.update_color_row()
 
 
+    @traced("ColorManager.update_color_row")
     def update_color_row(self):
+        """
+        Shows the foreground color, its mixes and its shade ramp. Only the
+        swatches whose colors changed since the last call are set again.
+        """
         if self.color_lock:
             return
 
-        managed_colors = self.app.current_color_mix
-        color_btns = self.color_btns
-
-        for i, btn in enumerate(color_btns):
-            btn.color = get_managed_color_comps(managed_colors[i])
-
-    def render_row(self):
-        local_color_row = QHBoxLayout()
-        color_row = QHBoxLayout()
-        light_row = QHBoxLayout()
-
-        local_color_btn, illuminated_color_btn, shadow_color_btn = self.color_btns
-
-        def handle_new_color_click():
-            self.app.try_set_foreground_color(
-                q_to_managed_color(self.app.canvas, local_color_btn.color)
-            )
-
-        def handle_light_color_click():
-            self.app.try_set_foreground_color(
-                q_to_managed_color(self.app.canvas, illuminated_color_btn.color)
-            )
-
-        def handle_shadow_color_click():
-            self.app.try_set_foreground_color(
-                q_to_managed_color(self.app.canvas, shadow_color_btn.color)
-            )
-
-
-        #TODO: mix color light and ambient color by intensity
-        # click handlers should behave differently depending on modes
+        color_mix = self.app.current_color_mix
+        if color_mix is not self.shown_color_mix:
+            self.shown_color_mix = color_mix
+            color, *mixes = color_mix
+            self.local_color_btn.color = color.as_list()
+            for btn, mixed in zip(self.mix_btns, mixes):
+                btn.color = mixed.as_list()
+            self.update_closest_saved_color()
+
+        ramp = self.app.current_shade_ramp
+        if ramp is not self.shown_ramp:
+            self.shown_ramp = ramp
+            for btn, shade in zip(self.ramp_btns, ramp):
+                btn.color = shade.as_list()
+
+    def update_from_app(self):
+        """Shows lights and saved colors that changed outside the docker, e.g. when restored."""
+        self.render_lights()
+        self.render_saved_colors()
+
+    def update_closest_saved_color(self):
+        """Outlines the saved color closest to the foreground color."""
+        closest = self.app.closest_saved_color()
+        idx = closest[0] if closest is not None else -1
+
+        for i, btn in enumerate(self.saved_color_btns):
+            btn.selected = i == idx
+
+    def render_saved_colors(self):
+        """Clicking a saved color picks it, ctrl-clicking removes it."""
+        delete_layout(self.saved_colors_row)
+        self.saved_color_btns = []
+
+        for color in self.app.saved_colors:
+            btn = ColorBtn(color.to_qcolor())
+
+            def handle_click(color=color):
+                match QApplication.keyboardModifiers():
+                    case Qt.ControlModifier:
+                        self.app.try_remove_local_color(color)
+                        self.render_saved_colors()
+                    case _:
+                        self.app.try_set_foreground_color(color)
+
+            btn.clicked.connect(handle_click)
+            self.saved_colors_row.addWidget(btn)
+            self.saved_color_btns.append(btn)
+
+        self.update_closest_saved_color()
+
+    def update_mixes(self):
+        """Mixes the local color with every light, in one lib_zen call."""
+        local_color = Rgba.from_qcolor(self.local_color_btn.color)
+        mixes = self.app.mix_with_lights([local_color])[0]
+
+        for btn, mixed in zip(self.mix_btns, mixes):
+            btn.color = mixed.as_list()
+
+    def render_lights(self):
+        """
+        One button per light, above the mix of the local color with it.
+        Clicking a light picks it, ctrl-clicking gives it the foreground
+        color and shift-clicking removes it. Clicking a mix picks it.
+        """
+        delete_layout(self.lights_row)
+        delete_layout(self.mixes_row)
+        self.light_btns = []
+        self.mix_btns = []
+
+        #TODO: click handlers should behave differently depending on modes
         # edit mode: change light intensity
         # normal mode: use color as foreground color
 
-        local_color_btn.clicked.connect(handle_new_color_click)
-        illuminated_color_btn.clicked.connect(handle_light_color_click)
-        shadow_color_btn.clicked.connect(handle_shadow_color_click)
-
-        self.local_color_col.addLayout(local_color_row)
-        self.light_color_col.addLayout(color_row)
-
-        local_color_row.addWidget(local_color_btn)
-
-        light_row.addWidget(illuminated_color_btn)
-
-        color_row.addLayout(light_row)
-        color_row.addWidget(shadow_color_btn)
+        for idx, light in enumerate(self.app.lights):
+            light_btn = ColorBtn(light.color.to_qcolor())
+            mix_btn = ColorBtn(light.color.to_qcolor())
+
+            def handle_light_click(idx=idx):
+                match QApplication.keyboardModifiers():
+                    case Qt.ControlModifier:
+                        new_color = self.app.try_update_light(idx)
+                        self.light_btns[idx].color = new_color.as_list()
+                        self.update_mixes()
+                        self.update_ramp()
+                    case Qt.ShiftModifier:
+                        if len(self.app.lights) > 1:
+                            self.app.remove_light(idx)
+                            self.render_lights()
+                            self.update_ramp()
+                    case _:
+                        self.app.try_set_foreground_color(self.app.lights[idx].color)
+
+            def handle_mix_click(btn=mix_btn):
+                self.app.try_set_foreground_color(Rgba.from_qcolor(btn.color))
+
+            light_btn.clicked.connect(handle_light_click)
+            mix_btn.clicked.connect(handle_mix_click)
+
+            self.lights_row.addWidget(light_btn)
+            self.mixes_row.addWidget(mix_btn)
+            self.light_btns.append(light_btn)
+            self.mix_btns.append(mix_btn)
+
+        self.update_mixes()
+
+    def update_ramp(self, color: Rgba = None):
+        """Shows the shade ramp of `color`, the local color by default."""
+        if color is None:
+            color = Rgba.from_qcolor(self.local_color_btn.color)
+
+        for btn, shade in zip(self.ramp_btns, self.app.shade_ramp(color)):
+            btn.color = shade.as_list()
+
+    def render_ramp(self):
+        """One swatch per ramp step, lit end first. Clicking one picks it."""
+        delete_layout(self.ramp_row)
+        self.ramp_btns = []
+
+        for _ in range(self.app.ramp_steps):
+            btn = ColorBtn(QColor.fromRgbF(1.0, 1.0, 1.0))
+
+            def handle_click(btn=btn):
+                self.app.try_set_foreground_color(Rgba.from_qcolor(btn.color))
+
+            btn.clicked.connect(handle_click)
+            self.ramp_row.addWidget(btn)
+            self.ramp_btns.append(btn)
+
+        self.update_ramp()
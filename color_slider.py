@@ -8,90 +8,92 @@ https://invent.kde.org/graphics/krita/-/blob/master/plugins/python/mixer_slider_
 
 try:
     from PyQt6.QtWidgets import QWidget, QHBoxLayout
-    from PyQt6.QtGui import QPixmap, QPainter, QColor, QBrush, QPolygon
+    from PyQt6.QtGui import QPixmap, QPainter, QColor, QBrush, QPolygon, QImage
     from PyQt6.QtCore import QPoint, Qt, qDebug
 except:
     from PyQt5.QtWidgets import QWidget, QHBoxLayout
-    from PyQt5.QtGui import QPixmap, QPainter, QColor, QBrush, QPolygon
+    from PyQt5.QtGui import QPixmap, QPainter, QColor, QBrush, QPolygon, QImage
     from PyQt5.QtCore import QPoint, Qt, qDebug
 
-from typing import List, Callable
-from krita import ManagedColor
-from .lib_zen import generate_color_gradient, clamp, match_value
-from .app import App
-from .utils import (
-    UnimplementedError, 
-    copy_managed_color,
-    get_managed_color_comps,
-    set_managed_color_comps
+from typing import List
+from .lib_zen import (
+    SliderChannel,
+    slider_scanline,
+    slider_position,
+    apply_slider_channel
 )
+from .app import App
+from .color import Rgba
+from .utils import ColorDrag
+from .render_cache import cached_strip, has_strip, store_strip, quantize
+from .display_transform import display
+from .tracing import traced
 
 class ColorSlider(QWidget):
-    default_left_color = ManagedColor("", "", "")
-    default_right_color = ManagedColor("", "", "")
-
     def __init__(
         self, app: App, 
-        update_slider_color: Callable[
-            [tuple[float, float, float, float]],
-            tuple[list[float], list[float], float]
-        ],
-        update_krita_color: Callable[
-            [list[float], float],
-            list[float]
-        ],
-        left_color=default_left_color,
-        right_color=default_right_color,
+        channel: SliderChannel,
         luminosity_lock = True,
         parent=None
     ):
         super(ColorSlider, self).__init__()
         self.app = app
-        self.left_color = left_color
-        self.right_color = right_color
+        self.channel = channel
         self.luminosity_lock = luminosity_lock
 
-        self.slider_pixmap = None
         self.value_x: None | int = None
         self.cursor_fill_color = QColor.fromRgbF(1, 1, 1, 1)
         self.cursor_outline_color = QColor.fromRgbF(0, 0, 0, 1)
         self.need_redraw = True
-        self.color_to_match: None | ManagedColor = None
-        self.update_slider_color = update_slider_color
-        self.update_krita_color = update_krita_color 
-        self.rendered_image = None
-        self.slider_pixmap = None
+        self.drag = ColorDrag(app, self.color_at, parent=self)
+        self.rgb: tuple[float, float, float] = (0.0, 0.0, 0.0)
+        self.strip: None | QPixmap = None
+        self.scanline = None
 
         self.setMaximumHeight(30)
         self.setMinimumHeight(20)
 
-    def update_color(self):
-        rgba = self.app.current_color(True)
-        width = self.width()
-        left, right, color_comp = self.update_slider_color((*rgba,))
-
-        self.left_color = set_managed_color_comps(
-            self.left_color,
-            left if not self.luminosity_lock else [*match_value(
-                (*rgba[:3],),
-                (*left[:3],)
-            ), rgba[3]]
-        ) 
-        self.right_color = set_managed_color_comps(
-            self.right_color,
-            right if not self.luminosity_lock else [*match_value(
-                (*rgba[:3],), 
-                (*right[:3],)
-            ), rgba[3]]
-        ) 
-        self.value_x = self.adjust_pos_x(color_comp * width)
+    @traced("ColorSlider.update_color")
+    def update_color(
+        self,
+        rgb: tuple[float, float, float],
+        position: float = None,
+        strip: QImage = None
+    ):
+        """
+        Moves the cursor to `position`, or to where `rgb` sits on this
+        slider's channel when None, and redraws the strip if `rgb` changed.
+        A `strip` already rendered for `rgb` (see `strip_to_render`) is used
+        as is when it still fits the slider.
+        """
+        if position is None:
+            position = slider_position(rgb, self.channel)
 
-        self.need_redraw = True
+        self.value_x = self.adjust_pos_x(position * self.width())
+
+        if rgb != self.rgb:
+            self.rgb = rgb
+            self.need_redraw = True
+
+        if strip is not None and strip.width() == self.width() and strip.height() == self.height():
+            self.strip = store_strip(self.strip_key(rgb), strip)
+            self.need_redraw = False
         self.update()
 
+    def strip_key(self, rgb: tuple[float, float, float]) -> tuple:
+        return (self.channel, self.luminosity_lock, quantize(rgb))
+
+    def strip_to_render(self, rgb: tuple[float, float, float]) -> tuple[int, int] | None:
+        """Size of the strip `rgb` needs, None when it is cached or the slider is hidden."""
+        width, height = self.width(), self.height()
+        if width <= 0 or height <= 0 or has_strip(self.strip_key(rgb), width, height):
+            return None
+        return (width, height)
+
+    @traced("ColorSlider.update_slider")
     def update_slider(self):
         """
-        Update the slider to a gradient between the two colors.
+        Update the slider to the colors picked at every pixel column.
 
         The painting of the slider comes from the program Krita. The original code can be accessed
         at the following URL.
@@ -100,33 +102,18 @@ class ColorSlider(QWidget):
 
         width = self.width()
         height = self.height()
-        if self.need_redraw:
-            patch_count = width
-
-            left_rgba = get_managed_color_comps(self.left_color)
-            right_rgba = get_managed_color_comps(self.right_color)
-
-            self.slider_pixmap = QPixmap(width, height)
-            painter = QPainter(self.slider_pixmap)
-
-            gradient = generate_color_gradient(
-                (left_rgba[0],left_rgba[1],left_rgba[2]),
-                (right_rgba[0],right_rgba[1],right_rgba[2]),
-                patch_count
+        if self.need_redraw and width > 0:
+            self.strip = cached_strip(
+                self.strip_key(self.rgb),
+                width,
+                height,
+                lambda: self.render_scanline(width)
             )
-
-            for i in range(patch_count):
-                r, g, b = gradient[i]
-                cur_color = QColor.fromRgbF(r, g, b)
-                painter.fillRect(i, 0, 1, height, cur_color)
-
-            painter.end()
             self.need_redraw = False
 
         widget_painter = QPainter(self)
-        if self.slider_pixmap is not None:
-            self.rendered_image = self.slider_pixmap.toImage()
-        widget_painter.drawImage(0, 0, self.rendered_image)
+        if self.strip is not None:
+            widget_painter.drawPixmap(0, 0, self.strip)
 
         if self.value_x is not None:
             start_x = int(self.value_x)
@@ -143,6 +130,20 @@ class ColorSlider(QWidget):
             widget_painter.drawPolygon(QPolygon(points))
 
 
+    @traced("lib_zen.slider_scanline")
+    def render_scanline(self, width: int):
+        if self.scanline is None or len(self.scanline) != width * 4:
+            self.scanline = None
+
+        self.scanline = slider_scanline(
+            self.rgb,
+            self.channel,
+            self.luminosity_lock,
+            width,
+            self.scanline
+        )
+        return display.apply_pixels(self.scanline)
+
     def paintEvent(self, event):
         self.update_slider()
 
@@ -159,31 +160,24 @@ class ColorSlider(QWidget):
         return x
 
     def mouseMoveEvent(self, event):
+        if not self.drag.active:
+            return
+
         pos = event.pos()
         self.value_x = self.adjust_pos_x(pos.x())
-        y = int(self.height() / 2)
-        canvas = self.app.canvas
-        view = canvas.view()
-
-        if canvas is not None and view is not None:
-            rgba = get_managed_color_comps(self.app.color_to_match)
-            val = self.value_x / self.width()
-            val = clamp(val, 0.02, 0.98)
-
-            _rgba = self.update_krita_color(rgba, val)
-
-            if self.luminosity_lock:
-                _rgba = match_value((*rgba[:3],), (*_rgba[:3],))
-
-            color = copy_managed_color(self.app.current_color())
-            color = set_managed_color_comps(color, [*_rgba[:3], rgba[3]])
-            view.setForeGroundColor(color)
+        self.drag.move(self.value_x / self.width())
 
         self.update()
 
+    def color_at(self, rgba: Rgba, val: float) -> tuple[float, float, float]:
+        """The color of the slider at `val` for `rgba`."""
+        return apply_slider_channel(rgba.rgb, self.channel, val, self.luminosity_lock)
+
     def mousePressEvent(self, event):
-        self.app.color_to_match = copy_managed_color(self.app.current_color())
+        self.drag.start()
         self.mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event):
-        self.app.color_to_match = None
+        if self.drag.active:
+            self.mouseMoveEvent(event)
+            self.drag.finish()
@@ -0,0 +1,191 @@
+try:
+    from PyQt6.QtGui import QColor
+except:
+    from PyQt5.QtGui import QColor
+
+import array
+from time import perf_counter_ns
+from krita import Canvas, ManagedColor
+
+from .lib_zen import DisplayLut
+from .color import Rgba, ComponentCodec, codec_for
+from .utils import managed_to_q_color
+from .render_cache import LruCache
+from .tracing import traced
+
+# grid points per channel the display transform is sampled at
+LUT_SIZE = 17
+STEPS = tuple(i / (LUT_SIZE - 1) for i in range(LUT_SIZE))
+# transforms moving no color by more than half an 8 bit step are skipped
+IDENTITY_TOLERANCE = 0.5 / 255
+
+# colors compared to notice a canvas showing colors differently, e.g. after
+# its display profile changed
+PROBES = (
+    (1.0, 0.0, 0.0),
+    (0.0, 1.0, 0.0),
+    (0.0, 0.0, 1.0),
+    (0.5, 0.5, 0.5),
+    (0.2, 0.4, 0.8),
+)
+
+class DisplayTransform():
+    """
+    Converts the colors and RGBA8 buffers the plugin paints to what the
+    canvas shows for them, like `managed_to_q_color` does one color at a
+    time (display profile, OCIO, ...).
+
+    The transform of a canvas is sampled once into a lib_zen `DisplayLut`,
+    which then converts whole strips and planes natively. `update` only
+    compares a few `PROBES` to find out whether the transform changed, LUTs
+    are kept per transform, so switching back to a canvas costs no sampling.
+    When the canvas shows the probes as they are, nothing is sampled or
+    converted.
+
+    Sampling a new transform takes thousands of `colorForCanvas` calls on
+    the Qt thread, so every `update` only samples for `budget_ms`, planes
+    of the grid at a time, and the previous LUT stays in use until the new
+    one is complete.
+    """
+    budget_ms = 4
+
+    def __init__(self):
+        self.__key: tuple = None
+        self.__lut: DisplayLut = None
+        self.__luts = LruCache(max_entries=8)
+        self.__generation = 0
+        # canvas, color, codec and the samples so far of the LUT for `__key`
+        self.__pending: tuple = None
+        self.samples = 0
+
+    @property
+    def lut(self) -> DisplayLut | None:
+        """The LUT applied, None when the canvas shows colors unchanged."""
+        return self.__lut
+
+    @property
+    def sampling(self) -> bool:
+        """Whether a new transform is being sampled, `update` continues it."""
+        return self.__pending is not None
+
+    @property
+    def generation(self) -> int:
+        """
+        Bumped every time `lut` changes. Pixels converted by another thread
+        are current if it read the generation before converting them.
+        """
+        return self.__generation
+
+    def update(self, canvas: Canvas, template: ManagedColor) -> bool:
+        """
+        Follows the display transform of `canvas` for colors in the color
+        space of `template`, or continues sampling it. Returns whether the
+        transform changed.
+        """
+        key = None
+        if canvas is not None:
+            codec = codec_for(template)
+            color = ManagedColor(
+                template.colorModel(),
+                template.colorDepth(),
+                template.colorProfile()
+            )
+            key = (
+                template.colorModel(),
+                template.colorDepth(),
+                template.colorProfile(),
+                tuple(self.__to_display(canvas, color, codec, rgb) for rgb in PROBES)
+            )
+
+        if key != self.__key:
+            self.__key = key
+            self.__pending = None
+            if key is None or self.__shows_probes_unchanged(key[3]):
+                return self.__show(None)
+
+            lut = self.__luts.get(key)
+            if lut is not None:
+                return self.__show(lut)
+            self.__pending = (canvas, color, codec, array.array("d"))
+
+        if self.__pending is None:
+            return False
+        lut = self.sample()
+        if lut is None:
+            return False
+        self.__luts.put(key, lut)
+        return self.__show(lut)
+
+    def __show(self, lut: DisplayLut | None) -> bool:
+        if lut is not None and lut.is_identity(IDENTITY_TOLERANCE):
+            lut = None
+
+        changed = lut is not self.__lut
+        self.__lut = lut
+        # after the LUT, so a generation is never paired with an older one
+        if changed:
+            self.__generation += 1
+        return changed
+
+    @staticmethod
+    def __shows_probes_unchanged(probes: tuple) -> bool:
+        return all(
+            abs(shown - c) <= IDENTITY_TOLERANCE
+            for probe, rgb in zip(PROBES, probes)
+            for c, shown in zip(probe, rgb)
+        )
+
+    @staticmethod
+    def __to_display(
+        canvas: Canvas,
+        color: ManagedColor,
+        codec: ComponentCodec,
+        rgb: tuple
+    ) -> tuple:
+        Rgba(*rgb).write_to(color, codec)
+        return managed_to_q_color(canvas, color).getRgbF()[:3]
+
+    @traced("DisplayTransform.sample")
+    def sample(self) -> DisplayLut | None:
+        """
+        Samples the display color of the next planes of the LUT grid being
+        built, in its color's space, for up to `budget_ms`. Returns the LUT
+        once every grid point is sampled, None before.
+        """
+        canvas, color, codec, samples = self.__pending
+        plane = LUT_SIZE * LUT_SIZE * 3
+        start = perf_counter_ns()
+        while len(samples) < LUT_SIZE * plane:
+            r = STEPS[len(samples) // plane]
+            for g in STEPS:
+                for b in STEPS:
+                    samples.extend(self.__to_display(canvas, color, codec, (r, g, b)))
+            if perf_counter_ns() - start >= self.budget_ms * 1_000_000:
+                break
+
+        if len(samples) < LUT_SIZE * plane:
+            return None
+        self.__pending = None
+        self.samples += 1
+        return DisplayLut(LUT_SIZE, samples)
+
+    def apply(self, rgb: tuple[float, float, float]) -> tuple[float, float, float]:
+        lut = self.__lut
+        return rgb if lut is None else lut.apply(rgb)
+
+    def apply_qcolor(self, color: QColor) -> QColor:
+        lut = self.__lut
+        if lut is None:
+            return color
+        r, g, b = lut.apply(color.getRgbF()[:3])
+        return QColor.fromRgbF(r, g, b, color.alphaF())
+
+    def apply_pixels(self, pixels):
+        """Converts RGBA8 `pixels` in place and returns them. Thread safe."""
+        lut = self.__lut
+        if lut is not None:
+            lut.apply_pixels(pixels)
+        return pixels
+
+# shared by every widget and the frame worker
+display = DisplayTransform()
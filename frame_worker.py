@@ -0,0 +1,196 @@
+try:
+    from PyQt6.QtCore import QObject, pyqtSignal
+    from PyQt6.QtGui import QImage
+except:
+    from PyQt5.QtCore import QObject, pyqtSignal
+    from PyQt5.QtGui import QImage
+
+import threading
+
+from .lib_zen import DockerEngine, DockerFrame, SliderChannel, slider_scanline
+from .utils import scanline_image
+from .display_transform import display
+from .tracing import traced
+
+class FrameRequest():
+    __slots__ = ("generation", "rgb", "lights", "strips")
+
+    def __init__(
+        self,
+        generation: int,
+        rgb: tuple[float, float, float],
+        lights: list[tuple[tuple, float, bool]],
+        strips: list[tuple[int, int] | None]
+    ):
+        self.generation = generation
+        self.rgb = rgb
+        # rgb, intensity and shadow flag per light
+        self.lights = lights
+        # (width, height) of the strip to render per slider, None to skip it
+        self.strips = strips
+
+class FrameResult():
+    __slots__ = ("generation", "rgb", "lights", "frame", "strips", "display_generation")
+
+    def __init__(
+        self,
+        generation: int,
+        rgb: tuple,
+        lights: list[tuple[tuple, float, bool]],
+        frame: DockerFrame,
+        strips: list[QImage | None],
+        display_generation: int
+    ):
+        self.generation = generation
+        self.rgb = rgb
+        # the lights the frame's mixes were computed with
+        self.lights = lights
+        self.frame = frame
+        self.strips = strips
+        # `DisplayTransform.generation` the strips were converted in
+        self.display_generation = display_generation
+
+class FrameWorker(QObject):
+    """
+    Computes docker frames off the Qt thread: the slider positions, the mix
+    with every light and the slider strips of a color.
+
+    `submit` only stores the request and returns, a worker thread picks up
+    the latest one, so requests made while it is busy collapse into one.
+    The thread is started by the first `submit` after `stop`. The
+    finished result is the back buffer until it is swapped into the front
+    slot under the lock, then `ready` is emitted on the Qt thread, which
+    takes it with `take`. Results of a color that has been superseded by a
+    newer `submit` are dropped instead of published, or when taken.
+
+    lib_zen releases the GIL while computing and filling scanlines, and
+    QImage scaling runs outside of it too, so the Qt thread keeps running.
+    """
+    ready = pyqtSignal()
+
+    def __init__(self, sliders: list[tuple[SliderChannel, bool]], parent: QObject = None):
+        super(FrameWorker, self).__init__(parent)
+        self.__sliders = sliders
+        self.__engine = DockerEngine(sliders)
+        # worker thread only, reused for every frame
+        self.__scanlines = [None] * len(sliders)
+
+        self.__lock = threading.Lock()
+        self.__wake = threading.Condition(self.__lock)
+        self.__request: FrameRequest = None
+        self.__front: FrameResult = None
+        self.__generation = 0
+        self.__thread: threading.Thread = None
+        self.__stopped = False
+
+        self.submitted = 0
+        self.published = 0
+        self.dropped = 0
+        self.stale_strips = 0
+
+    @property
+    def generation(self) -> int:
+        """Generation of the latest request."""
+        return self.__generation
+
+    def submit(
+        self,
+        rgb: tuple[float, float, float],
+        lights: list[tuple[tuple, float, bool]],
+        strips: list[tuple[int, int] | None]
+    ) -> int:
+        """Queues a frame for `rgb`, replacing any request not started yet."""
+        with self.__lock:
+            self.__generation += 1
+            self.submitted += 1
+            if self.__request is not None:
+                self.dropped += 1
+            self.__request = FrameRequest(self.__generation, rgb, lights, strips)
+
+            if self.__thread is None:
+                self.__stopped = False
+                self.__thread = threading.Thread(target=self.__run, daemon=True)
+                self.__thread.start()
+            self.__wake.notify()
+
+            return self.__generation
+
+    def take(self) -> FrameResult | None:
+        """
+        The latest published frame, once, None when there's nothing current.
+        Strips converted with a display transform that has been replaced
+        since are dropped, the sliders render them again.
+        """
+        with self.__lock:
+            result, self.__front = self.__front, None
+            if result is not None and result.generation != self.__generation:
+                self.dropped += 1
+                return None
+
+        if result is not None and result.display_generation != display.generation:
+            result.strips = [None] * len(result.strips)
+            self.stale_strips += 1
+        return result
+
+    def stop(self):
+        """Ends the worker thread, e.g. while the docker is hidden."""
+        with self.__lock:
+            self.__stopped = True
+            self.__request = None
+            self.__wake.notify()
+            thread, self.__thread = self.__thread, None
+
+        if thread is not None:
+            thread.join()
+
+    def __run(self):
+        while True:
+            with self.__wake:
+                while self.__request is None and not self.__stopped:
+                    self.__wake.wait()
+                if self.__stopped:
+                    return
+                request, self.__request = self.__request, None
+
+            result = self.compute(request)
+
+            with self.__lock:
+                if request.generation != self.__generation:
+                    # a newer color arrived while this one was computed
+                    self.dropped += 1
+                    continue
+                self.__front = result
+                self.published += 1
+
+            self.ready.emit()
+
+    @traced("FrameWorker.compute")
+    def compute(self, request: FrameRequest) -> FrameResult:
+        rgb = request.rgb
+        frame = self.__engine.compute(rgb, request.lights)
+
+        display_generation = display.generation
+        strips = []
+        for i, size in enumerate(request.strips):
+            if size is None:
+                strips.append(None)
+                continue
+
+            width, height = size
+            channel, luminosity_lock = self.__sliders[i]
+            scanline = self.__scanlines[i]
+            if scanline is None or len(scanline) != width * 4:
+                scanline = None
+            scanline = slider_scanline(rgb, channel, luminosity_lock, width, scanline)
+            self.__scanlines[i] = scanline
+            strips.append(scanline_image(display.apply_pixels(scanline), width, height))
+
+        return FrameResult(request.generation, rgb, request.lights, frame, strips, display_generation)
+
+    def stats(self) -> dict:
+        return {
+            "submitted": self.submitted,
+            "published": self.published,
+            "dropped": self.dropped,
+            "stale_strips": self.stale_strips,
+        }
@@ -0,0 +1,154 @@
+try:
+    from PyQt6.QtWidgets import QWidget
+    from PyQt6.QtGui import QPainter, QColor, QBrush, QPolygon, QPixmap
+    from PyQt6.QtCore import QPoint, QRect
+except:
+    from PyQt5.QtWidgets import QWidget
+    from PyQt5.QtGui import QPainter, QColor, QBrush, QPolygon, QPixmap
+    from PyQt5.QtCore import QPoint, QRect
+
+from .lib_zen import PlaneKind, hue_scanline, plane_color, plane_coordinates
+from .app import App
+from .color import Rgba
+from .utils import ColorDrag
+from .render_cache import cached_strip
+from .display_transform import display
+from .sv_plane import MIN_HUE_SATURATION
+from .tracing import traced
+
+class HueStrip(QWidget):
+    """
+    Every hue in the color model of the `SvPlane`, picked by dragging.
+    Changing the hue keeps the saturation and lightness of the color in
+    that model.
+
+    The strip looks the same for every color, so it is rendered once per
+    `width_bucket` wide size and stretched to the exact width. Sync ticks
+    and drags only move the cursor, repainting the area around it.
+    """
+    width_bucket = 64
+
+    def __init__(self, app: App, kind: PlaneKind, parent=None):
+        super(HueStrip, self).__init__(parent)
+        self.app = app
+        self.__kind = kind
+
+        self.hue: None | float = None
+        self.cursor_fill_color = QColor.fromRgbF(1, 1, 1, 1)
+        self.cursor_outline_color = QColor.fromRgbF(0, 0, 0, 1)
+        self.strip: None | QPixmap = None
+        self.scanline = None
+        self.need_redraw = True
+
+        # saturation and lightness kept while dragging
+        self.drag_tone: None | tuple[float, float] = None
+        self.drag = ColorDrag(app, self.color_at, parent=self)
+
+        self.setMaximumHeight(30)
+        self.setMinimumHeight(20)
+
+    @property
+    def kind(self) -> PlaneKind:
+        return self.__kind
+
+    @kind.setter
+    def kind(self, kind: PlaneKind):
+        if kind != self.__kind:
+            self.__kind = kind
+            self.need_redraw = True
+            self.update()
+
+    def update_color(self, rgb: tuple[float, float, float]):
+        """Moves the cursor to the hue of `rgb`, unless it has none."""
+        hue, s, _ = plane_coordinates(rgb, self.__kind)
+        if not self.drag.active and s > MIN_HUE_SATURATION:
+            self.move_cursor(hue)
+
+    def move_cursor(self, hue: float):
+        if hue == self.hue:
+            return
+
+        old = self.cursor_rect()
+        self.hue = hue
+        if self.need_redraw or old is None:
+            self.update()
+        else:
+            self.update(old.united(self.cursor_rect()))
+
+    def cursor_x(self) -> int:
+        return round(self.hue * (self.width() - 1))
+
+    def cursor_rect(self) -> QRect | None:
+        if self.hue is None:
+            return None
+
+        delta = self.height() // 3 + 2
+        return QRect(self.cursor_x() - delta, 0, delta * 2 + 1, self.height())
+
+    @traced("HueStrip.paint")
+    def paintEvent(self, event):
+        width, height = self.width(), self.height()
+        if self.need_redraw and width > 0:
+            bucket = -(-width // self.width_bucket) * self.width_bucket
+            self.strip = cached_strip(
+                ("hue", self.__kind),
+                bucket,
+                height,
+                lambda: self.render_scanline(bucket)
+            )
+            self.need_redraw = False
+
+        painter = QPainter(self)
+        if self.strip is not None:
+            # stretched from the bucket width
+            painter.drawPixmap(self.rect(), self.strip)
+
+        if self.hue is not None:
+            start_x = self.cursor_x()
+            start_y = int(height / 2)
+            delta = int(height / 3)
+            points = [
+                QPoint(start_x, start_y),
+                QPoint(start_x - delta, start_y + delta),
+                QPoint(start_x + delta, start_y + delta),
+            ]
+            painter.setBrush(QBrush(self.cursor_fill_color))
+            painter.setPen(self.cursor_outline_color)
+            painter.drawPolygon(QPolygon(points))
+
+    @traced("lib_zen.hue_scanline")
+    def render_scanline(self, width: int):
+        if self.scanline is None or len(self.scanline) != width * 4:
+            self.scanline = None
+
+        self.scanline = hue_scanline(self.__kind, width, self.scanline)
+        return display.apply_pixels(self.scanline)
+
+    def resizeEvent(self, event):
+        # a size in the same bucket is a cache hit
+        self.need_redraw = True
+
+    def mouseMoveEvent(self, event):
+        if not self.drag.active:
+            return
+
+        hue = min(max(event.pos().x() / max(self.width() - 1, 1), 0.0), 1.0)
+        self.move_cursor(hue)
+        self.drag.move(hue)
+
+    def color_at(self, rgba: Rgba, hue: float) -> tuple[float, float, float]:
+        """`hue` at the saturation and lightness the drag started with."""
+        s, v = self.drag_tone
+        return plane_color(hue, s, v, self.__kind)
+
+    def mousePressEvent(self, event):
+        _, s, v = plane_coordinates(self.app.current_rgba.rgb, self.__kind)
+        self.drag_tone = (s, v)
+        self.drag.start()
+        self.mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if self.drag.active:
+            self.mouseMoveEvent(event)
+            self.drag.finish()
+        self.drag_tone = None
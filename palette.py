@@ -0,0 +1,105 @@
+try:
+    from PyQt6.QtCore import QObject, pyqtSignal
+except:
+    from PyQt5.QtCore import QObject, pyqtSignal
+
+import threading
+from krita import Krita, Document
+
+from .lib_zen import PaletteSampler
+from .color import Rgba
+from .tracing import traced
+
+class PaletteHarvester(QObject):
+    """
+    Extracts the dominant colors of the active layer, or of the selection
+    when there is one.
+
+    Rows are read on a sparse grid through `pixelData`, on the Qt thread
+    since Krita's API has to be used from there, so even 100+ megapixel
+    layers only cost a few hundred small reads. Clustering runs in lib_zen
+    on a worker thread with the GIL released, and `harvested` is delivered
+    back on the Qt thread. The samples are kept, so `harvest` with
+    `resample=False` only clusters again.
+    """
+    harvested = pyqtSignal(list)
+
+    def __init__(self, krita_instance: Krita, parent: QObject = None):
+        super(PaletteHarvester, self).__init__(parent)
+        self.__krita_instance = krita_instance
+        self.__sampler = PaletteSampler()
+        self.__worker: threading.Thread = None
+        # color count asked for while a harvest was running
+        self.__pending_count: int = None
+
+        self.harvested.connect(self.__on_harvested)
+
+    @property
+    def busy(self) -> bool:
+        return self.__worker is not None
+
+    @property
+    def sample_count(self) -> int:
+        return self.__sampler.sample_count
+
+    @traced("PaletteHarvester.sample")
+    def sample(self) -> bool:
+        document: Document = self.__krita_instance.activeDocument()
+        if document is None or document.colorModel() != "RGBA":
+            return False
+
+        node = document.activeNode()
+        selection = document.selection()
+        if selection is not None:
+            x, y = selection.x(), selection.y()
+            width, height = selection.width(), selection.height()
+        else:
+            bounds = node.bounds()
+            x, y = bounds.x(), bounds.y()
+            width, height = bounds.width(), bounds.height()
+
+        if width <= 0 or height <= 0:
+            return False
+
+        stride = PaletteSampler.stride_for(width, height)
+        rows = range(y, y + height, stride)
+        masks = None
+        if selection is not None:
+            masks = [selection.pixelData(x, row, width, 1) for row in rows]
+
+        self.__sampler.sample(
+            [node.pixelData(x, row, width, 1) for row in rows],
+            document.colorDepth(),
+            stride,
+            masks
+        )
+        return self.__sampler.sample_count > 0
+
+    def harvest(self, count: int, resample: bool = True):
+        """
+        Emits `harvested` with up to `count` colors, most common first. While
+        a harvest is running only the latest `count` is remembered and
+        clustered once it is done.
+        """
+        if self.busy:
+            self.__pending_count = count
+            return
+
+        if resample or self.__sampler.sample_count == 0:
+            if not self.sample():
+                return
+
+        self.__worker = threading.Thread(target=self.__extract, args=(count,), daemon=True)
+        self.__worker.start()
+
+    def __extract(self, count: int):
+        swatches = self.__sampler.extract(count)
+        self.harvested.emit([Rgba(*rgb) for rgb, _ in swatches])
+
+    def __on_harvested(self, colors: list[Rgba]):
+        self.__worker = None
+
+        if self.__pending_count is not None:
+            count = self.__pending_count
+            self.__pending_count = None
+            self.harvest(count, resample=False)
@@ -1,31 +1,39 @@
 from typing import Literal
 try:
     from PyQt6.QtWidgets import QWidget
-    from PyQt6.QtGui import QPixmap, QPainter, QColor, QBrush, QPolygon
-    from PyQt6.QtCore import QPoint, Qt 
+    from PyQt6.QtGui import QPixmap, QPainter, QColor, QBrush, QPolygon, QPolygonF
+    from PyQt6.QtCore import QPoint, QPointF, Qt, pyqtSignal
 except:
     from PyQt5.QtWidgets import QWidget
-    from PyQt5.QtGui import QPixmap, QPainter, QColor, QBrush, QPolygon
-    from PyQt5.QtCore import QPoint, Qt
+    from PyQt5.QtGui import QPixmap, QPainter, QColor, QBrush, QPolygon, QPolygonF
+    from PyQt5.QtCore import QPoint, QPointF, Qt, pyqtSignal
 
-from krita import ManagedColor
 from .lib_zen import (
-    generate_color_gradient, 
+    gradient_scanline,
     color_shift, 
     value_shift,
     saturation_shift
 )
 from .app import App
-from .utils import UnimplementedError
+from .color import Rgba
+from .utils import Throttle
+from .render_cache import cached_strip, quantize
+from .display_transform import display
+from .tracing import traced
 
 class RangeSlider(QWidget):
-    default_color = ManagedColor("", "", "")
+    # the user moved one of the limits
+    edited = pyqtSignal()
+
+    default_color = Rgba(0.0, 0.0, 0.0)
+    histogram_fill_color = QColor.fromRgbF(0.5, 0.5, 0.5, 0.6)
+    histogram_outline_color = QColor.fromRgbF(0.2, 0.2, 0.2, 0.8)
 
     def __init__(
         self, app: App, 
         name, 
-        left_color: ManagedColor = default_color,
-        right_color: ManagedColor = default_color, 
+        left_color: Rgba = default_color,
+        right_color: Rgba = default_color, 
         lower_limit = 0, 
         upper_limit = 0, 
         parent = None
@@ -35,21 +43,27 @@ class RangeSlider(QWidget):
         self.name = name
         self.left_color = left_color
         self.right_color = right_color
-        self.slider_pixmap = None
-        self.rendered_image = None
+        self.strip: None | QPixmap = None
+        self.scanline = None
         self.cursor_fill_color = QColor.fromRgbF(1, 1, 1, 1)
         self.cursor_outline_color = QColor.fromRgbF(0, 0, 0, 1)
         self.need_redraw = True
+        self.histogram: list[float] = app.value_histogram.histogram()
+
+        app.value_histogram.changed.connect(self.update_histogram)
 
         self.lower_limit = lower_limit
         self.upper_limit = upper_limit
 
         self.editing: None | Literal['lower'] | Literal['upper'] = None
+        # the limits reach the app, and its store, at most once per frame
+        self.throttle = Throttle(self.apply_range, parent=self)
 
         self.setMaximumHeight(30)
         self.setMinimumHeight(20)
         self.setMaximumWidth(1000)
 
+    @traced("RangeSlider.update_slider")
     def update_slider(self):
         """
         Update the slider to a gradient between the two colors.
@@ -61,34 +75,26 @@ class RangeSlider(QWidget):
 
         width = self.width()
         height = self.height()
-        if self.need_redraw:
-            patch_count = width
-
-            left_rgba = self.left_color.componentsOrdered()
-            right_rgba = self.right_color.componentsOrdered()
-
-            self.slider_pixmap = QPixmap(width, height)
-            painter = QPainter(self.slider_pixmap)
-
-            gradient = generate_color_gradient(
-                (left_rgba[0],left_rgba[1],left_rgba[2]),
-                (right_rgba[0],right_rgba[1],right_rgba[2]),
-                patch_count
+        if self.need_redraw and width > 0:
+            left_rgb = self.left_color.rgb
+            right_rgb = self.right_color.rgb
+
+            self.strip = cached_strip(
+                ("gradient", quantize(left_rgb), quantize(right_rgb)),
+                width,
+                height,
+                lambda: self.render_scanline(left_rgb, right_rgb, width)
             )
-
-            for i in range(patch_count):
-                r, g, b = gradient[i]
-                cur_color = QColor.fromRgbF(r, g, b)
-                painter.fillRect(i, 0, 1, height, cur_color)
-
-            painter.end()
             self.need_redraw = False
 
         widget_painter = QPainter(self)
+        if self.strip is not None:
+            widget_painter.drawPixmap(0, 0, self.strip)
 
-        if self.slider_pixmap is not None:
-            self.rendered_image = self.slider_pixmap.toImage()
-        widget_painter.drawImage(0, 0, self.rendered_image)
+        if self.histogram:
+            widget_painter.setBrush(QBrush(self.histogram_fill_color))
+            widget_painter.setPen(self.histogram_outline_color)
+            widget_painter.drawPolygon(self.histogram_shape(width, height))
 
         if self.lower_limit is not None:
             start_x = int(self.lower_limit)
@@ -118,6 +124,35 @@ class RangeSlider(QWidget):
             widget_painter.setPen(self.cursor_outline_color)
             widget_painter.drawPolygon(QPolygon(points))
 
+    def histogram_shape(self, width: int, height: int) -> QPolygonF:
+        step = width / len(self.histogram)
+        points = [QPointF(0, height)]
+        for i, value in enumerate(self.histogram):
+            y = height * (1.0 - value)
+            points.append(QPointF(i * step, y))
+            points.append(QPointF((i + 1) * step, y))
+        points.append(QPointF(width, height))
+
+        return QPolygonF(points)
+
+    def update_histogram(self):
+        self.histogram = self.app.value_histogram.histogram()
+
+        if self.app.auto_value_range:
+            (lower, upper) = self.app.value_range
+            self.lower_limit = self.width() * lower
+            self.upper_limit = self.width() * upper
+
+        self.update()
+
+    @traced("lib_zen.gradient_scanline")
+    def render_scanline(self, left_rgb, right_rgb, width: int):
+        if self.scanline is None or len(self.scanline) != width * 4:
+            self.scanline = None
+
+        self.scanline = gradient_scanline(left_rgb, right_rgb, width, self.scanline)
+        return display.apply_pixels(self.scanline)
+
     def paintEvent(self, event):
         self.update_slider()
 
@@ -146,6 +181,12 @@ class RangeSlider(QWidget):
 
         return x
 
+    def mousePressEvent(self, event):
+        if self.app.auto_value_range:
+            self.app.auto_value_range = False
+        self.edited.emit()
+        self.mouseMoveEvent(event)
+
     def mouseMoveEvent(self, event):
         pos = event.pos().x()
         width = self.width()
@@ -164,12 +205,13 @@ class RangeSlider(QWidget):
             else:
                 self.upper_limit = self.adjust_pos_x_for(pos, "upper")
 
-        (lower, upper) = self.app.value_range
-        self.app.value_range = (self.lower_limit / width, self.upper_limit / width)
-
+        self.throttle.request(self.lower_limit / width, self.upper_limit / width)
         self.update()
 
+    def apply_range(self, lower: float, upper: float):
+        self.app.value_range = (lower, upper)
+
     def mouseReleaseEvent(self, event):
+        self.throttle.flush()
         self.editing = None
         self.update()
-
@@ -0,0 +1,144 @@
+try:
+    from PyQt6.QtGui import QPixmap, QImage
+except:
+    from PyQt5.QtGui import QPixmap, QImage
+
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from .utils import scanline_image
+
+# colors closer than 1/4096 per channel share a cache entry
+QUANTIZE_STEPS = 4096
+
+def quantize(rgb: tuple[float, float, float], steps: int = QUANTIZE_STEPS) -> tuple[int, int, int]:
+    return (
+        round(rgb[0] * steps),
+        round(rgb[1] * steps),
+        round(rgb[2] * steps),
+    )
+
+class LruCache():
+    """
+    Bounded least recently used cache. Entries are evicted once either
+    `max_entries` or `max_bytes` (the sum of the sizes passed to `put`) is
+    exceeded.
+    """
+    def __init__(self, max_entries: int = 256, max_bytes: int = 16 * 1024 * 1024):
+        self.__entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Membership only, doesn't count as a hit or refresh the entry."""
+        return key in self.__entries
+
+    def get(self, key: Hashable) -> Any:
+        entry = self.__entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.__entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int = 0):
+        old = self.__entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+
+        self.__entries[key] = (value, size)
+        self.bytes += size
+        self.evict()
+
+    def configure(self, max_entries: int = None, max_bytes: int = None):
+        if max_entries is not None:
+            self.max_entries = max_entries
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        self.evict()
+
+    def evict(self):
+        entries = self.__entries
+        while entries and (len(entries) > self.max_entries or self.bytes > self.max_bytes):
+            _, (_, size) = entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        self.__entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+
+        return {
+            "entries": len(self.__entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+# rendered ColorSlider/RangeSlider strips shared by every slider
+slider_strips = LruCache()
+
+def cached_strip(
+    key: Hashable,
+    width: int,
+    height: int,
+    render_scanline: Callable[[], Any]
+) -> QPixmap:
+    """
+    Returns the strip cached under `key`, rendering it from the RGBA8
+    scanline returned by `render_scanline` on a miss.
+    """
+    pixmap = slider_strips.get((key, width, height))
+
+    if pixmap is None:
+        pixmap = store_strip(key, scanline_image(render_scanline(), width, height))
+
+    return pixmap
+
+def has_strip(key: Hashable, width: int, height: int) -> bool:
+    return (key, width, height) in slider_strips
+
+def store_strip(key: Hashable, image: QImage) -> QPixmap:
+    """Caches a strip rendered elsewhere, e.g. on a worker thread."""
+    width, height = image.width(), image.height()
+    pixmap = QPixmap.fromImage(image)
+    slider_strips.put((key, width, height), pixmap, width * height * 4)
+    return pixmap
+
+# rendered SvPlane images, a few hues of the current docker size
+planes = LruCache(max_entries=16, max_bytes=32 * 1024 * 1024)
+
+def cached_plane(
+    key: Hashable,
+    width: int,
+    height: int,
+    render_pixels: Callable[[], Any]
+) -> QPixmap:
+    """
+    Returns the plane cached under `key`, rendering it from the RGBA8
+    pixels returned by `render_pixels` on a miss.
+    """
+    pixmap = planes.get((key, width, height))
+
+    if pixmap is None:
+        image = QImage(render_pixels(), width, height, width * 4, QImage.Format.Format_RGBA8888)
+        # fromImage copies, the pixels can be reused afterwards
+        pixmap = QPixmap.fromImage(image)
+        planes.put((key, width, height), pixmap, width * height * 4)
+
+    return pixmap
@@ -0,0 +1,318 @@
+try:
+    from PyQt6.QtCore import QTimer
+except:
+    from PyQt5.QtCore import QTimer
+
+import os
+import struct
+
+from .color import Rgba
+
+MAGIC = b"ZENS"
+VERSION = 1
+
+HEADER = struct.Struct("<4sB")
+RECORD = struct.Struct("<BH")
+
+# record tags and their payloads
+PROFILE = 1        # id, then the profile name as utf-8
+# 2 held the first light format, it stays reserved so old logs never
+# replay as something else
+SAVED_ADD = 3      # profile id, rgba
+SAVED_REMOVE = 4   # position, removed like list swap_remove
+SAVED_CLEAR = 5
+VALUE_RANGE = 6    # auto flag, lower, upper
+CONTRAST = 7       # contrast
+LIGHT = 8          # slot, flags, 2 unused bytes, rgba, intensity
+LIGHT_COUNT = 9    # light count, slots past it were removed
+
+PROFILE_ID = struct.Struct("<H")
+LIGHT_PAYLOAD = struct.Struct("<BB2x5f")
+LIGHT_COUNT_PAYLOAD = struct.Struct("<B")
+SAVED_ADD_PAYLOAD = struct.Struct("<H4f")
+SAVED_REMOVE_PAYLOAD = struct.Struct("<I")
+VALUE_RANGE_PAYLOAD = struct.Struct("<B2f")
+CONTRAST_PAYLOAD = struct.Struct("<f")
+
+# light flags
+SHADOW_LIGHT = 1
+
+class StoredState():
+    """App state as replayed from the store, None where nothing was stored."""
+    def __init__(self):
+        # color, intensity and shadow flag per slot
+        self.lights: dict[int, tuple[Rgba, float, bool]] = {}
+        self.light_count: int = None
+        self.saved_colors: list[Rgba] = []
+        # profile each saved color was picked in
+        self.saved_profiles: list[str] = []
+        self.value_range: tuple[float, float] = None
+        self.auto_value_range: bool = None
+        self.contrast: float = None
+
+class StateStore():
+    """
+    Versioned, append-only binary log of the App state that outlives Krita:
+    lights, saved colors, value range and contrast.
+
+    Every change appends one small record instead of rewriting everything,
+    and changes are batched into one write per `flush_interval`. Lights, the
+    value range and the contrast only keep their latest pending value, so a
+    drag costs a single record. The color profile names of saved colors
+    are interned, each record refers to an id. Once the log holds `compact_ratio` times more
+    records than the state it describes, it is rewritten as a snapshot.
+
+    The file is only read when `state` is first used. Files of another
+    version are ignored and replaced on the next write, a truncated last
+    record (e.g. after a crash) is dropped. Records of a failed write stay
+    pending and are written again later.
+    """
+    flush_interval = 500
+    max_retry_interval = 60000
+    compact_ratio = 4
+    min_compact_records = 64
+
+    def __init__(self, path: str):
+        self.__path = path
+        self.__state: StoredState = None
+        self.__profiles: dict[str, int] = {}
+        self.__pending: list[tuple[tuple, bytes]] = []
+        # records in the file, and its length up to the last whole record
+        self.__records = 0
+        self.__valid_length = 0
+
+        self.__timer = QTimer()
+        self.__timer.setSingleShot(True)
+        self.__timer.timeout.connect(self.flush)
+        self.__failures = 0
+
+        self.writes = 0
+        self.compactions = 0
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    @property
+    def state(self) -> StoredState:
+        if self.__state is None:
+            self.__state = StoredState()
+            self.__load()
+        return self.__state
+
+    @property
+    def pending(self) -> int:
+        return len(self.__pending)
+
+    def __load(self):
+        try:
+            with open(self.__path, "rb") as file:
+                data = file.read()
+        except OSError:
+            return
+
+        if len(data) < HEADER.size or HEADER.unpack_from(data) != (MAGIC, VERSION):
+            return
+
+        profiles: dict[int, str] = {}
+        offset = HEADER.size
+        while offset + RECORD.size <= len(data):
+            tag, length = RECORD.unpack_from(data, offset)
+            end = offset + RECORD.size + length
+            if end > len(data):
+                break
+
+            self.__replay(tag, data[offset + RECORD.size:end], profiles)
+            self.__records += 1
+            offset = end
+
+        self.__valid_length = offset
+        self.__profiles = {name: id for id, name in profiles.items()}
+
+    def __replay(self, tag: int, payload: bytes, profiles: dict[int, str]):
+        state = self.__state
+
+        if tag == PROFILE:
+            (id,) = PROFILE_ID.unpack_from(payload)
+            profiles[id] = payload[PROFILE_ID.size:].decode("utf-8")
+        elif tag == LIGHT:
+            slot, flags, r, g, b, a, intensity = LIGHT_PAYLOAD.unpack(payload)
+            state.lights[slot] = (Rgba(r, g, b, a), intensity, bool(flags & SHADOW_LIGHT))
+        elif tag == LIGHT_COUNT:
+            (count,) = LIGHT_COUNT_PAYLOAD.unpack(payload)
+            self.__drop_lights(state, count)
+        elif tag == SAVED_ADD:
+            profile, r, g, b, a = SAVED_ADD_PAYLOAD.unpack(payload)
+            state.saved_colors.append(Rgba(r, g, b, a))
+            state.saved_profiles.append(profiles.get(profile, ""))
+        elif tag == SAVED_REMOVE:
+            (position,) = SAVED_REMOVE_PAYLOAD.unpack(payload)
+            for items in (state.saved_colors, state.saved_profiles):
+                if position < len(items):
+                    items[position] = items[-1]
+                    items.pop()
+        elif tag == SAVED_CLEAR:
+            state.saved_colors.clear()
+            state.saved_profiles.clear()
+        elif tag == VALUE_RANGE:
+            auto, lower, upper = VALUE_RANGE_PAYLOAD.unpack(payload)
+            state.auto_value_range = bool(auto)
+            state.value_range = (lower, upper)
+        elif tag == CONTRAST:
+            (state.contrast,) = CONTRAST_PAYLOAD.unpack(payload)
+        # unknown tags come from a newer minor change, skip them
+
+    def __profile_id(self, profile: str) -> int:
+        id = self.__profiles.get(profile)
+        if id is None:
+            id = len(self.__profiles)
+            self.__profiles[profile] = id
+            payload = PROFILE_ID.pack(id) + profile.encode("utf-8")
+            self.__append(None, PROFILE, payload)
+        return id
+
+    def __append(self, key: tuple, tag: int, payload: bytes):
+        """Queues a record, replacing the pending one with the same `key`."""
+        if key is not None:
+            self.__pending = [entry for entry in self.__pending if entry[0] != key]
+        self.__pending.append((key, RECORD.pack(tag, len(payload)) + payload))
+
+        if not self.__timer.isActive():
+            self.__timer.start(self.flush_interval)
+
+    def __drop_lights(self, state: StoredState, count: int):
+        state.light_count = count
+        for slot in [slot for slot in state.lights if slot >= count]:
+            del state.lights[slot]
+
+    def set_light(self, slot: int, color: Rgba, intensity: float, shadow: bool = False):
+        self.state.lights[slot] = (color, intensity, shadow)
+        flags = SHADOW_LIGHT if shadow else 0
+        payload = LIGHT_PAYLOAD.pack(slot, flags, *color, intensity)
+        self.__append((LIGHT, slot), LIGHT, payload)
+
+    def set_light_count(self, count: int):
+        """Drops the lights in slots from `count` on."""
+        self.__drop_lights(self.state, count)
+        self.__append((LIGHT_COUNT,), LIGHT_COUNT, LIGHT_COUNT_PAYLOAD.pack(count))
+
+    def add_saved_color(self, color: Rgba, profile: str = ""):
+        state = self.state
+        state.saved_colors.append(color)
+        state.saved_profiles.append(profile)
+        self.__append(None, SAVED_ADD, SAVED_ADD_PAYLOAD.pack(self.__profile_id(profile), *color))
+
+    def remove_saved_color(self, position: int):
+        """Removes like `list[i], list[-1] = list[-1], list[i]; list.pop()`."""
+        state = self.state
+        for items in (state.saved_colors, state.saved_profiles):
+            items[position] = items[-1]
+            items.pop()
+        self.__append(None, SAVED_REMOVE, SAVED_REMOVE_PAYLOAD.pack(position))
+
+    def clear_saved_colors(self):
+        self.state.saved_colors.clear()
+        self.state.saved_profiles.clear()
+        self.__append(None, SAVED_CLEAR, b"")
+
+    def set_value_range(self, value_range: tuple[float, float], auto: bool):
+        self.state.value_range = value_range
+        self.state.auto_value_range = auto
+        self.__append((VALUE_RANGE,), VALUE_RANGE, VALUE_RANGE_PAYLOAD.pack(auto, *value_range))
+
+    def set_contrast(self, contrast: float):
+        self.state.contrast = contrast
+        self.__append((CONTRAST,), CONTRAST, CONTRAST_PAYLOAD.pack(contrast))
+
+    def live_records(self) -> int:
+        """Records a snapshot of the current state takes."""
+        state = self.state
+        return (
+            len(self.__profiles)
+            + len(state.lights)
+            + (state.light_count is not None)
+            + len(state.saved_colors)
+            + (state.value_range is not None)
+            + (state.contrast is not None)
+        )
+
+    def __retry(self):
+        """Flushes again later, backing off while writes keep failing."""
+        self.__failures += 1
+        interval = self.flush_interval << min(self.__failures, 7)
+        self.__timer.start(min(interval, self.max_retry_interval))
+
+    def flush(self) -> bool:
+        """Writes the pending records, or a snapshot when the log grew too long."""
+        self.__timer.stop()
+        if not self.__pending:
+            return True
+
+        records = self.__records + len(self.__pending)
+        if self.__valid_length == 0 or records > max(
+            self.min_compact_records,
+            self.compact_ratio * self.live_records()
+        ):
+            return self.compact()
+
+        try:
+            with open(self.__path, "r+b") as file:
+                # drops a torn record left by an interrupted write
+                file.truncate(self.__valid_length)
+                file.seek(self.__valid_length)
+                for _, record in self.__pending:
+                    file.write(record)
+                self.__valid_length = file.tell()
+        except OSError:
+            # the file is in an unknown state, rewrite it next time
+            self.__valid_length = 0
+            self.__retry()
+            return False
+
+        self.__records = records
+        self.__pending.clear()
+        self.__failures = 0
+        self.writes += 1
+        return True
+
+    def compact(self) -> bool:
+        """Rewrites the file as a snapshot of the current state."""
+        self.__timer.stop()
+        state = self.state
+
+        # only the profiles still in use, renumbered
+        self.__profiles = {}
+        self.__pending = []
+        for slot, (color, intensity, shadow) in state.lights.items():
+            self.set_light(slot, color, intensity, shadow)
+        if state.light_count is not None:
+            self.set_light_count(state.light_count)
+        for color, profile in zip(state.saved_colors, state.saved_profiles):
+            payload = SAVED_ADD_PAYLOAD.pack(self.__profile_id(profile), *color)
+            self.__append(None, SAVED_ADD, payload)
+        if state.value_range is not None:
+            self.set_value_range(state.value_range, bool(state.auto_value_range))
+        if state.contrast is not None:
+            self.set_contrast(state.contrast)
+        self.__timer.stop()
+
+        data = HEADER.pack(MAGIC, VERSION) + b"".join(record for _, record in self.__pending)
+        temp_path = self.__path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.__path), exist_ok=True)
+            with open(temp_path, "wb") as file:
+                file.write(data)
+            os.replace(temp_path, self.__path)
+        except OSError:
+            # the snapshot is built again on the next flush
+            self.__valid_length = 0
+            self.__retry()
+            return False
+
+        self.__records = len(self.__pending)
+        self.__valid_length = len(data)
+        self.__pending.clear()
+        self.__failures = 0
+        self.writes += 1
+        self.compactions += 1
+        return True
@@ -0,0 +1,167 @@
+try:
+    from PyQt6.QtWidgets import QWidget
+    from PyQt6.QtGui import QPainter, QColor, QPixmap
+    from PyQt6.QtCore import QPoint, QRect, Qt, pyqtSignal
+except:
+    from PyQt5.QtWidgets import QWidget
+    from PyQt5.QtGui import QPainter, QColor, QPixmap
+    from PyQt5.QtCore import QPoint, QRect, Qt, pyqtSignal
+
+from .lib_zen import PlaneKind, plane_color, plane_coordinates, sv_plane
+from .app import App
+from .color import Rgba
+from .utils import SETTINGS_GROUP, ColorDrag
+from .render_cache import cached_plane, QUANTIZE_STEPS
+from .display_transform import display
+from .tracing import traced
+
+# below this saturation the hue of a color is noise, the plane keeps its own
+MIN_HUE_SATURATION = 0.001
+
+class SvPlane(QWidget):
+    """
+    Saturation (to the right) and lightness (to the top) of the current hue,
+    in HSLuv or HSV, picked with one drag.
+
+    The plane is filled by one lib_zen call and cached per hue and size, so
+    dragging and syncing only move the crosshair, and only the area around
+    it is repainted. Right-click switches between HSLuv and HSV.
+    """
+    crosshair_radius = 5
+    kind_changed = pyqtSignal(object)
+
+    def __init__(self, app: App, parent=None):
+        super(SvPlane, self).__init__(parent)
+        self.app = app
+
+        mode = app.krita_instance.readSetting(SETTINGS_GROUP, "sv_plane_mode", "hsluv")
+        self.__kind = PlaneKind.Hsv if mode == "hsv" else PlaneKind.Hsluv
+        self.hue = 0.0
+        # saturation and lightness of the crosshair
+        self.position: tuple[float, float] = None
+        self.plane: None | QPixmap = None
+        self.pixels = None
+        self.need_redraw = True
+        self.drag = ColorDrag(app, self.color_at, parent=self)
+
+        self.setMinimumHeight(80)
+        self.setMaximumHeight(160)
+
+    @property
+    def kind(self) -> PlaneKind:
+        return self.__kind
+
+    @kind.setter
+    def kind(self, kind: PlaneKind):
+        self.__kind = kind
+        mode = "hsv" if kind == PlaneKind.Hsv else "hsluv"
+        self.app.krita_instance.writeSetting(SETTINGS_GROUP, "sv_plane_mode", mode)
+        self.need_redraw = True
+        self.update()
+        self.kind_changed.emit(kind)
+
+    def update_color(self, rgb: tuple[float, float, float]):
+        """Moves the crosshair to `rgb`, and switches planes if its hue changed."""
+        hue, s, v = plane_coordinates(rgb, self.__kind)
+
+        # colors picked on the plane come back with their hue rounded, the
+        # plane being dragged keeps the hue it was grabbed at
+        if not self.drag.active and s > MIN_HUE_SATURATION and hue != self.hue:
+            self.hue = hue
+            self.need_redraw = True
+            self.update()
+        self.move_crosshair((s, v))
+
+    def move_crosshair(self, position: tuple[float, float]):
+        """Repaints only the areas under the old and the new crosshair."""
+        if position == self.position:
+            return
+
+        old = self.crosshair_rect()
+        self.position = position
+        if self.need_redraw or old is None:
+            self.update()
+        else:
+            self.update(old.united(self.crosshair_rect()))
+
+    def crosshair_point(self) -> QPoint:
+        s, v = self.position
+        return QPoint(round(s * (self.width() - 1)), round((1.0 - v) * (self.height() - 1)))
+
+    def crosshair_rect(self) -> QRect | None:
+        if self.position is None:
+            return None
+
+        r = self.crosshair_radius + 2
+        return QRect(self.crosshair_point() - QPoint(r, r), self.crosshair_point() + QPoint(r, r))
+
+    def plane_key(self) -> tuple:
+        return (self.__kind, round(self.hue * QUANTIZE_STEPS))
+
+    @traced("SvPlane.paint")
+    def paintEvent(self, event):
+        width, height = self.width(), self.height()
+        if self.need_redraw and width > 0 and height > 0:
+            self.plane = cached_plane(
+                self.plane_key(),
+                width,
+                height,
+                lambda: self.render_pixels(width, height)
+            )
+            self.need_redraw = False
+
+        painter = QPainter(self)
+        if self.plane is not None:
+            painter.drawPixmap(0, 0, self.plane)
+
+        if self.position is not None:
+            # readable on both light and dark colors
+            _, v = self.position
+            painter.setPen(QColor.fromRgbF(0, 0, 0, 1) if v > 0.5 else QColor.fromRgbF(1, 1, 1, 1))
+            painter.setBrush(Qt.BrushStyle.NoBrush)
+            r = self.crosshair_radius
+            painter.drawEllipse(self.crosshair_point(), r, r)
+
+    @traced("lib_zen.sv_plane")
+    def render_pixels(self, width: int, height: int):
+        if self.pixels is None or len(self.pixels) != width * height * 4:
+            self.pixels = None
+
+        self.pixels = sv_plane(self.hue, self.__kind, width, height, self.pixels)
+        return display.apply_pixels(self.pixels)
+
+    def resizeEvent(self, event):
+        self.need_redraw = True
+
+    def position_at(self, x: int, y: int) -> tuple[float, float]:
+        width, height = max(self.width() - 1, 1), max(self.height() - 1, 1)
+        s = min(max(x / width, 0.0), 1.0)
+        v = min(max(1.0 - y / height, 0.0), 1.0)
+        return (s, v)
+
+    def mouseMoveEvent(self, event):
+        if not self.drag.active:
+            return
+
+        pos = event.pos()
+        position = self.position_at(pos.x(), pos.y())
+        self.move_crosshair(position)
+        self.drag.move(*position)
+
+    def color_at(self, rgba: Rgba, s: float, v: float) -> tuple[float, float, float]:
+        """The plane color at (`s`, `v`)."""
+        return plane_color(self.hue, s, v, self.__kind)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.MouseButton.RightButton:
+            self.kind = PlaneKind.Hsv if self.__kind == PlaneKind.Hsluv else PlaneKind.Hsluv
+            self.update_color(self.app.current_rgba.rgb)
+            return
+
+        self.drag.start()
+        self.mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if self.drag.active:
+            self.mouseMoveEvent(event)
+            self.drag.finish()
@@ -0,0 +1,129 @@
+try:
+    from PyQt6.QtCore import QTimer
+except:
+    from PyQt5.QtCore import QTimer
+
+from krita import Krita, View, ManagedColor
+
+from .color import Rgba, ComponentCodec, find_codec
+
+class SyncEngine():
+    """
+    Decides whether a ZenDocker.Sync tick has any work to do.
+
+    The active view handle is cached until the canvas changes, the
+    `ComponentCodec` of its foreground color until its color model or depth
+    does (e.g. the image was converted). A tick is only processed when the
+    foreground color, the lights or the docker size differ from the
+    previous tick. While idle the timer interval backs off
+    until `max_interval`; any interaction snaps it back to `min_interval`.
+    """
+    min_interval = 30
+    max_interval = 240
+    idle_ticks_before_backoff = 10
+
+    def __init__(self, krita_instance: Krita):
+        self.__krita_instance = krita_instance
+        self.__view: View = None
+        self.__codec: ComponentCodec = None
+        # (colorModel(), colorDepth()) `codec` was looked up for
+        self.__codec_key: tuple[str, str] = None
+        self.__last_state = None
+        # the docker's sync timer, restarted by `wake`
+        self.timer: QTimer = None
+
+        self.interval = self.min_interval
+        self.idle_ticks = 0
+        self.ticks_processed = 0
+        self.ticks_skipped = 0
+
+    @property
+    def view(self) -> View:
+        if self.__view is None:
+            window = self.__krita_instance.activeWindow()
+            if window is not None:
+                self.__view = window.activeView()
+
+        return self.__view
+
+    @property
+    def codec(self) -> ComponentCodec | None:
+        """Codec of the foreground color, None until the first poll."""
+        return self.__codec
+
+    def invalidate_view(self):
+        self.__view = None
+        self.__codec = None
+        self.__codec_key = None
+        self.__last_state = None
+
+    def wake(self):
+        """Back to `min_interval`, a backed off timer is restarted right away."""
+        self.idle_ticks = 0
+        self.interval = self.min_interval
+
+        timer = self.timer
+        if timer is not None and timer.isActive() and timer.interval() != self.interval:
+            timer.start(self.interval)
+
+    def poll(self, lights, size) -> tuple[ManagedColor, Rgba] | None:
+        """
+        Returns the foreground color of the active view, and its components
+        read once as Rgba, if anything changed since the last processed
+        tick, otherwise None.
+        """
+        view = self.view
+        if view is None:
+            self.skip()
+            return None
+
+        try:
+            color_fg = view.foregroundColor()
+        except RuntimeError:
+            color_fg = None
+        if color_fg is None:
+            # the cached view was closed or is closing, fetch the new one
+            # next tick
+            self.invalidate_view()
+            self.skip()
+            return None
+
+        # two short strings, cheaper than decoding with the wrong codec
+        key = (color_fg.colorModel(), color_fg.colorDepth())
+        if key != self.__codec_key:
+            self.__codec = find_codec(*key)
+            self.__codec_key = key
+        rgba = self.__codec.decode(color_fg.componentsOrdered())
+        state = (
+            rgba,
+            tuple((light.color, light.intensity, light.shadow) for light in lights),
+            size
+        )
+
+        if state == self.__last_state:
+            self.skip()
+            return None
+
+        self.__last_state = state
+        self.ticks_processed += 1
+        self.wake()
+
+        return color_fg, rgba
+
+    def skip(self):
+        self.ticks_skipped += 1
+        self.idle_ticks += 1
+
+        if self.idle_ticks >= self.idle_ticks_before_backoff:
+            self.idle_ticks = 0
+            self.interval = min(self.interval * 2, self.max_interval)
+
+    def stats(self) -> dict:
+        total = self.ticks_processed + self.ticks_skipped
+
+        return {
+            "processed": self.ticks_processed,
+            "skipped": self.ticks_skipped,
+            "skip_ratio": self.ticks_skipped / total if total else 0.0,
+            "interval": self.interval,
+        }
@@ -0,0 +1,89 @@
+"""
+Loads the plugin modules under test as the `zen_picker` package, without
+Krita and, when PyQt can't be imported, without Qt.
+
+The `krita` module is the stand-in of the benchmarks. Without PyQt, the
+Qt classes imported by the plugin are replaced by inert placeholders, with
+a `QTimer` that only keeps its state, which is all the tested modules use
+outside of painting. `__init__.py` is not run, it registers the docker with
+Krita; lib_zen is not needed by the modules tested here.
+"""
+import importlib
+import sys
+import types
+from pathlib import Path
+
+PLUGIN_DIR = Path(__file__).resolve().parent.parent
+
+class Signal():
+    def __init__(self):
+        self.slots = []
+
+    def connect(self, slot):
+        self.slots.append(slot)
+
+    def emit(self, *args):
+        for slot in self.slots:
+            slot(*args)
+
+class QTimer():
+    """Keeps the state of a timer, `timeout` is only emitted by the tests."""
+    def __init__(self, parent=None):
+        self.timeout = Signal()
+        self.__active = False
+        self.__interval = 0
+        self.__single_shot = False
+
+    def setSingleShot(self, single_shot: bool):
+        self.__single_shot = single_shot
+
+    def isSingleShot(self) -> bool:
+        return self.__single_shot
+
+    def start(self, interval: int = None):
+        if interval is not None:
+            self.__interval = interval
+        self.__active = True
+
+    def stop(self):
+        self.__active = False
+
+    def isActive(self) -> bool:
+        return self.__active
+
+    def interval(self) -> int:
+        return self.__interval
+
+    def setInterval(self, interval: int):
+        self.__interval = interval
+
+def stand_in_module(name: str, **classes) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(classes)
+    # any other class is a placeholder, enough to import and subclass it
+    module.__getattr__ = lambda attribute: type(attribute, (), {})
+    return module
+
+def install_qt_stand_ins():
+    for name in ("PyQt6", "PyQt5"):
+        try:
+            importlib.import_module(name + ".QtCore")
+            return
+        except ImportError:
+            pass
+
+    sys.modules["PyQt5"] = stand_in_module("PyQt5")
+    sys.modules["PyQt5.QtCore"] = stand_in_module("PyQt5.QtCore", QTimer=QTimer)
+    sys.modules["PyQt5.QtGui"] = stand_in_module("PyQt5.QtGui")
+    sys.modules["PyQt5.QtWidgets"] = stand_in_module("PyQt5.QtWidgets")
+
+def load(name: str) -> types.ModuleType:
+    """Imports `zen_picker.<name>`, see the module docstring."""
+    return importlib.import_module("zen_picker." + name)
+
+install_qt_stand_ins()
+sys.path.insert(0, str(PLUGIN_DIR / "bench"))
+
+package = types.ModuleType("zen_picker")
+package.__path__ = [str(PLUGIN_DIR)]
+sys.modules.setdefault("zen_picker", package)
@@ -0,0 +1,65 @@
+"""
+Round trips of the component codecs in `color.py`, against the Krita
+stand-in of the benchmarks. Run from the plugin directory with
+
+    python -m unittest discover tests
+"""
+import unittest
+
+import plugin
+import krita
+
+color = plugin.load("color")
+
+Rgba = color.Rgba
+
+COLORS = (
+    Rgba(0.8, 0.3, 0.1, 1.0),
+    Rgba(0.2, 0.6, 0.9, 0.5),
+    Rgba(0.5, 0.5, 0.5, 0.25),
+    Rgba(0.0, 0.0, 0.0, 1.0),
+    Rgba(1.0, 1.0, 1.0, 1.0),
+)
+
+class CodecRoundTrip(unittest.TestCase):
+    def assert_round_trip(self, model: str, depth: str, codec_type: type):
+        managed = krita.ManagedColor(model, depth, "")
+        codec = color.codec_for(managed)
+        self.assertIsInstance(codec, codec_type)
+
+        for rgba in COLORS:
+            with self.subTest(rgba=rgba):
+                rgba.write_to(managed, codec)
+                self.assertEqual(len(managed.components()), codec.channels)
+
+                decoded = Rgba.from_managed(managed)
+                for expected, actual in zip(rgba, decoded):
+                    self.assertAlmostEqual(expected, actual, places=5)
+
+    def test_lab(self):
+        for depth in ("U8", "F32"):
+            with self.subTest(depth=depth):
+                self.assert_round_trip("LABA", depth, color.LabCodec)
+
+    def test_xyz(self):
+        for depth in ("U8", "F32"):
+            with self.subTest(depth=depth):
+                self.assert_round_trip("XYZA", depth, color.XyzCodec)
+
+    def test_cmyk(self):
+        for depth in ("U8", "F32"):
+            with self.subTest(depth=depth):
+                self.assert_round_trip("CMYKA", depth, color.CmykCodec)
+
+    def test_cmyk_ink_units(self):
+        black = Rgba(0.0, 0.0, 0.0, 1.0)
+        self.assertEqual(color.find_codec("CMYKA", "U8").encode(black)[3], 1.0)
+        # float depths count ink in percent
+        self.assertEqual(color.find_codec("CMYKA", "F32").encode(black)[3], 100.0)
+
+    def test_codec_is_abstract(self):
+        with self.assertRaises(TypeError):
+            color.ComponentCodec()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Eviction and bookkeeping of the render caches in `render_cache.py`.
+"""
+import unittest
+
+import plugin
+
+render_cache = plugin.load("render_cache")
+LruCache = render_cache.LruCache
+
+class LruCacheTest(unittest.TestCase):
+    def test_evicts_the_least_recently_used(self):
+        cache = LruCache(max_entries=3)
+        for key in "abc":
+            cache.put(key, key.upper())
+        self.assertEqual(cache.get("a"), "A")
+        cache.put("d", "D")
+
+        self.assertNotIn("b", cache)
+        self.assertEqual([key in cache for key in "acd"], [True] * 3)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_evicts_over_max_bytes(self):
+        cache = LruCache(max_entries=10, max_bytes=100)
+        cache.put("a", 1, 60)
+        cache.put("b", 2, 30)
+        cache.put("c", 3, 30)
+
+        self.assertNotIn("a", cache)
+        self.assertEqual(cache.bytes, 60)
+
+        # replacing an entry counts its new size only
+        cache.put("b", 4, 10)
+        self.assertEqual(cache.bytes, 40)
+        self.assertEqual(cache.get("b"), 4)
+
+    def test_membership_is_not_a_use(self):
+        cache = LruCache(max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertIn("a", cache)
+        cache.put("c", 3)
+
+        self.assertNotIn("a", cache)
+        self.assertEqual(cache.stats()["hits"] + cache.stats()["misses"], 0)
+
+    def test_counts_hits_and_misses(self):
+        cache = LruCache()
+        cache.put("a", 1)
+        cache.get("a")
+        cache.get("a")
+        cache.get("b")
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 1))
+        self.assertAlmostEqual(stats["hit_rate"], 2 / 3)
+
+    def test_configure_evicts_at_once(self):
+        cache = LruCache()
+        for i in range(10):
+            cache.put(i, i, 10)
+        cache.configure(max_entries=4)
+
+        self.assertEqual(len(cache), 4)
+        self.assertEqual(cache.bytes, 40)
+        self.assertIn(9, cache)
+
+        cache.clear()
+        self.assertEqual((len(cache), cache.bytes), (0, 0))
+
+class QuantizeTest(unittest.TestCase):
+    def test_close_colors_share_a_key(self):
+        rgb = (0.25, 0.5, 0.75)
+        nudged = tuple(c + 0.1 / render_cache.QUANTIZE_STEPS for c in rgb)
+        self.assertEqual(render_cache.quantize(rgb), render_cache.quantize(nudged))
+
+        apart = tuple(c + 1 / render_cache.QUANTIZE_STEPS for c in rgb)
+        self.assertNotEqual(render_cache.quantize(rgb), render_cache.quantize(apart))
+
+    def test_steps(self):
+        self.assertEqual(render_cache.quantize((0.0, 0.5, 1.0), 4), (0, 2, 4))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+"""
+`StateStore` logs: replaying them, recovering from torn writes, compacting
+them and retrying failed writes.
+"""
+import os
+import struct
+import tempfile
+import unittest
+
+import plugin
+
+state_store = plugin.load("state_store")
+Rgba = plugin.load("color").Rgba
+
+def rounded(color: Rgba) -> tuple:
+    # stored as float32
+    return tuple(round(c, 5) for c in color)
+
+class StateStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "state.bin")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def reopen(self) -> state_store.StoredState:
+        return state_store.StateStore(self.path).state
+
+    def test_replays_every_record(self):
+        store = state_store.StateStore(self.path)
+        store.set_light(0, Rgba(0.9, 0.8, 0.6), 0.3)
+        store.set_light(1, Rgba(0.2, 0.3, 0.9), 0.2, shadow=True)
+        store.set_light(2, Rgba(1.0, 0.5, 0.0), 0.5)
+        store.set_light_count(2)
+        for i in range(4):
+            store.add_saved_color(Rgba(i / 4, 0.5, 0.5), "RGBA/U8/sRGB")
+        store.remove_saved_color(1)
+        store.set_value_range((0.2, 0.8), auto=False)
+        store.set_contrast(1.5)
+        self.assertTrue(store.flush())
+
+        state = self.reopen()
+        self.assertEqual(sorted(state.lights), [0, 1])
+        light, intensity, shadow = state.lights[1]
+        self.assertEqual(rounded(light), rounded(Rgba(0.2, 0.3, 0.9)))
+        self.assertAlmostEqual(intensity, 0.2, places=6)
+        self.assertTrue(shadow)
+        self.assertEqual(state.light_count, 2)
+        self.assertEqual(
+            [rounded(color) for color in state.saved_colors],
+            [rounded(Rgba(i / 4, 0.5, 0.5)) for i in (0, 3, 2)]
+        )
+        self.assertEqual(state.saved_profiles, ["RGBA/U8/sRGB"] * 3)
+        self.assertEqual([round(v, 5) for v in state.value_range], [0.2, 0.8])
+        self.assertFalse(state.auto_value_range)
+        self.assertEqual(state.contrast, 1.5)
+
+    def test_drops_a_torn_record(self):
+        store = state_store.StateStore(self.path)
+        store.add_saved_color(Rgba(0.1, 0.2, 0.3))
+        store.flush()
+        with open(self.path, "ab") as file:
+            # a record cut short by a crash
+            file.write(state_store.RECORD.pack(state_store.SAVED_ADD, 18) + b"abc")
+
+        store = state_store.StateStore(self.path)
+        self.assertEqual(len(store.state.saved_colors), 1)
+        store.add_saved_color(Rgba(0.4, 0.5, 0.6))
+        self.assertTrue(store.flush())
+
+        state = self.reopen()
+        self.assertEqual(
+            [rounded(color) for color in state.saved_colors],
+            [rounded(Rgba(0.1, 0.2, 0.3)), rounded(Rgba(0.4, 0.5, 0.6))]
+        )
+
+    def test_compacts_a_long_log(self):
+        store = state_store.StateStore(self.path)
+        store.add_saved_color(Rgba(0.1, 0.2, 0.3), "RGBA/U8/sRGB")
+        for i in range(200):
+            store.set_light(0, Rgba(i / 200, 0.5, 0.5), 0.3)
+            store.flush()
+
+        self.assertGreater(store.compactions, 0)
+        # 200 light records never pile up past the compaction threshold
+        record = state_store.RECORD.size + state_store.LIGHT_PAYLOAD.size
+        longest = state_store.HEADER.size + (store.min_compact_records + 1) * record
+        self.assertLessEqual(os.path.getsize(self.path), longest)
+
+        state = self.reopen()
+        self.assertEqual(rounded(state.lights[0][0]), rounded(Rgba(199 / 200, 0.5, 0.5)))
+        self.assertEqual(rounded(state.saved_colors[0]), rounded(Rgba(0.1, 0.2, 0.3)))
+        self.assertEqual(state.saved_profiles, ["RGBA/U8/sRGB"])
+
+    def test_keeps_a_single_pending_value(self):
+        store = state_store.StateStore(self.path)
+        for i in range(50):
+            store.set_value_range((0.1, 0.5 + i / 100), auto=True)
+        self.assertEqual(store.pending, 1)
+
+    def test_retries_failed_writes(self):
+        # a directory can't be opened as the log
+        os.mkdir(self.path)
+        store = state_store.StateStore(self.path)
+        store.add_saved_color(Rgba(0.1, 0.2, 0.3))
+
+        pending = store.pending
+        self.assertFalse(store.flush())
+        self.assertEqual(store.pending, pending)
+        timer = store._StateStore__timer
+        self.assertTrue(timer.isActive())
+        first = timer.interval()
+        self.assertGreater(first, store.flush_interval)
+
+        self.assertFalse(store.flush())
+        self.assertGreater(timer.interval(), first)
+
+        os.rmdir(self.path)
+        self.assertTrue(store.flush())
+        self.assertEqual(store.pending, 0)
+        self.assertEqual(len(self.reopen().saved_colors), 1)
+
+    def test_reads_lights_with_a_profile_id(self):
+        light = struct.pack("<BBH5f", 0, state_store.SHADOW_LIGHT, 3, 0.5, 0.25, 1.0, 1.0, 0.2)
+        with open(self.path, "wb") as file:
+            file.write(state_store.HEADER.pack(state_store.MAGIC, state_store.VERSION))
+            file.write(state_store.RECORD.pack(state_store.LIGHT, len(light)) + light)
+
+        color, intensity, shadow = self.reopen().lights[0]
+        self.assertEqual(rounded(color), (0.5, 0.25, 1.0, 1.0))
+        self.assertAlmostEqual(intensity, 0.2, places=6)
+        self.assertTrue(shadow)
+
+    def test_ignores_other_versions(self):
+        with open(self.path, "wb") as file:
+            file.write(state_store.HEADER.pack(state_store.MAGIC, state_store.VERSION + 1))
+            file.write(b"\x03\x12\x00" + bytes(18))
+
+        self.assertEqual(self.reopen().saved_colors, [])
+
+if __name__ == "__main__":
+    unittest.main()
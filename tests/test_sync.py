@@ -0,0 +1,103 @@
+"""
+When `SyncEngine` lets a tick through, backs off and picks a codec.
+"""
+import unittest
+
+import plugin
+import krita
+
+sync = plugin.load("sync")
+color = plugin.load("color")
+
+class View():
+    def __init__(self, color: krita.ManagedColor):
+        self.color = color
+
+    def foregroundColor(self) -> krita.ManagedColor:
+        if isinstance(self.color, Exception):
+            raise self.color
+        return self.color
+
+class Window():
+    def __init__(self, view: View):
+        self.view = view
+
+    def activeView(self) -> View:
+        return self.view
+
+class Instance():
+    def __init__(self, window: Window):
+        self.window = window
+
+    def activeWindow(self) -> Window:
+        return self.window
+
+def managed_color(model: str, depth: str, rgba: color.Rgba) -> krita.ManagedColor:
+    managed = krita.ManagedColor(model, depth, "")
+    rgba.write_to(managed, color.find_codec(model, depth))
+    return managed
+
+RED = color.Rgba(0.8, 0.1, 0.1, 1.0)
+BLUE = color.Rgba(0.1, 0.2, 0.9, 1.0)
+
+class SyncEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.view = View(managed_color("RGBA", "U8", RED))
+        self.engine = sync.SyncEngine(Instance(Window(self.view)))
+
+    def test_processes_changes_only(self):
+        self.assertIsNotNone(self.engine.poll([], (100, 100)))
+        self.assertIsNone(self.engine.poll([], (100, 100)))
+
+        self.assertIsNotNone(self.engine.poll([], (120, 100)))
+        self.view.color = managed_color("RGBA", "U8", BLUE)
+        _, rgba = self.engine.poll([], (120, 100))
+        self.assertAlmostEqual(rgba.b, BLUE.b, places=2)
+        self.assertEqual(self.engine.ticks_processed, 3)
+        self.assertEqual(self.engine.ticks_skipped, 1)
+
+    def test_backs_off_while_idle(self):
+        engine = self.engine
+        engine.poll([], (100, 100))
+        for _ in range(engine.idle_ticks_before_backoff * 10):
+            engine.poll([], (100, 100))
+        self.assertEqual(engine.interval, engine.max_interval)
+
+        timer = plugin.QTimer()
+        timer.start(engine.interval)
+        engine.timer = timer
+        self.view.color = managed_color("RGBA", "U8", BLUE)
+        self.assertIsNotNone(engine.poll([], (100, 100)))
+        self.assertEqual(engine.interval, engine.min_interval)
+        # a backed off timer is restarted at the short interval right away
+        self.assertEqual(timer.interval(), engine.min_interval)
+
+    def test_follows_the_color_model(self):
+        self.engine.poll([], (100, 100))
+        self.assertIsInstance(self.engine.codec, color.RgbaCodec)
+
+        self.view.color = managed_color("LABA", "U16", RED)
+        _, rgba = self.engine.poll([], (100, 100))
+        self.assertIsInstance(self.engine.codec, color.LabCodec)
+        for expected, actual in zip(RED, rgba):
+            self.assertAlmostEqual(expected, actual, places=3)
+
+    def test_skips_closed_views(self):
+        for closed in (RuntimeError("view deleted"), None):
+            with self.subTest(closed=closed):
+                self.engine.poll([], (100, 100))
+                self.view.color = closed
+                skipped = self.engine.ticks_skipped
+
+                self.assertIsNone(self.engine.poll([], (100, 100)))
+                self.assertEqual(self.engine.ticks_skipped, skipped + 1)
+                self.assertIsNone(self.engine.codec)
+                self.view.color = managed_color("RGBA", "U8", RED)
+
+    def test_skips_without_a_window(self):
+        engine = sync.SyncEngine(Instance(None))
+        self.assertIsNone(engine.poll([], (100, 100)))
+        self.assertEqual(engine.ticks_skipped, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+import functools
+import json
+import math
+import os
+import threading
+from time import perf_counter_ns
+from typing import Callable
+
+class LatencyHistogram():
+    """
+    Log-linear histogram of durations in nanoseconds: every power of two is
+    split into `sub_buckets` buckets, so percentiles are within 1/sub_buckets
+    of the recorded value.
+    """
+    sub_buckets = 8
+
+    def __init__(self):
+        self.__buckets: dict[int, int] = {}
+        self.count = 0
+        self.min_ns = 0
+        self.max_ns = 0
+
+    def bucket(self, ns: int) -> int:
+        if ns < 1:
+            return 0
+        exponent = int(math.log2(ns))
+        fraction = (ns - (1 << exponent)) / (1 << exponent)
+        return exponent * self.sub_buckets + int(fraction * self.sub_buckets)
+
+    def bucket_upper_bound(self, bucket: int) -> int:
+        exponent, sub = divmod(bucket, self.sub_buckets)
+        return int((1 << exponent) * (1 + (sub + 1) / self.sub_buckets))
+
+    def record(self, ns: int):
+        bucket = self.bucket(ns)
+        self.__buckets[bucket] = self.__buckets.get(bucket, 0) + 1
+
+        if self.count == 0 or ns < self.min_ns:
+            self.min_ns = ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+        self.count += 1
+
+    def percentile(self, p: float) -> int:
+        if self.count == 0:
+            return 0
+
+        rank = math.ceil(self.count * p / 100)
+        seen = 0
+        for bucket in sorted(self.__buckets):
+            seen += self.__buckets[bucket]
+            if seen >= rank:
+                return min(self.bucket_upper_bound(bucket), self.max_ns)
+
+        return self.max_ns
+
+    def clear(self):
+        self.__buckets.clear()
+        self.count = 0
+        self.min_ns = 0
+        self.max_ns = 0
+
+class Tracer():
+    """
+    Records spans into a fixed-size ring buffer, the oldest spans are
+    overwritten once `capacity` is reached. Recording only happens while
+    `enabled` is set; `traced` checks the flag before doing anything else.
+    Spans come from worker threads too, the buffer is guarded by a lock.
+    """
+    def __init__(self, capacity: int = 8192):
+        self.enabled = False
+        self.capacity = capacity
+        self.__names: list[str] = [None] * capacity
+        self.__starts = [0] * capacity
+        self.__durations = [0] * capacity
+        self.__thread_ids = [0] * capacity
+        self.__next = 0
+        self.__count = 0
+        self.__lock = threading.Lock()
+
+        # input event to setForeGroundColor
+        self.input_latency = LatencyHistogram()
+
+    def record(self, name: str, start_ns: int, end_ns: int):
+        thread_id = threading.get_ident()
+        with self.__lock:
+            i = self.__next
+            self.__names[i] = name
+            self.__starts[i] = start_ns
+            self.__durations[i] = end_ns - start_ns
+            self.__thread_ids[i] = thread_id
+
+            self.__next = (i + 1) % self.capacity
+            self.__count = min(self.__count + 1, self.capacity)
+
+    def record_input_latency(self, start_ns: int):
+        if self.enabled:
+            self.input_latency.record(perf_counter_ns() - start_ns)
+
+    def clear(self):
+        with self.__lock:
+            self.__next = 0
+            self.__count = 0
+        self.input_latency.clear()
+
+    def spans(self) -> list[tuple[str, int, int, int]]:
+        """Returns (name, start_ns, duration_ns, thread_id), oldest first."""
+        with self.__lock:
+            first = (self.__next - self.__count) % self.capacity
+            return [
+                (
+                    self.__names[i],
+                    self.__starts[i],
+                    self.__durations[i],
+                    self.__thread_ids[i]
+                )
+                for i in ((first + n) % self.capacity for n in range(self.__count))
+            ]
+
+    def summary(self) -> dict:
+        totals: dict[str, list[int]] = {}
+        for name, _, duration, _ in self.spans():
+            totals.setdefault(name, []).append(duration)
+
+        spans = {}
+        for name, durations in totals.items():
+            durations.sort()
+            spans[name] = {
+                "count": len(durations),
+                "total_us": sum(durations) / 1000,
+                "p50_us": durations[len(durations) // 2] / 1000,
+                "p99_us": durations[min(int(len(durations) * 0.99), len(durations) - 1)] / 1000,
+            }
+
+        latency = self.input_latency
+        return {
+            "spans": spans,
+            "input_latency": {
+                "count": latency.count,
+                "p50_us": latency.percentile(50) / 1000,
+                "p99_us": latency.percentile(99) / 1000,
+                "max_us": latency.max_ns / 1000,
+            },
+        }
+
+    def summary_text(self) -> str:
+        summary = self.summary()
+        lines = [
+            f"{name}: {s['count']}x, p50 {s['p50_us']:.0f}us, p99 {s['p99_us']:.0f}us"
+            for name, s in sorted(
+                summary["spans"].items(),
+                key=lambda item: item[1]["total_us"],
+                reverse=True
+            )
+        ]
+
+        latency = summary["input_latency"]
+        if latency["count"]:
+            lines.append(
+                f"input latency: {latency['count']}x, "
+                f"p50 {latency['p50_us']:.0f}us, p99 {latency['p99_us']:.0f}us"
+            )
+
+        return "\n".join(lines) if lines else "no spans recorded"
+
+    def export_chrome_trace(self, path: str):
+        """Writes the recorded spans as Chrome trace event json."""
+        pid = os.getpid()
+        events = [
+            {
+                "name": name,
+                "cat": "zen_picker",
+                "ph": "X",
+                "ts": start / 1000,
+                "dur": duration / 1000,
+                "pid": pid,
+                "tid": thread_id,
+            }
+            for name, start, duration, thread_id in self.spans()
+        ]
+
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+tracer = Tracer()
+
+def traced(name: str):
+    """Decorator recording a span named `name` for every call while tracing."""
+    def decorate(f: Callable) -> Callable:
+        @functools.wraps(f)
+        def wrapped(*args, **kwargs):
+            if not tracer.enabled:
+                return f(*args, **kwargs)
+
+            start = perf_counter_ns()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                tracer.record(name, start, perf_counter_ns())
+        return wrapped
+    return decorate
@@ -1,97 +1,214 @@
 try:
-    from PyQt6.QtGui import QColor
+    from PyQt6.QtGui import QColor, QImage, QGuiApplication
     from PyQt5.QtWidgets import QLayout
+    from PyQt6.QtCore import QStandardPaths, QTimer, QObject
 except:
-    from PyQt5.QtGui import QColor
+    from PyQt5.QtGui import QColor, QImage, QGuiApplication
     from PyQt5.QtWidgets import QLayout
+    from PyQt5.QtCore import QStandardPaths, QTimer, QObject
 
-from typing import Union
-import time
+import os
+from time import perf_counter_ns
+from typing import Callable
 from krita import ManagedColor, Canvas
 
-from .lib_zen import mix, relative_color_shift
+from .color import Rgba
+from .tracing import traced, tracer
 
-class UnimplementedError(Exception):
-    pass
+SETTINGS_GROUP = "zen_picker"
 
 class Light():
-    def __init__(self, color: ManagedColor, intensity: float = 0.1):
+    def __init__(self, color: Rgba, intensity: float = 0.1, shadow: bool = False):
         self.__color = color
         self.__intensity = intensity
+        # ambient lights give a shadow color instead of a lit one
+        self.__shadow = shadow
+        self.__version = 0
 
     @property
-    def color(self) -> ManagedColor:
+    def version(self) -> int:
+        """Bumped whenever the color or intensity actually changes."""
+        return self.__version
+
+    @property
+    def color(self) -> Rgba:
         return self.__color
 
     @color.setter
-    def color(self, color: ManagedColor):
-        self.__color = color
+    def color(self, color: Rgba):
+        if color != self.__color:
+            self.__color = color
+            self.__version += 1
 
     @property
     def intensity(self) -> float:
         return self.__intensity
 
     @intensity.setter
-    def set_intensity(self, intensity: float):
-        self.__intensity = intensity
+    def intensity(self, intensity: float):
+        if intensity != self.__intensity:
+            self.__intensity = intensity
+            self.__version += 1
 
-# https://gist.github.com/kylebebak/ee67befc156831b3bbaa88fb197487b0
-# TODO: debounce severs link to class instance
-def debounce(s):
-    """Decorator ensures function that can only be called once every `s` seconds.
+    @property
+    def shadow(self) -> bool:
+        return self.__shadow
+
+    def inputs(self) -> tuple[tuple[float, float, float], float, bool]:
+        """The light as lib_zen takes it."""
+        return (self.__color.rgb, self.__intensity, self.__shadow)
+
+def frame_interval() -> int:
+    """Milliseconds per frame of the primary screen."""
+    screen = QGuiApplication.primaryScreen()
+    rate = screen.refreshRate() if screen is not None else 0.0
+    return max(int(1000 / rate), 1) if rate > 0 else 16
+
+class Throttle():
     """
-    def decorate(f):
-        t = None
-
-        def wrapped(*args, **kwargs):
-            nonlocal t
-            t_ = time.time()
-            if t is None or t_ - t >= s:
-                result = f(*args, **kwargs)
-                t = time.time()
-                return result
-        return wrapped
-    return decorate
-
-def parse_color(array):
-    color = ManagedColor(array[0], array[1], array[2])
-    color.setComponents([float(x) for x in array[3:]])
-    return color
+    Coalesces bursts of `request` calls into at most one `callback` call per
+    `interval` milliseconds, always with the latest arguments.
 
-def q_to_managed_color(canvas: Canvas, qcolor: QColor):
-    return ManagedColor.fromQColor(qcolor, canvas)
+    The first request of a burst is delivered right away, later ones only
+    replace the pending arguments until the interval elapses. `flush`
+    delivers whatever is still pending immediately. Owned by one widget, so
+    the callback can be a bound method.
+    """
+    def __init__(self, callback: Callable, interval: int = None, parent: QObject = None):
+        self.__callback = callback
+        self.__pending: tuple = None
 
-def managed_to_q_color(canvas: Canvas, managedcolor: ManagedColor):
-    return managedcolor.colorForCanvas(canvas)
+        self.__timer = QTimer(parent)
+        self.__timer.setSingleShot(True)
+        self.__timer.setInterval(interval if interval is not None else frame_interval())
+        self.__timer.timeout.connect(self.__on_timeout)
 
-def copy_managed_color(color: ManagedColor) -> ManagedColor:
-    color_model = color.colorModel()
-    color_depth = color.colorDepth()
-    color_profile = color.colorProfile()
+        self.requested = 0
+        self.delivered = 0
 
-    new = ManagedColor(color_model, color_depth, color_profile)
-    comps = get_managed_color_comps(color)
+    @property
+    def interval(self) -> int:
+        return self.__timer.interval()
+
+    @property
+    def pending(self) -> bool:
+        return self.__pending is not None
+
+    def request(self, *args):
+        self.requested += 1
+        self.__pending = args
+
+        if not self.__timer.isActive():
+            self.__deliver()
+            self.__timer.start()
+
+    def flush(self):
+        self.__timer.stop()
+        if self.__pending is not None:
+            self.__deliver()
+
+    def cancel(self):
+        self.__timer.stop()
+        self.__pending = None
+
+    def __on_timeout(self):
+        if self.__pending is not None:
+            self.__deliver()
+            self.__timer.start()
+
+    def __deliver(self):
+        args = self.__pending
+        self.__pending = None
+        self.delivered += 1
+        self.__callback(*args)
+
+    def stats(self) -> dict:
+        return {
+            "requested": self.requested,
+            "delivered": self.delivered,
+            "coalesced": self.requested - self.delivered,
+            "interval": self.interval,
+        }
+
+class ColorDrag():
+    """
+    Turns a mouse drag on a picker widget into foreground color updates.
 
-    new = set_managed_color_comps(new, comps)
-    return new
+    Positions go through a `Throttle`, so the foreground color changes at
+    most once per frame, each time written into the one ManagedColor made
+    when the drag started. `color_at(rgba, *position)` gives the RGB at a
+    position for the color the drag started from. The latency from the
+    oldest mouse event not yet applied to the update is traced.
+    """
+    def __init__(self, app, color_at: Callable, parent: QObject = None):
+        self.__app = app
+        self.__color_at = color_at
+        # reused for every foreground update of a drag
+        self.__color: ManagedColor = None
+        # oldest mouse event not yet applied to the foreground color
+        self.__start_ns: int = None
+        self.throttle = Throttle(self.__apply, parent=parent)
 
-def get_managed_color_comps(color: ManagedColor) -> list[float]:
-    color_comps = color.componentsOrdered()
+    @property
+    def active(self) -> bool:
+        return self.__color is not None
+
+    def start(self):
+        """Starts dragging from the foreground color, call `move` next."""
+        self.__start_ns = perf_counter_ns()
+        app = self.__app
+        app.sync_engine.wake()
+        app.color_to_match = app.current_rgba
+        self.__color = app.new_managed_color(app.current_rgba)
+
+    def move(self, *position):
+        if self.__start_ns is None:
+            self.__start_ns = perf_counter_ns()
+        self.throttle.request(*position)
+
+    def finish(self):
+        """Applies the last position right away, even mid-frame, and ends the drag."""
+        self.throttle.flush()
+        self.__app.color_to_match = None
+        self.__color = None
+
+    @traced("ColorDrag.apply")
+    def __apply(self, *position):
+        start_ns = self.__start_ns
+        self.__start_ns = None
+
+        app = self.__app
+        rgba = app.color_to_match
+        canvas = app.canvas
+        if rgba is None or canvas is None or self.__color is None:
+            return
+
+        view = canvas.view()
+        if view is not None:
+            rgb = self.__color_at(rgba, *position)
+            view.setForeGroundColor(rgba.with_rgb(rgb).write_to(self.__color, app.codec))
+            tracer.record_input_latency(start_ns)
+
+def cache_path(name: str) -> str:
+    location = QStandardPaths.writableLocation(
+        QStandardPaths.StandardLocation.AppDataLocation
+    )
+    return os.path.join(location, SETTINGS_GROUP, name)
 
-    if len(color_comps) > 2:
-        r, g, b, a = color_comps
-    else:
-        r = color_comps[0]
-        g = color_comps[0]
-        b = color_comps[0]
-        a = color_comps[1]
+def q_to_managed_color(canvas: Canvas, qcolor: QColor):
+    return ManagedColor.fromQColor(qcolor, canvas)
 
-    return [r, g, b, a]
+def managed_to_q_color(canvas: Canvas, managedcolor: ManagedColor):
+    return managedcolor.colorForCanvas(canvas)
 
-def set_managed_color_comps(color: ManagedColor, comps: list[float]) -> ManagedColor:
-    r, g, b, a = comps
-    color.setComponents([b, g, r, a])
-    return color
+def scanline_image(scanline, width: int, height: int) -> QImage:
+    """
+    Wraps an RGBA8 scanline written by lib_zen and stretches it to `height`
+    rows. The scanline is only borrowed while scaling, so the caller can
+    reuse it for the next redraw.
+    """
+    image = QImage(scanline, width, 1, width * 4, QImage.Format.Format_RGBA8888)
+    return image.scaled(width, height)
 
 def delete_layout(layout: QLayout):
     while layout.count():
@@ -99,34 +216,3 @@ def delete_layout(layout: QLayout):
         widget = child.widget()
         if widget:
             widget.deleteLater()
-
-
-def get_color_idx(color: ManagedColor, colors: list[ManagedColor]) -> int:
-    for i, stored_color in enumerate(colors):
-        r, g, b, a = stored_color.componentsOrdered()
-        _r, _g, _b, _a = color.componentsOrdered()
-
-        if (r == _r and g == _g and b == _b and a == _a):
-            return i
-
-    return -1
-
-def get_mixed_colors(
-    color: ManagedColor, 
-    light: Light,
-    components: bool = False,
-    bgr: bool = True
-) -> Union[ManagedColor, list[float]]:
-    r, g, b, a = get_managed_color_comps(color)
-    l_r, l_g, l_b, l_a = get_managed_color_comps(light.color)
-
-    #TODO: only mix hue?
-    l_r, l_g, l_b = mix((r, g, b),(l_r, l_g, l_b), light.intensity)
-
-    if components:
-        return [l_r, l_g, l_b, a]
-
-    mixed_color = copy_managed_color(color)
-    set_managed_color_comps(mixed_color, [l_r, l_g, l_b, l_a] )
-
-    return mixed_color
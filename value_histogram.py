@@ -0,0 +1,155 @@
+try:
+    from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+except:
+    from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+import threading
+from time import perf_counter_ns
+from krita import Krita, Document
+
+from .lib_zen import HistogramEngine
+from .tracing import traced
+
+class ValueHistogram(QObject):
+    """
+    Keeps an HSLuv lightness histogram of the active document's projection.
+
+    Every tick reads as many tiles as fit in `budget_ms` through
+    `Document.pixelData`, on the Qt thread since Krita's API has to be used
+    from there, and counts them in lib_zen on a worker thread with the GIL
+    released, so even 8k documents are built up over a few ticks without
+    blocking the UI. Ticks are skipped while a pass is still counting,
+    `stop` and `reset` cancel it. Once the whole document is counted, tiles
+    keep being reread round robin and only the ones whose pixels changed are
+    counted again: Krita does not signal which regions were painted, so
+    changes are only found by this rescan. While nothing changes the timer
+    backs off to `max_interval`.
+    """
+    changed = pyqtSignal()
+    # engine and changed tile count of a pass, from the worker thread
+    processed = pyqtSignal(object, int)
+
+    min_interval = 100
+    max_interval = 1000
+    budget_ms = 6
+    low_percentile = 0.02
+    high_percentile = 0.98
+
+    def __init__(self, krita_instance: Krita, parent: QObject = None):
+        super(ValueHistogram, self).__init__(parent)
+        self.__krita_instance = krita_instance
+        self.__engine: HistogramEngine = None
+        self.__document_key = None
+        self.__tiles_per_tick = 4
+        self.__worker: threading.Thread = None
+
+        self.__timer = QTimer(self)
+        self.__timer.timeout.connect(self.tick)
+        self.processed.connect(self.__on_processed)
+
+    @property
+    def engine(self) -> HistogramEngine:
+        return self.__engine
+
+    @property
+    def interval(self) -> int:
+        return self.__timer.interval()
+
+    @property
+    def busy(self) -> bool:
+        """Whether a pass is being counted."""
+        return self.__worker is not None
+
+    def start(self):
+        self.__timer.start(self.min_interval)
+
+    def stop(self):
+        self.__timer.stop()
+        if self.__engine is not None:
+            self.__engine.cancel()
+
+    def reset(self):
+        """Starts over on the next tick, for when the active document changed."""
+        if self.__engine is not None:
+            self.__engine.cancel()
+        self.__engine = None
+        self.__document_key = None
+
+    def engine_for(self, document: Document) -> HistogramEngine:
+        if document.colorModel() != "RGBA":
+            return None
+
+        key = (document.width(), document.height(), document.colorDepth())
+        if key != self.__document_key:
+            self.__document_key = key
+            try:
+                self.__engine = HistogramEngine(*key)
+            except ValueError:
+                self.__engine = None
+
+        return self.__engine
+
+    @traced("ValueHistogram.tick")
+    def tick(self):
+        if self.busy:
+            return
+
+        document = self.__krita_instance.activeDocument()
+        engine = self.engine_for(document) if document is not None else None
+        if engine is None:
+            self.__timer.setInterval(self.max_interval)
+            return
+
+        start = perf_counter_ns()
+        tiles = [
+            (index, document.pixelData(x, y, width, height))
+            for index, x, y, width, height in engine.next_tiles(self.__tiles_per_tick)
+        ]
+        elapsed_ms = (perf_counter_ns() - start) / 1e6
+
+        # only the reads block the Qt thread
+        if elapsed_ms < self.budget_ms / 2:
+            self.__tiles_per_tick = min(self.__tiles_per_tick * 2, engine.tile_count)
+        elif elapsed_ms > self.budget_ms and self.__tiles_per_tick > 1:
+            self.__tiles_per_tick //= 2
+
+        self.__worker = threading.Thread(target=self.__process, args=(engine, tiles), daemon=True)
+        self.__worker.start()
+
+    def __process(self, engine: HistogramEngine, tiles: list):
+        self.processed.emit(engine, engine.process(tiles))
+
+    def __on_processed(self, engine: HistogramEngine, changed: int):
+        self.__worker = None
+        if engine is not self.__engine:
+            # counted for a document that is no longer active
+            return
+
+        if changed or not engine.complete:
+            self.__timer.setInterval(self.min_interval)
+        else:
+            self.__timer.setInterval(min(self.__timer.interval() * 2, self.max_interval))
+
+        if changed:
+            self.changed.emit()
+
+    def histogram(self) -> list[float]:
+        """Bin counts scaled to [0, 1], empty while nothing was counted."""
+        if self.__engine is None:
+            return []
+
+        counts = self.__engine.histogram()
+        peak = max(counts)
+        if peak == 0:
+            return []
+        return [count / peak for count in counts]
+
+    def proposed_range(self) -> tuple[float, float] | None:
+        if self.__engine is None:
+            return None
+
+        lower = self.__engine.percentile(self.low_percentile)
+        upper = self.__engine.percentile(self.high_percentile)
+        if lower is None or upper is None:
+            return None
+        return (lower, upper)
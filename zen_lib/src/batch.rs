@@ -0,0 +1,292 @@
+//! Color ops over many colors or pixels at once.
+//!
+//! Colors are RGB or RGBA colors of `f32` or `f64` components, packed one
+//! after another in one slice, images are RGBA8 rows.
+//! Batches of at least `PARALLEL_THRESHOLD` colors or pixels are split into
+//! one contiguous chunk per thread, smaller ones run on the calling thread,
+//! where spawning would cost more than it saves.
+use crate::color_ops::FTuple;
+use crate::gradient::BYTES_PER_PIXEL;
+
+pub const PARALLEL_THRESHOLD: usize = 4096;
+
+/// Component type of a color batch. Ops compute in `f64` either way.
+pub trait Component: Copy + Send + Sync {
+    /// `array` module typecode of the type.
+    const TYPECODE: &'static str;
+
+    fn to_f64(self) -> f64;
+    fn from_f64(value: f64) -> Self;
+}
+
+impl Component for f64 {
+    const TYPECODE: &'static str = "d";
+
+    fn to_f64(self) -> f64 {
+        return self;
+    }
+
+    fn from_f64(value: f64) -> Self {
+        return value;
+    }
+}
+
+impl Component for f32 {
+    const TYPECODE: &'static str = "f";
+
+    fn to_f64(self) -> f64 {
+        return self as f64;
+    }
+
+    fn from_f64(value: f64) -> Self {
+        return value as f32;
+    }
+}
+
+/// RGB of color `i` of `colors`, `channels` components each, or of the
+/// only color when it holds just one, so a single color can be paired with
+/// every color of a batch.
+pub fn nth_color<T: Component>(colors: &[T], channels: usize, i: usize) -> FTuple {
+    let i = if colors.len() == channels { 0 } else { i * channels };
+    return (colors[i].to_f64(), colors[i + 1].to_f64(), colors[i + 2].to_f64());
+}
+
+fn map_chunk<T, F>(colors: &[T], out: &mut [T], channels: usize, first: usize, op: &F)
+where
+    T: Component,
+    F: Fn(usize, FTuple) -> FTuple,
+{
+    let colors = colors.chunks_exact(channels);
+    for (i, (color, result)) in colors.zip(out.chunks_exact_mut(channels)).enumerate() {
+        let rgb = (color[0].to_f64(), color[1].to_f64(), color[2].to_f64());
+        let (a, b, c) = op(first + i, rgb);
+        result[0] = T::from_f64(a);
+        result[1] = T::from_f64(b);
+        result[2] = T::from_f64(c);
+        // alpha is kept
+        result[3..].copy_from_slice(&color[3..]);
+    }
+}
+
+/// Writes `op(i, rgb)` for every color of `colors`, `channels` components
+/// each (RGB or RGBA), into `out`, on up to `threads` threads. `out` holds
+/// at least as many values as `colors`.
+pub fn map_colors<T, F>(colors: &[T], out: &mut [T], channels: usize, threads: usize, op: F)
+where
+    T: Component,
+    F: Fn(usize, FTuple) -> FTuple + Sync,
+{
+    let count = colors.len() / channels;
+    let out = &mut out[..count * channels];
+    if threads <= 1 || count < PARALLEL_THRESHOLD {
+        map_chunk(colors, out, channels, 0, &op);
+        return;
+    }
+
+    let chunk = count.div_ceil(threads);
+    std::thread::scope(|scope| {
+        let op = &op;
+        let colors = colors.chunks(chunk * channels);
+        for (n, (colors, out)) in colors.zip(out.chunks_mut(chunk * channels)).enumerate() {
+            scope.spawn(move || map_chunk(colors, out, channels, n * chunk, op));
+        }
+    });
+}
+
+/// Writes `color(i)` for every color of `out`, `channels` components each,
+/// with an opaque alpha for RGBA.
+pub fn fill_colors<T, F>(out: &mut [T], channels: usize, color: F)
+where
+    T: Component,
+    F: Fn(usize) -> FTuple,
+{
+    for (i, result) in out.chunks_exact_mut(channels).enumerate() {
+        let (a, b, c) = color(i);
+        result[0] = T::from_f64(a);
+        result[1] = T::from_f64(b);
+        result[2] = T::from_f64(c);
+        result[3..].fill(T::from_f64(1.0));
+    }
+}
+
+/// Like `map_colors` for ops turning every color of `colors` into
+/// `per_color` colors: `op(rgb, j)` is color `j` of that color, written
+/// color after color into `out` with the alpha of `rgb`.
+pub fn expand_colors<T, F>(
+    colors: &[T],
+    out: &mut [T],
+    channels: usize,
+    per_color: usize,
+    threads: usize,
+    op: F,
+) where
+    T: Component,
+    F: Fn(FTuple, usize) -> FTuple + Sync,
+{
+    let count = colors.len() / channels;
+    let stride = per_color * channels;
+    if stride == 0 {
+        return;
+    }
+    let out = &mut out[..count * stride];
+    let expand = |colors: &[T], out: &mut [T]| {
+        let colors = colors.chunks_exact(channels);
+        for (color, results) in colors.zip(out.chunks_exact_mut(stride)) {
+            let rgb = (color[0].to_f64(), color[1].to_f64(), color[2].to_f64());
+            for (j, result) in results.chunks_exact_mut(channels).enumerate() {
+                let (a, b, c) = op(rgb, j);
+                result[0] = T::from_f64(a);
+                result[1] = T::from_f64(b);
+                result[2] = T::from_f64(c);
+                result[3..].copy_from_slice(&color[3..]);
+            }
+        }
+    };
+    if threads <= 1 || count * per_color < PARALLEL_THRESHOLD {
+        expand(colors, out);
+        return;
+    }
+
+    let chunk = count.div_ceil(threads);
+    std::thread::scope(|scope| {
+        let expand = &expand;
+        let colors = colors.chunks(chunk * channels);
+        for (colors, out) in colors.zip(out.chunks_mut(chunk * stride)) {
+            scope.spawn(move || expand(colors, out));
+        }
+    });
+}
+
+/// Calls `fill_row(y, row)` for every `row_len` long row of `pixels`, on up
+/// to `threads` threads once there are at least `PARALLEL_THRESHOLD` pixels.
+pub fn fill_rows<F>(pixels: &mut [u8], row_len: usize, threads: usize, fill_row: F)
+where
+    F: Fn(usize, &mut [u8]) + Sync,
+{
+    if row_len == 0 {
+        return;
+    }
+    let rows = pixels.len() / row_len;
+    let pixels = &mut pixels[..rows * row_len];
+    let fill = |first: usize, pixels: &mut [u8]| {
+        for (y, row) in pixels.chunks_exact_mut(row_len).enumerate() {
+            fill_row(first + y, row);
+        }
+    };
+    if threads <= 1 || pixels.len() / BYTES_PER_PIXEL < PARALLEL_THRESHOLD {
+        fill(0, pixels);
+        return;
+    }
+
+    let chunk = rows.div_ceil(threads);
+    std::thread::scope(|scope| {
+        let fill = &fill;
+        for (n, pixels) in pixels.chunks_mut(chunk * row_len).enumerate() {
+            scope.spawn(move || fill(n * chunk, pixels));
+        }
+    });
+}
+
+#[cfg(test)]
+mod test {
+    use super::*;
+    use crate::color_ops::{match_value, mix, to_hsluv};
+
+    fn colors(n: usize) -> Vec<f64> {
+        return (0..n * 3).map(|i| (i as f64 * 0.618034) % 1.0).collect();
+    }
+
+    #[test]
+    fn parallel_matches_serial() {
+        let colors = colors(PARALLEL_THRESHOLD * 2 + 7);
+        let mut serial = vec![0.0; colors.len()];
+        let mut parallel = vec![0.0; colors.len()];
+
+        map_colors(&colors, &mut serial, 3, 1, |_, rgb| to_hsluv(rgb));
+        map_colors(&colors, &mut parallel, 3, 6, |_, rgb| to_hsluv(rgb));
+        assert_eq!(serial, parallel);
+
+        let (h, s, l) = to_hsluv((colors[3], colors[4], colors[5]));
+        assert_eq!(&serial[3..6], &[h, s, l]);
+    }
+
+    #[test]
+    fn pairs_colors_by_index_or_broadcast() {
+        let stable = colors(PARALLEL_THRESHOLD + 1);
+        let variable = colors(PARALLEL_THRESHOLD + 4)[9..].to_vec();
+        let mut out = vec![0.0; stable.len()];
+
+        let op = |i, rgb| match_value(rgb, nth_color(&variable, 3, i));
+        map_colors(&stable, &mut out, 3, 4, op);
+        let last = stable.len() / 3 - 1;
+        let expected = match_value(nth_color(&stable, 3, last), nth_color(&variable, 3, last));
+        assert_eq!(nth_color(&out, 3, last), expected);
+
+        let light = [0.9f32, 0.8, 0.6, 0.5];
+        map_colors(&stable, &mut out, 3, 4, |i, rgb| mix(rgb, nth_color(&light, 4, i), 0.3));
+        let expected = mix(nth_color(&stable, 3, last), nth_color(&light, 4, 0), 0.3);
+        assert_eq!(nth_color(&out, 3, last), expected);
+    }
+
+    #[test]
+    fn maps_rgba_f32_keeping_alpha() {
+        let colors: Vec<f32> = colors(PARALLEL_THRESHOLD + 5).iter().map(|&c| c as f32).collect();
+        let mut serial = vec![0.0f32; colors.len()];
+        let mut parallel = vec![0.0f32; colors.len()];
+
+        map_colors(&colors, &mut serial, 4, 1, |_, rgb| to_hsluv(rgb));
+        map_colors(&colors, &mut parallel, 4, 3, |_, rgb| to_hsluv(rgb));
+        assert_eq!(serial, parallel);
+
+        let color = &colors[8..12];
+        let (h, s, l) = to_hsluv((color[0] as f64, color[1] as f64, color[2] as f64));
+        assert_eq!(&serial[8..12], &[h as f32, s as f32, l as f32, color[3]]);
+    }
+
+    #[test]
+    fn fills_opaque_colors() {
+        let mut out = vec![0.0f32; 3 * 4];
+        fill_colors(&mut out, 4, |i| (i as f64, 0.5, 0.25));
+        assert_eq!(&out[4..8], &[1.0, 0.5, 0.25, 1.0]);
+    }
+
+    #[test]
+    fn expands_every_color() {
+        let colors = colors(PARALLEL_THRESHOLD + 3);
+        let mut serial = vec![0.0; colors.len() * 2];
+        let mut parallel = vec![0.0; colors.len() * 2];
+        let op = |rgb: FTuple, j: usize| if j == 0 { rgb } else { to_hsluv(rgb) };
+
+        expand_colors(&colors, &mut serial, 3, 2, 1, op);
+        expand_colors(&colors, &mut parallel, 3, 2, 3, op);
+        assert_eq!(serial, parallel);
+        assert_eq!(&serial[6..9], &colors[3..6]);
+        assert_eq!(nth_color(&serial, 3, 3), to_hsluv(nth_color(&colors, 3, 1)));
+    }
+
+    #[test]
+    fn expands_rgba_f32_keeping_alpha() {
+        let colors: Vec<f32> = colors(PARALLEL_THRESHOLD + 2).iter().map(|&c| c as f32).collect();
+        let mut out = vec![0.0f32; colors.len() * 2];
+        let op = |rgb: FTuple, j: usize| if j == 0 { rgb } else { to_hsluv(rgb) };
+
+        expand_colors(&colors, &mut out, 4, 2, 4, op);
+        let color = &colors[4..8];
+        let (h, s, l) = to_hsluv((color[0] as f64, color[1] as f64, color[2] as f64));
+        assert_eq!(&out[8..12], color);
+        assert_eq!(&out[12..16], &[h as f32, s as f32, l as f32, color[3]]);
+    }
+
+    #[test]
+    fn fill_rows_numbers_every_row() {
+        let row_len = 64 * BYTES_PER_PIXEL;
+        let mut serial = vec![0u8; row_len * 130];
+        let mut parallel = serial.clone();
+        let fill_row = |y: usize, row: &mut [u8]| row.fill(y as u8);
+
+        fill_rows(&mut serial, row_len, 1, fill_row);
+        fill_rows(&mut parallel, row_len, 8, fill_row);
+        assert_eq!(serial, parallel);
+        assert_eq!(serial[row_len * 129], 129);
+    }
+}
@@ -0,0 +1,90 @@
+use pyo3::buffer::{Element, PyBuffer};
+use pyo3::exceptions::PyValueError;
+use pyo3::prelude::*;
+use pyo3::types::{PyByteArray, PyBytes};
+
+use crate::batch::Component;
+
+/// Borrows the first `len` items of a writable, C-contiguous buffer (a
+/// `bytearray`, `memoryview`, `QImage.bits()`, `array('d')`, ...) without
+/// copying.
+pub fn writable<'a, T: Element>(buffer: &'a PyBuffer<T>, len: usize) -> PyResult<&'a mut [T]> {
+    if buffer.readonly() {
+        return Err(PyValueError::new_err("buffer is read-only"));
+    }
+    if !buffer.is_c_contiguous() {
+        return Err(PyValueError::new_err("buffer is not contiguous"));
+    }
+    if buffer.item_count() < len {
+        return Err(PyValueError::new_err(format!(
+            "buffer holds {} items, {} needed",
+            buffer.item_count(),
+            len
+        )));
+    }
+
+    // SAFETY: the buffer is writable, contiguous and at least `len` items
+    // long, and the returned slice can't outlive the `PyBuffer` holding the
+    // exporter's view.
+    let items = unsafe { std::slice::from_raw_parts_mut(buffer.buf_ptr() as *mut T, len) };
+    return Ok(items);
+}
+
+/// Borrows all items of a C-contiguous buffer without copying.
+pub fn readable<'a, T: Element>(buffer: &'a PyBuffer<T>) -> PyResult<&'a [T]> {
+    if !buffer.is_c_contiguous() {
+        return Err(PyValueError::new_err("buffer is not contiguous"));
+    }
+
+    // SAFETY: contiguous, and the slice can't outlive the view, see `writable`
+    let items = unsafe {
+        std::slice::from_raw_parts(buffer.buf_ptr() as *const T, buffer.item_count())
+    };
+    return Ok(items);
+}
+
+/// Whether two buffers share any memory, e.g. when `out` is the input.
+pub fn overlaps<T: Element, U: Element>(a: &PyBuffer<T>, b: &PyBuffer<U>) -> bool {
+    let a_start = a.buf_ptr() as usize;
+    let b_start = b.buf_ptr() as usize;
+    return a_start < b_start + b.len_bytes() && b_start < a_start + a.len_bytes();
+}
+
+/// A new `array('d')` or `array('f')` of `len` zeros, matching `T`.
+pub fn new_array<'py, T: Component>(py: Python<'py>, len: usize) -> PyResult<Bound<'py, PyAny>> {
+    let zeros = vec![0u8; len * std::mem::size_of::<T>()];
+    return py
+        .import("array")?
+        .getattr("array")?
+        .call1((T::TYPECODE, PyBytes::new(py, &zeros)));
+}
+
+/// Fills `out` (or a new `bytearray` when `out` is None) with `len` bytes
+/// produced by `fill` and returns it. `fill` runs with the GIL released, so
+/// other Python threads keep running while a buffer is filled.
+pub fn fill_bytes<'py, F>(
+    py: Python<'py>,
+    len: usize,
+    out: Option<Bound<'py, PyAny>>,
+    fill: F,
+) -> PyResult<Bound<'py, PyAny>>
+where
+    F: FnOnce(&mut [u8]) + Send,
+{
+    match out {
+        Some(out) => {
+            let buffer = PyBuffer::<u8>::get(&out)?;
+            let bytes = writable(&buffer, len)?;
+            // the exporter can't resize or free its memory while `buffer`
+            // holds a view of it, with or without the GIL
+            py.allow_threads(|| fill(bytes));
+            buffer.release(py);
+            return Ok(out);
+        }
+        None => {
+            let mut bytes = vec![0; len];
+            py.allow_threads(|| fill(&mut bytes));
+            return Ok(PyByteArray::new(py, &bytes).into_any());
+        }
+    }
+}
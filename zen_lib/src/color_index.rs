@@ -0,0 +1,244 @@
+//! Nearest color lookups over a palette, in CIELUV.
+//!
+//! Entries live in a grid hash of `CELL_SIZE` cubes, so inserting and
+//! removing are O(1) and a nearest lookup only visits the cells around the
+//! query, growing outwards until no closer entry can exist. Positions
+//! mirror a Python list: `insert` appends, `swap_remove` moves the last
+//! entry into the removed slot.
+use crate::color_ops::FTuple;
+use crate::hsluv_lut::{linear_to_luv, to_linear};
+use std::collections::HashMap;
+
+/// Grid spacing in CIELUV units, a few just noticeable differences.
+pub const CELL_SIZE: f64 = 4.0;
+/// Default tolerance below which two colors count as the same.
+pub const DEFAULT_TOLERANCE: f64 = 1.0;
+/// Below this many entries a plain scan beats walking the grid.
+const LINEAR_SCAN: usize = 32;
+
+type Key = (i32, i32, i32);
+
+pub fn rgb_to_luv((r, g, b): FTuple) -> [f64; 3] {
+    let (l, u, v) = linear_to_luv((to_linear(r), to_linear(g), to_linear(b)));
+    return [l, u, v];
+}
+
+/// CIE 1976 color difference (euclidean distance in CIELUV).
+pub fn delta_e(a: &[f64; 3], b: &[f64; 3]) -> f64 {
+    return ((a[0] - b[0]).powi(2) + (a[1] - b[1]).powi(2) + (a[2] - b[2]).powi(2)).sqrt();
+}
+
+fn key(luv: &[f64; 3]) -> Key {
+    return (
+        (luv[0] / CELL_SIZE).floor() as i32,
+        (luv[1] / CELL_SIZE).floor() as i32,
+        (luv[2] / CELL_SIZE).floor() as i32,
+    );
+}
+
+#[derive(Default)]
+pub struct ColorIndex {
+    entries: Vec<[f64; 3]>,
+    cells: HashMap<Key, Vec<usize>>,
+}
+
+impl ColorIndex {
+    pub fn new() -> Self {
+        return Self::default();
+    }
+
+    pub fn len(&self) -> usize {
+        return self.entries.len();
+    }
+
+    pub fn clear(&mut self) {
+        self.entries.clear();
+        self.cells.clear();
+    }
+
+    /// Appends `luv` and returns its position.
+    pub fn push(&mut self, luv: [f64; 3]) -> usize {
+        let position = self.entries.len();
+        self.entries.push(luv);
+        self.cells.entry(key(&luv)).or_default().push(position);
+        return position;
+    }
+
+    /// Appends `luv` unless an entry within `tolerance` exists. Returns the
+    /// position of the new or the existing entry, and whether it was added.
+    pub fn insert(&mut self, luv: [f64; 3], tolerance: f64) -> (usize, bool) {
+        if let Some(position) = self.find(&luv, tolerance) {
+            return (position, false);
+        }
+        return (self.push(luv), true);
+    }
+
+    fn unlink(&mut self, position: usize) {
+        let key = key(&self.entries[position]);
+        let cell = self.cells.get_mut(&key).unwrap();
+        cell.retain(|&p| p != position);
+        if cell.is_empty() {
+            self.cells.remove(&key);
+        }
+    }
+
+    /// Removes the entry at `position` and moves the last entry into its
+    /// place, like `list[i], list[-1] = list[-1], list[i]; list.pop()`.
+    pub fn swap_remove(&mut self, position: usize) {
+        let last = self.entries.len() - 1;
+        self.unlink(position);
+
+        if position != last {
+            let moved = &self.entries[last];
+            let cell = self.cells.get_mut(&key(moved)).unwrap();
+            for p in cell.iter_mut().filter(|p| **p == last) {
+                *p = position;
+            }
+        }
+        self.entries.swap_remove(position);
+    }
+
+    /// Closest entry to `luv` as (position, delta E), None when empty.
+    pub fn nearest(&self, luv: &[f64; 3]) -> Option<(usize, f64)> {
+        if self.entries.len() <= LINEAR_SCAN {
+            return self.scan(self.entries.iter().enumerate(), luv);
+        }
+
+        let (cl, cu, cv) = key(luv);
+        let mut best: Option<(usize, f64)> = None;
+        let mut visited = 0;
+
+        for radius in 0i32.. {
+            // every cell on the shell at chebyshev distance `radius`
+            for dl in -radius..=radius {
+                for du in -radius..=radius {
+                    let on_face = dl.abs() == radius || du.abs() == radius;
+                    let dvs: Vec<i32> = if on_face {
+                        (-radius..=radius).collect()
+                    } else {
+                        vec![-radius, radius]
+                    };
+
+                    for dv in dvs {
+                        visited += 1;
+                        let Some(cell) = self.cells.get(&(cl + dl, cu + du, cv + dv)) else {
+                            continue;
+                        };
+                        for &p in cell {
+                            let d = delta_e(luv, &self.entries[p]);
+                            if best.map_or(true, |(_, b)| d < b) {
+                                best = Some((p, d));
+                            }
+                        }
+                    }
+                }
+            }
+
+            // anything on a further shell is at least this far away
+            if best.is_some_and(|(_, d)| d <= radius as f64 * CELL_SIZE) {
+                return best;
+            }
+            // a sparse palette far from the query: cheaper to check them all
+            if visited >= self.cells.len() {
+                let all = self.cells.values().flatten().map(|&p| (p, &self.entries[p]));
+                return self.scan(all, luv);
+            }
+        }
+        unreachable!();
+    }
+
+    fn scan<'a>(
+        &self,
+        entries: impl Iterator<Item = (usize, &'a [f64; 3])>,
+        luv: &[f64; 3],
+    ) -> Option<(usize, f64)> {
+        return entries
+            .map(|(p, entry)| (p, delta_e(luv, entry)))
+            .min_by(|a, b| a.1.total_cmp(&b.1));
+    }
+
+    /// Position of the closest entry within `tolerance` of `luv`.
+    pub fn find(&self, luv: &[f64; 3], tolerance: f64) -> Option<usize> {
+        return self
+            .nearest(luv)
+            .filter(|&(_, d)| d <= tolerance)
+            .map(|(p, _)| p);
+    }
+}
+
+#[cfg(test)]
+mod test {
+    use super::*;
+
+    fn palette(n: usize) -> Vec<FTuple> {
+        // deterministic spread over the RGB cube
+        return (0..n)
+            .map(|i| {
+                let i = i as f64;
+                ((i * 0.618034) % 1.0, (i * 0.414214) % 1.0, (i * 0.732051) % 1.0)
+            })
+            .collect();
+    }
+
+    fn brute_force(colors: &[[f64; 3]], luv: &[f64; 3]) -> f64 {
+        return colors.iter().map(|c| delta_e(luv, c)).fold(f64::MAX, f64::min);
+    }
+
+    #[test]
+    fn nearest_matches_brute_force() {
+        let colors: Vec<[f64; 3]> = palette(5000).into_iter().map(rgb_to_luv).collect();
+        let mut index = ColorIndex::new();
+        for &luv in &colors {
+            index.push(luv);
+        }
+
+        for query in palette(5200).into_iter().skip(5000).map(rgb_to_luv) {
+            let (position, d) = index.nearest(&query).unwrap();
+            assert_eq!(d, brute_force(&colors, &query));
+            assert_eq!(d, delta_e(&query, &colors[position]));
+        }
+
+        // sparse palette, query far away from all of it
+        let mut sparse = ColorIndex::new();
+        for luv in palette(40).into_iter().map(|(r, _, _)| rgb_to_luv((r, 0.0, 0.0))) {
+            sparse.push(luv);
+        }
+        let white = rgb_to_luv((1.0, 1.0, 1.0));
+        let (position, d) = sparse.nearest(&white).unwrap();
+        assert_eq!(d, delta_e(&white, &sparse.entries[position]));
+        assert!(ColorIndex::new().nearest(&white).is_none());
+    }
+
+    #[test]
+    fn insert_deduplicates_within_tolerance() {
+        let mut index = ColorIndex::new();
+        let red = rgb_to_luv((0.8, 0.1, 0.1));
+        let rounded = rgb_to_luv((204.0 / 255.0, 26.0 / 255.0, 26.0 / 255.0));
+        let blue = rgb_to_luv((0.1, 0.1, 0.8));
+
+        assert_eq!(index.insert(red, DEFAULT_TOLERANCE), (0, true));
+        assert_eq!(index.insert(rounded, DEFAULT_TOLERANCE), (0, false));
+        assert_eq!(index.insert(blue, DEFAULT_TOLERANCE), (1, true));
+        assert_eq!(index.find(&red, 0.0), Some(0));
+        assert_eq!(index.find(&rounded, 0.0), None);
+    }
+
+    #[test]
+    fn swap_remove_mirrors_a_list() {
+        let colors: Vec<[f64; 3]> = palette(100).into_iter().map(rgb_to_luv).collect();
+        let mut index = ColorIndex::new();
+        let mut list = colors.clone();
+        for &luv in &colors {
+            index.push(luv);
+        }
+
+        for position in [3, 97, 0, 50, 95] {
+            index.swap_remove(position);
+            list.swap_remove(position);
+        }
+        assert_eq!(index.len(), list.len());
+        for (position, luv) in list.iter().enumerate() {
+            assert_eq!(index.find(luv, 0.0), Some(position));
+        }
+    }
+}
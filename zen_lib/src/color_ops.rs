@@ -1,3 +1,6 @@
+use crate::hsluv_lut::rgb_to_hsluv;
+use hsluv::hsluv_to_rgb;
+
 pub type FTuple = (f64, f64, f64);
 
 impl From<Rgbf> for FTuple {
@@ -174,6 +177,76 @@ pub fn blend_colors(a: Rgbf, b: Rgbf, t: f64) -> Rgbf {
     );
 }
 
+/// Scales saturation and value down by the given fractions.
+pub fn relative_color_shift(rgb: FTuple, shift_s: f64, shift_v: f64) -> FTuple {
+    let mut hsv: Hsv = Rgbf::from(rgb).into();
+    let (_, s, v) = hsv.to_tuple();
+    hsv.set(s - (shift_s * s), v - (shift_v * v));
+    return Rgbf::from(hsv).into_tuple();
+}
+
+pub fn color_shift(rgb: FTuple, shift_s: f64, shift_v: f64) -> FTuple {
+    let mut hsv: Hsv = Rgbf::from(rgb).into();
+    let (_, s, v) = hsv.to_tuple();
+    hsv.set(s + shift_s, v + shift_v);
+    return Rgbf::from(hsv).into_tuple();
+}
+
+pub fn saturation_shift(rgb: FTuple, shift: f64) -> FTuple {
+    let mut hsv: Hsv = Rgbf::from(rgb).into();
+    let (_, _, v) = hsv.to_tuple();
+    hsv.set(shift, v);
+    return Rgbf::from(hsv).into_tuple();
+}
+
+pub fn saturation_shift_uv(rgb: FTuple, shift: f64) -> FTuple {
+    let (r, g, b) = rgb;
+    let (h, _, v) = rgb_to_hsluv(r, g, b);
+
+    return hsluv_to_rgb(h, shift * 100.0, v);
+}
+
+pub fn value_shift(rgb: FTuple, shift: f64) -> FTuple {
+    let mut hsv: Hsv = Rgbf::from(rgb).into();
+    let (_, s, _) = hsv.to_tuple();
+    hsv.set(s, shift);
+    return Rgbf::from(hsv).into_tuple();
+}
+
+pub fn value_shift_uv(rgb: FTuple, shift: f64) -> FTuple {
+    let (r, g, b) = rgb;
+    let (h, s, _) = rgb_to_hsluv(r, g, b);
+
+    return hsluv_to_rgb(h, s, shift * 100.0);
+}
+
+pub fn to_hsv(rgb: FTuple) -> FTuple {
+    return Hsv::from(Rgbf::from(rgb)).to_tuple();
+}
+
+/// HSLuv with every component in [0, 1].
+pub fn to_hsluv(rgb: FTuple) -> FTuple {
+    let (r, g, b) = rgb;
+
+    let (h, s, v) = rgb_to_hsluv(r, g, b);
+    return (h / 360.0, s / 100.0, v / 100.0) as FTuple;
+}
+
+/// `variable` with the HSLuv lightness of `stable`.
+pub fn match_value(stable: FTuple, variable: FTuple) -> FTuple {
+    let (r, g, b) = stable;
+    let (_r, _g, _b) = variable;
+
+    let (_, _, v) = rgb_to_hsluv(r, g, b);
+    let (_h, _s, _) = rgb_to_hsluv(_r, _g, _b);
+
+    return hsluv_to_rgb(_h, _s, v);
+}
+
+pub fn mix(a: FTuple, b: FTuple, t: f64) -> FTuple {
+    return blend_colors(Rgbf::from(a), Rgbf::from(b), t).into_tuple();
+}
+
 #[cfg(test)]
 mod tests {
     use super::*;
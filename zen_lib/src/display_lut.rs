@@ -0,0 +1,183 @@
+//! Display transform of a canvas (display profile, OCIO, ...) sampled on a
+//! regular RGB grid and applied with trilinear interpolation. Krita converts
+//! one color per call (`ManagedColor.colorForCanvas`), sampling it once
+//! lets whole gradients be converted in native code.
+use crate::batch::fill_rows;
+use crate::color_ops::FTuple;
+use crate::gradient::{channel_to_u8, BYTES_PER_PIXEL};
+
+/// Pixels `apply_pixels` converts per chunk, the unit split over threads.
+const CHUNK_PIXELS: usize = 1024;
+
+/// Grid point below a channel value and the weight of the one above it.
+type AxisPoint = (usize, f32);
+
+pub struct DisplayLut {
+    size: usize,
+    /// Display color of every grid point, blue varying fastest, then green.
+    table: Vec<[f32; 3]>,
+    /// `AxisPoint` of every 8 bit channel value.
+    axis: Vec<AxisPoint>,
+}
+
+impl DisplayLut {
+    /// `samples` holds the display RGB of every grid point, `size` points
+    /// per channel from 0 to 1, in the order of `table`. None when it
+    /// doesn't hold `size`^3 colors.
+    pub fn new(size: usize, samples: &[f64]) -> Option<Self> {
+        if size < 2 || samples.len() != size * size * size * 3 {
+            return None;
+        }
+
+        let table = samples
+            .chunks_exact(3)
+            .map(|rgb| [rgb[0] as f32, rgb[1] as f32, rgb[2] as f32])
+            .collect();
+        let axis = (0..256).map(|c| axis_point(size, c as f64 / 255.0)).collect();
+
+        return Some(Self { size, table, axis });
+    }
+
+    pub fn size(&self) -> usize {
+        return self.size;
+    }
+
+    /// Whether no grid point moves by more than `tolerance` in any channel.
+    pub fn is_identity(&self, tolerance: f64) -> bool {
+        let last = (self.size - 1) as f64;
+        let tolerance = tolerance as f32;
+
+        return self.table.iter().enumerate().all(|(i, rgb)| {
+            let grid = [i / (self.size * self.size), i / self.size % self.size, i % self.size];
+            return rgb
+                .iter()
+                .zip(grid)
+                .all(|(c, g)| (c - (g as f64 / last) as f32).abs() <= tolerance);
+        });
+    }
+
+    fn interpolate(&self, (r, fr): AxisPoint, (g, fg): AxisPoint, (b, fb): AxisPoint) -> [f32; 3] {
+        let size = self.size;
+        let at = |r: usize, g: usize, b: usize| &self.table[(r * size + g) * size + b];
+        let lerp = |a: &[f32; 3], b: &[f32; 3], t: f32| {
+            [a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t, a[2] + (b[2] - a[2]) * t]
+        };
+
+        let c00 = lerp(at(r, g, b), at(r, g, b + 1), fb);
+        let c01 = lerp(at(r, g + 1, b), at(r, g + 1, b + 1), fb);
+        let c10 = lerp(at(r + 1, g, b), at(r + 1, g, b + 1), fb);
+        let c11 = lerp(at(r + 1, g + 1, b), at(r + 1, g + 1, b + 1), fb);
+
+        return lerp(&lerp(&c00, &c01, fg), &lerp(&c10, &c11, fg), fr);
+    }
+
+    pub fn apply(&self, rgb: FTuple) -> FTuple {
+        let size = self.size;
+        let [r, g, b] = self.interpolate(
+            axis_point(size, rgb.0),
+            axis_point(size, rgb.1),
+            axis_point(size, rgb.2),
+        );
+        return (r as f64, g as f64, b as f64);
+    }
+
+    fn apply_chunk(&self, pixels: &mut [u8]) {
+        for pixel in pixels.chunks_exact_mut(BYTES_PER_PIXEL) {
+            let rgb = self.interpolate(
+                self.axis[pixel[0] as usize],
+                self.axis[pixel[1] as usize],
+                self.axis[pixel[2] as usize],
+            );
+            for (channel, c) in pixel.iter_mut().zip(rgb) {
+                *channel = channel_to_u8(c as f64);
+            }
+        }
+    }
+
+    /// Converts RGBA8 `pixels` in place, alpha is kept. Large buffers are
+    /// split over up to `threads` threads.
+    pub fn apply_pixels(&self, pixels: &mut [u8], threads: usize) {
+        let chunk_len = CHUNK_PIXELS * BYTES_PER_PIXEL;
+        let whole = pixels.len() / chunk_len * chunk_len;
+        let (chunks, tail) = pixels.split_at_mut(whole);
+
+        fill_rows(chunks, chunk_len, threads, |_, chunk| self.apply_chunk(chunk));
+        self.apply_chunk(tail);
+    }
+}
+
+fn axis_point(size: usize, c: f64) -> AxisPoint {
+    let x = c.clamp(0.0, 1.0) * (size - 1) as f64;
+    let i = (x as usize).min(size - 2);
+    return (i, (x - i as f64) as f32);
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::batch::PARALLEL_THRESHOLD;
+
+    fn sample(size: usize, transform: impl Fn(f64) -> f64) -> DisplayLut {
+        let steps: Vec<f64> = (0..size).map(|i| i as f64 / (size - 1) as f64).collect();
+        let mut samples = Vec::new();
+        for r in &steps {
+            for g in &steps {
+                for b in &steps {
+                    samples.extend([transform(*r), transform(*g), transform(*b)]);
+                }
+            }
+        }
+        return DisplayLut::new(size, &samples).unwrap();
+    }
+
+    #[test]
+    fn rejects_wrong_sample_count() {
+        assert!(DisplayLut::new(17, &[0.0; 17 * 17 * 3]).is_none());
+        assert!(DisplayLut::new(1, &[0.0; 3]).is_none());
+    }
+
+    #[test]
+    fn identity_keeps_colors() {
+        let lut = sample(9, |c| c);
+        assert!(lut.is_identity(1e-6));
+
+        let (r, g, b) = lut.apply((0.3, 0.71, 1.0));
+        assert!((r - 0.3).abs() < 1e-6 && (g - 0.71).abs() < 1e-6 && (b - 1.0).abs() < 1e-6);
+
+        let mut pixels: Vec<u8> = (0..=255).flat_map(|c| [c, 255 - c, c / 2, 7]).collect();
+        let expected = pixels.clone();
+        lut.apply_pixels(&mut pixels, 1);
+        assert_eq!(pixels, expected);
+    }
+
+    #[test]
+    fn interpolates_between_grid_points() {
+        let gamma = |c: f64| c.powf(1.0 / 2.2);
+        let lut = sample(17, gamma);
+        assert!(!lut.is_identity(0.5 / 255.0));
+
+        for c in [0.0, 0.0625, 0.2, 0.5, 0.93, 1.0] {
+            let (r, g, b) = lut.apply((c, c, 1.0 - c));
+            assert!((r - gamma(c)).abs() < 0.02, "{c}");
+            assert_eq!(r, g);
+            assert!((b - gamma(1.0 - c)).abs() < 0.02, "{c}");
+        }
+    }
+
+    #[test]
+    fn parallel_matches_serial() {
+        let lut = sample(17, |c| c * c);
+        let len = (PARALLEL_THRESHOLD * 2 + 13) * BYTES_PER_PIXEL;
+        let mut serial: Vec<u8> = (0..len).map(|i| (i * 31 % 256) as u8).collect();
+        let mut parallel = serial.clone();
+
+        lut.apply_pixels(&mut serial, 1);
+        lut.apply_pixels(&mut parallel, 4);
+        assert_eq!(serial, parallel);
+
+        // the tail past the last whole chunk is converted too
+        let last = &serial[len - BYTES_PER_PIXEL..];
+        let source = ((len / 4 - 1) * 4 * 31 % 256) as f64 / 255.0;
+        assert_eq!(last[0], channel_to_u8(lut.apply((source, 0.0, 0.0)).0));
+    }
+}
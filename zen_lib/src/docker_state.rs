@@ -0,0 +1,202 @@
+use crate::batch::{expand_colors, Component};
+use crate::color_ops::{blend_colors, relative_color_shift, FTuple, Rgbf};
+use crate::hsluv_lut::rgb_to_hsluv;
+use crate::slider::{apply_channel, Channel, SLIDER_MAX, SLIDER_MIN};
+
+/// How much darker the shadow color is than the mix with an ambient light.
+pub const SHADOW_SHIFT_V: f64 = 0.2;
+
+#[derive(Clone, Copy)]
+pub struct Light {
+    pub rgb: FTuple,
+    pub intensity: f64,
+    /// Ambient light, its mix is shifted into a shadow color.
+    pub shadow: bool,
+}
+
+impl From<(FTuple, f64, bool)> for Light {
+    fn from((rgb, intensity, shadow): (FTuple, f64, bool)) -> Self {
+        return Self {
+            rgb,
+            intensity,
+            shadow,
+        };
+    }
+}
+
+#[derive(Clone, Copy)]
+pub struct SliderFrame {
+    pub left: FTuple,
+    pub right: FTuple,
+    pub position: f64,
+}
+
+/// Everything a `ZenDocker.Sync` tick needs for one foreground color.
+pub struct Frame {
+    /// The mix with each light, in the order they were given.
+    pub mixes: Vec<FTuple>,
+    pub sliders: Vec<SliderFrame>,
+}
+
+pub fn illuminate(rgb: FTuple, light: Light) -> FTuple {
+    return blend_colors(Rgbf::from(rgb), Rgbf::from(light.rgb), light.intensity).into_tuple();
+}
+
+pub fn shade(rgb: FTuple, light: Light) -> FTuple {
+    return relative_color_shift(illuminate(rgb, light), 0.0, SHADOW_SHIFT_V);
+}
+
+/// The color `light` turns `rgb` into.
+pub fn light_mix(rgb: FTuple, light: Light) -> FTuple {
+    if light.shadow {
+        return shade(rgb, light);
+    }
+    return illuminate(rgb, light);
+}
+
+/// Mixes every color of `colors`, `channels` components each (RGB or RGBA),
+/// with every light. The mix of color `i` with light `j` is color
+/// `i * lights.len() + j` of `out` and keeps the alpha of color `i`.
+pub fn mix_lights<T: Component>(
+    colors: &[T],
+    lights: &[Light],
+    out: &mut [T],
+    channels: usize,
+    threads: usize,
+) {
+    expand_colors(colors, out, channels, lights.len(), threads, |rgb, j| light_mix(rgb, lights[j]));
+}
+
+/// `steps` colors from `rgb` fully lit by `key`, through `rgb` itself, to
+/// its deepest shadow under `ambient`. With a `contrast` of 1 the ends are
+/// `illuminate(rgb, key)` and `shade(rgb, ambient)`, higher contrasts push
+/// them further away from `rgb`.
+pub fn shade_ramp(rgb: FTuple, key: Light, ambient: Light, steps: usize, contrast: f64) -> Vec<FTuple> {
+    if steps < 2 {
+        return vec![rgb; steps];
+    }
+
+    return (0..steps)
+        .map(|i| {
+            // -1 at the lit end, 0 at `rgb`, 1 at the shadow end
+            let t = i as f64 / (steps - 1) as f64 * 2.0 - 1.0;
+            if t <= 0.0 {
+                let strength = (-t * contrast * key.intensity).clamp(0.0, 1.0);
+                return blend_colors(Rgbf::from(rgb), Rgbf::from(key.rgb), strength).into_tuple();
+            }
+
+            let strength = (t * contrast * ambient.intensity).clamp(0.0, 1.0);
+            let mixed = blend_colors(Rgbf::from(rgb), Rgbf::from(ambient.rgb), strength);
+            let shift = (t * contrast * SHADOW_SHIFT_V).clamp(0.0, 1.0);
+            return relative_color_shift(mixed.into_tuple(), 0.0, shift);
+        })
+        .collect();
+}
+
+pub fn compute(rgb: FTuple, lights: &[Light], sliders: &[(Channel, bool)]) -> Frame {
+    let (_, s, v) = rgb_to_hsluv(rgb.0, rgb.1, rgb.2);
+
+    let sliders = sliders
+        .iter()
+        .map(|&(channel, luminosity_lock)| {
+            let position = match channel {
+                Channel::Red => rgb.0,
+                Channel::Green => rgb.1,
+                Channel::Blue => rgb.2,
+                Channel::Saturation => s / 100.0,
+                Channel::Value => v / 100.0,
+            };
+
+            return SliderFrame {
+                left: apply_channel(rgb, channel, SLIDER_MIN, luminosity_lock),
+                right: apply_channel(rgb, channel, SLIDER_MAX, luminosity_lock),
+                position,
+            };
+        })
+        .collect();
+
+    return Frame {
+        mixes: lights.iter().map(|&light| light_mix(rgb, light)).collect(),
+        sliders,
+    };
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::slider::channel_position;
+
+    #[test]
+    fn compute_matches_single_calls() {
+        let rgb = (176.0 / 255.0, 95.0 / 255.0, 110.0 / 255.0);
+        let main = Light::from(((230.0 / 255.0, 205.0 / 255.0, 167.0 / 255.0), 0.3, false));
+        let ambient = Light::from(((73.0 / 255.0, 120.0 / 255.0, 234.0 / 255.0), 0.2, true));
+        let sliders = vec![
+            (Channel::Red, true),
+            (Channel::Green, true),
+            (Channel::Blue, true),
+            (Channel::Saturation, true),
+            (Channel::Value, false),
+        ];
+
+        let frame = compute(rgb, &[main, ambient], &sliders);
+
+        assert_eq!(frame.mixes, vec![illuminate(rgb, main), shade(rgb, ambient)]);
+        assert_eq!(frame.sliders.len(), sliders.len());
+
+        for (slider, (channel, lock)) in frame.sliders.iter().zip(sliders) {
+            assert!((slider.position - channel_position(rgb, channel)).abs() < 0.0000001);
+            assert_eq!(slider.left, apply_channel(rgb, channel, 0.0, lock));
+            assert_eq!(slider.right, apply_channel(rgb, channel, 1.0, lock));
+        }
+    }
+
+    #[test]
+    fn mix_lights_matches_light_mix() {
+        let lights = [
+            Light::from(((230.0 / 255.0, 205.0 / 255.0, 167.0 / 255.0), 0.3, false)),
+            Light::from(((73.0 / 255.0, 120.0 / 255.0, 234.0 / 255.0), 0.2, true)),
+            Light::from(((1.0, 0.5, 0.2), 0.6, false)),
+        ];
+        let colors: Vec<f64> = (0..300).map(|i| (i as f64 * 0.618034) % 1.0).collect();
+        let mut out = vec![0.0; colors.len() * lights.len()];
+
+        mix_lights(&colors, &lights, &mut out, 3, 4);
+        for (i, rgb) in colors.chunks_exact(3).enumerate() {
+            for (j, &light) in lights.iter().enumerate() {
+                let at = (i * lights.len() + j) * 3;
+                let (r, g, b) = light_mix((rgb[0], rgb[1], rgb[2]), light);
+                assert_eq!(&out[at..at + 3], &[r, g, b]);
+            }
+        }
+
+        let rgba: Vec<f32> = colors[..4 * 50].iter().map(|&c| c as f32).collect();
+        let mut out = vec![0.0f32; rgba.len() * lights.len()];
+        mix_lights(&rgba, &lights, &mut out, 4, 1);
+        let color = &rgba[4..8];
+        let rgb = (color[0] as f64, color[1] as f64, color[2] as f64);
+        let (r, g, b) = light_mix(rgb, lights[2]);
+        assert_eq!(&out[20..24], &[r as f32, g as f32, b as f32, color[3]]);
+    }
+
+    #[test]
+    fn shade_ramp_spans_lit_to_shadow() {
+        let rgb = (176.0 / 255.0, 95.0 / 255.0, 110.0 / 255.0);
+        let key = Light::from(((230.0 / 255.0, 205.0 / 255.0, 167.0 / 255.0), 0.3, false));
+        let ambient = Light::from(((73.0 / 255.0, 120.0 / 255.0, 234.0 / 255.0), 0.2, true));
+
+        let ramp = shade_ramp(rgb, key, ambient, 9, 1.0);
+        assert_eq!(ramp.len(), 9);
+        assert_eq!(ramp[0], illuminate(rgb, key));
+        assert_eq!(ramp[8], shade(rgb, ambient));
+        let (r, g, b) = ramp[4];
+        assert!((r - rgb.0).abs() < 1e-9 && (g - rgb.1).abs() < 1e-9 && (b - rgb.2).abs() < 1e-9);
+
+        // more contrast moves the shadow end further from the local color
+        let deeper = shade_ramp(rgb, key, ambient, 9, 2.0);
+        let (_, _, v) = rgb_to_hsluv(ramp[8].0, ramp[8].1, ramp[8].2);
+        let (_, _, deeper_v) = rgb_to_hsluv(deeper[8].0, deeper[8].1, deeper[8].2);
+        assert!(deeper_v < v);
+        assert!(shade_ramp(rgb, key, ambient, 0, 1.0).is_empty());
+    }
+}
@@ -0,0 +1,57 @@
+use crate::color_ops::FTuple;
+
+/// Bytes per pixel of the RGBA8 buffers handed to `QImage`.
+pub const BYTES_PER_PIXEL: usize = 4;
+
+pub fn channel_to_u8(c: f64) -> u8 {
+    return (c.clamp(0.0, 1.0) * 255.0 + 0.5) as u8;
+}
+
+pub fn write_pixel(pixel: &mut [u8], (r, g, b): FTuple) {
+    pixel[0] = channel_to_u8(r);
+    pixel[1] = channel_to_u8(g);
+    pixel[2] = channel_to_u8(b);
+    pixel[3] = 255;
+}
+
+pub fn lerp(a: FTuple, b: FTuple, t: f64) -> FTuple {
+    return (
+        a.0 + (b.0 - a.0) * t,
+        a.1 + (b.1 - a.1) * t,
+        a.2 + (b.2 - a.2) * t,
+    );
+}
+
+/// Fills `scanline` with a linear gradient from `a` to `b`, one RGBA8 pixel
+/// per column.
+pub fn fill_gradient(a: FTuple, b: FTuple, scanline: &mut [u8]) {
+    let width = scanline.len() / BYTES_PER_PIXEL;
+    let f_width = if width > 0 { width as f64 } else { 1.0f64 };
+
+    for (i, pixel) in scanline.chunks_exact_mut(BYTES_PER_PIXEL).enumerate() {
+        write_pixel(pixel, lerp(a, b, i as f64 / f_width));
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn fill_gradient_works() {
+        let mut scanline = vec![0u8; 4 * BYTES_PER_PIXEL];
+        fill_gradient((0.0, 0.0, 0.0), (1.0, 0.5, 0.0), &mut scanline);
+
+        assert_eq!(
+            scanline,
+            vec![0, 0, 0, 255, 64, 32, 0, 255, 128, 64, 0, 255, 191, 96, 0, 255]
+        );
+    }
+
+    #[test]
+    fn channel_to_u8_clamps() {
+        assert_eq!(channel_to_u8(-0.5), 0);
+        assert_eq!(channel_to_u8(1.5), 255);
+        assert_eq!(channel_to_u8(0.5), 128);
+    }
+}
@@ -0,0 +1,554 @@
+//! HSLuv lightness histogram of a document, built from tiles.
+//!
+//! The document is split into `tile_size` square tiles, each keeping its own
+//! histogram and a hash of the pixels it was built from. Tiles are read by
+//! the caller (Krita's `pixelData` has to be called from Python) and handed
+//! to `compute_tiles`, which spreads them over worker threads. A tile whose
+//! pixels hash the same as last time is not counted again, so rescanning an
+//! unchanged document only costs the hashing.
+use crate::hsluv_lut::{linear_u16, linear_u8, y_to_l};
+use std::sync::atomic::{AtomicBool, AtomicUsize, Ordering};
+use std::sync::OnceLock;
+
+pub const BINS: usize = 256;
+pub const DEFAULT_TILE_SIZE: usize = 256;
+
+/// Resolution of the luminance to bin table, fine enough that no bin edge
+/// moves by more than a tenth of a bin.
+const Y_STEPS: usize = 1 << 14;
+
+// luminance row of the linear sRGB to XYZ matrix
+const Y_R: f64 = 0.21263900587151;
+const Y_G: f64 = 0.71516867876775;
+const Y_B: f64 = 0.072192315360733;
+
+pub type Bins = [u32; BINS];
+
+/// Channel depth of Krita's RGBA pixel data, which is stored as BGRA.
+/// Integer depths are sRGB encoded, float depths linear.
+#[derive(Clone, Copy, PartialEq, Debug)]
+pub enum Depth {
+    U8,
+    U16,
+    F16,
+    F32,
+}
+
+impl Depth {
+    /// Parses Krita's `colorDepth()` names.
+    pub fn parse(name: &str) -> Option<Self> {
+        return match name {
+            "U8" => Some(Depth::U8),
+            "U16" => Some(Depth::U16),
+            "F16" => Some(Depth::F16),
+            "F32" => Some(Depth::F32),
+            _ => None,
+        };
+    }
+
+    pub fn bytes_per_pixel(self) -> usize {
+        return match self {
+            Depth::U8 => 4,
+            Depth::U16 | Depth::F16 => 8,
+            Depth::F32 => 16,
+        };
+    }
+}
+
+fn f16_to_f32(bits: u16) -> f32 {
+    let sign = if bits & 0x8000 != 0 { -1.0 } else { 1.0 };
+    let exponent = ((bits >> 10) & 0x1f) as i32;
+    let mantissa = (bits & 0x3ff) as f32;
+
+    return sign
+        * match exponent {
+            0 => mantissa * 2f32.powi(-24),
+            0x1f if mantissa == 0.0 => f32::INFINITY,
+            0x1f => f32::NAN,
+            _ => (1.0 + mantissa / 1024.0) * 2f32.powi(exponent - 15),
+        };
+}
+
+fn y_bins() -> &'static [u8] {
+    static TABLE: OnceLock<Vec<u8>> = OnceLock::new();
+    return TABLE.get_or_init(|| {
+        (0..=Y_STEPS)
+            .map(|i| lightness_bin(y_to_l(i as f64 / Y_STEPS as f64) / 100.0) as u8)
+            .collect()
+    });
+}
+
+fn lightness_bin(l: f64) -> usize {
+    return ((l * BINS as f64) as usize).min(BINS - 1);
+}
+
+/// Histogram bin of the HSLuv lightness of a linear RGB color. HSLuv
+/// lightness only depends on luminance.
+pub fn luminance_bin(r: f64, g: f64, b: f64) -> usize {
+    let y = (Y_R * r + Y_G * g + Y_B * b).clamp(0.0, 1.0);
+    return y_bins()[(y * Y_STEPS as f64 + 0.5) as usize] as usize;
+}
+
+/// Adds every non transparent pixel of `pixels` to `bins`.
+pub fn accumulate(bins: &mut Bins, pixels: &[u8], depth: Depth) {
+    match depth {
+        Depth::U8 => {
+            let linear = linear_u8();
+            for px in pixels.chunks_exact(4) {
+                if px[3] == 0 {
+                    continue;
+                }
+                let bin = luminance_bin(
+                    linear[px[2] as usize],
+                    linear[px[1] as usize],
+                    linear[px[0] as usize],
+                );
+                bins[bin] += 1;
+            }
+        }
+        Depth::U16 => {
+            let linear = linear_u16();
+            for px in pixels.chunks_exact(8) {
+                let c = |i: usize| u16::from_le_bytes([px[i * 2], px[i * 2 + 1]]) as usize;
+                if c(3) == 0 {
+                    continue;
+                }
+                bins[luminance_bin(linear[c(2)], linear[c(1)], linear[c(0)])] += 1;
+            }
+        }
+        Depth::F16 => {
+            for px in pixels.chunks_exact(8) {
+                let c = |i: usize| f16_to_f32(u16::from_le_bytes([px[i * 2], px[i * 2 + 1]])) as f64;
+                if c(3) <= 0.0 {
+                    continue;
+                }
+                bins[luminance_bin(c(2), c(1), c(0))] += 1;
+            }
+        }
+        Depth::F32 => {
+            for px in pixels.chunks_exact(16) {
+                let c = |i: usize| {
+                    f32::from_le_bytes([px[i * 4], px[i * 4 + 1], px[i * 4 + 2], px[i * 4 + 3]]) as f64
+                };
+                if c(3) <= 0.0 {
+                    continue;
+                }
+                bins[luminance_bin(c(2), c(1), c(0))] += 1;
+            }
+        }
+    }
+}
+
+/// Linear RGB of one pixel, None when it is fully transparent. `accumulate`
+/// keeps its own loop per depth, going through this per pixel is about 30%
+/// slower there.
+pub fn decode_linear(px: &[u8], depth: Depth) -> Option<(f64, f64, f64)> {
+    match depth {
+        Depth::U8 => {
+            if px[3] == 0 {
+                return None;
+            }
+            let linear = linear_u8();
+            return Some((linear[px[2] as usize], linear[px[1] as usize], linear[px[0] as usize]));
+        }
+        Depth::U16 => {
+            let c = |i: usize| u16::from_le_bytes([px[i * 2], px[i * 2 + 1]]) as usize;
+            if c(3) == 0 {
+                return None;
+            }
+            let linear = linear_u16();
+            return Some((linear[c(2)], linear[c(1)], linear[c(0)]));
+        }
+        Depth::F16 => {
+            let c = |i: usize| f16_to_f32(u16::from_le_bytes([px[i * 2], px[i * 2 + 1]])) as f64;
+            if c(3) <= 0.0 {
+                return None;
+            }
+            return Some((c(2), c(1), c(0)));
+        }
+        Depth::F32 => {
+            let c = |i: usize| {
+                f32::from_le_bytes([px[i * 4], px[i * 4 + 1], px[i * 4 + 2], px[i * 4 + 3]]) as f64
+            };
+            if c(3) <= 0.0 {
+                return None;
+            }
+            return Some((c(2), c(1), c(0)));
+        }
+    }
+}
+
+/// FxHash style hash over 8 byte words, only used to notice changed tiles.
+pub fn hash_bytes(bytes: &[u8]) -> u64 {
+    const K: u64 = 0x51_7c_c1_b7_27_22_0a_95;
+
+    let mut hash = bytes.len() as u64;
+    let mut words = bytes.chunks_exact(8);
+    for word in &mut words {
+        let word = u64::from_le_bytes(word.try_into().unwrap());
+        hash = (hash.rotate_left(5) ^ word).wrapping_mul(K);
+    }
+    for &byte in words.remainder() {
+        hash = (hash.rotate_left(5) ^ byte as u64).wrapping_mul(K);
+    }
+    return hash;
+}
+
+/// A tile's pixels, with the hash it had last time it was counted.
+pub struct TileJob<'a> {
+    pub index: usize,
+    pub previous_hash: Option<u64>,
+    pub pixels: &'a [u8],
+}
+
+pub struct TileResult {
+    pub index: usize,
+    pub hash: u64,
+    /// None when the pixels hash the same as before.
+    pub bins: Option<Box<Bins>>,
+}
+
+/// Hashes and counts `jobs` on up to `threads` threads. Tiles not started
+/// before `cancel` is set are left out of the result.
+pub fn compute_tiles(
+    jobs: &[TileJob],
+    depth: Depth,
+    threads: usize,
+    cancel: &AtomicBool,
+) -> Vec<TileResult> {
+    let next = AtomicUsize::new(0);
+    let work = || {
+        let mut results = Vec::new();
+        loop {
+            if cancel.load(Ordering::Relaxed) {
+                break;
+            }
+            let i = next.fetch_add(1, Ordering::Relaxed);
+            let Some(job) = jobs.get(i) else {
+                break;
+            };
+
+            let hash = hash_bytes(job.pixels);
+            let bins = if job.previous_hash == Some(hash) {
+                None
+            } else {
+                let mut bins = Box::new([0u32; BINS]);
+                accumulate(&mut bins, job.pixels, depth);
+                Some(bins)
+            };
+            results.push(TileResult {
+                index: job.index,
+                hash,
+                bins,
+            });
+        }
+        return results;
+    };
+
+    let threads = threads.clamp(1, jobs.len().max(1));
+    if threads == 1 {
+        return work();
+    }
+
+    return std::thread::scope(|scope| {
+        let workers: Vec<_> = (0..threads).map(|_| scope.spawn(work)).collect();
+        workers
+            .into_iter()
+            .flat_map(|worker| worker.join().unwrap())
+            .collect()
+    });
+}
+
+#[derive(Clone, Default)]
+struct Tile {
+    bins: Option<Box<Bins>>,
+    hash: Option<u64>,
+    dirty: bool,
+}
+
+/// Per tile histograms of a `width` x `height` document and their sum.
+pub struct TileGrid {
+    width: usize,
+    height: usize,
+    tile_size: usize,
+    columns: usize,
+    tiles: Vec<Tile>,
+    total: [u64; BINS],
+    rescan_cursor: usize,
+    version: u64,
+}
+
+impl TileGrid {
+    pub fn new(width: usize, height: usize, tile_size: usize) -> Self {
+        let tile_size = tile_size.max(1);
+        let columns = width.div_ceil(tile_size);
+        let rows = height.div_ceil(tile_size);
+        let tile = Tile {
+            dirty: true,
+            ..Default::default()
+        };
+
+        return Self {
+            width,
+            height,
+            tile_size,
+            columns,
+            tiles: vec![tile; columns * rows],
+            total: [0; BINS],
+            rescan_cursor: 0,
+            version: 0,
+        };
+    }
+
+    pub fn tile_count(&self) -> usize {
+        return self.tiles.len();
+    }
+
+    /// Bumped every time the histogram changes.
+    pub fn version(&self) -> u64 {
+        return self.version;
+    }
+
+    /// (x, y, width, height) of tile `index`, clipped to the document.
+    pub fn rect(&self, index: usize) -> (usize, usize, usize, usize) {
+        let x = (index % self.columns) * self.tile_size;
+        let y = (index / self.columns) * self.tile_size;
+        return (
+            x,
+            y,
+            self.tile_size.min(self.width - x),
+            self.tile_size.min(self.height - y),
+        );
+    }
+
+    pub fn hash(&self, index: usize) -> Option<u64> {
+        return self.tiles[index].hash;
+    }
+
+    /// Marks every tile overlapping the rectangle as needing a read.
+    pub fn invalidate(&mut self, x: usize, y: usize, width: usize, height: usize) {
+        if width == 0 || height == 0 || x >= self.width || y >= self.height {
+            return;
+        }
+        let right = (x + width).min(self.width).div_ceil(self.tile_size);
+        let bottom = (y + height).min(self.height).div_ceil(self.tile_size);
+
+        for row in y / self.tile_size..bottom {
+            for column in x / self.tile_size..right {
+                self.tiles[row * self.columns + column].dirty = true;
+            }
+        }
+    }
+
+    pub fn invalidate_all(&mut self) {
+        self.tiles.iter_mut().for_each(|tile| tile.dirty = true);
+    }
+
+    /// True once every tile has been counted and nothing is dirty.
+    pub fn complete(&self) -> bool {
+        return self.tiles.iter().all(|tile| !tile.dirty && tile.bins.is_some());
+    }
+
+    /// Up to `limit` tiles to read next. Dirty tiles come first; when there
+    /// are none, the next tiles of a round robin rescan are marked dirty, so
+    /// edits anywhere in the document are picked up eventually.
+    pub fn next_tiles(&mut self, limit: usize) -> Vec<usize> {
+        let dirty: Vec<usize> = (0..self.tiles.len())
+            .filter(|&i| self.tiles[i].dirty)
+            .take(limit)
+            .collect();
+        if !dirty.is_empty() || self.tiles.is_empty() {
+            return dirty;
+        }
+
+        let count = limit.min(self.tiles.len());
+        let rescan: Vec<usize> = (0..count)
+            .map(|n| (self.rescan_cursor + n) % self.tiles.len())
+            .collect();
+        self.rescan_cursor = (self.rescan_cursor + count) % self.tiles.len();
+        for &i in &rescan {
+            self.tiles[i].dirty = true;
+        }
+        return rescan;
+    }
+
+    /// Stores computed tiles, returns how many of them changed.
+    pub fn apply(&mut self, results: Vec<TileResult>) -> usize {
+        let mut changed = 0;
+
+        for result in results {
+            let tile = &mut self.tiles[result.index];
+            tile.dirty = false;
+            tile.hash = Some(result.hash);
+
+            let Some(bins) = result.bins else {
+                continue;
+            };
+            if let Some(old) = &tile.bins {
+                for (total, &count) in self.total.iter_mut().zip(old.iter()) {
+                    *total -= count as u64;
+                }
+            }
+            for (total, &count) in self.total.iter_mut().zip(bins.iter()) {
+                *total += count as u64;
+            }
+            tile.bins = Some(bins);
+            changed += 1;
+        }
+
+        if changed > 0 {
+            self.version += 1;
+        }
+        return changed;
+    }
+
+    pub fn histogram(&self) -> &[u64; BINS] {
+        return &self.total;
+    }
+
+    /// Lightness in [0, 1] below which `p` of the counted pixels fall,
+    /// interpolated within the bin. None while nothing was counted.
+    pub fn percentile(&self, p: f64) -> Option<f64> {
+        let count: u64 = self.total.iter().sum();
+        if count == 0 {
+            return None;
+        }
+
+        let rank = p.clamp(0.0, 1.0) * count as f64;
+        let mut seen = 0.0;
+        for (bin, &n) in self.total.iter().enumerate() {
+            let n = n as f64;
+            if n > 0.0 && seen + n >= rank {
+                let within = ((rank - seen) / n).clamp(0.0, 1.0);
+                return Some((bin as f64 + within) / BINS as f64);
+            }
+            seen += n;
+        }
+        return Some(1.0);
+    }
+}
+
+#[cfg(test)]
+mod test {
+    use super::*;
+
+    fn solid_u8(width: usize, height: usize, bgra: [u8; 4]) -> Vec<u8> {
+        return bgra.repeat(width * height);
+    }
+
+    fn count(grid: &mut TileGrid, pixels: impl Fn(usize) -> Vec<u8>, depth: Depth) -> usize {
+        let indices = grid.next_tiles(usize::MAX);
+        let buffers: Vec<Vec<u8>> = indices.iter().map(|&i| pixels(i)).collect();
+        let jobs: Vec<TileJob> = indices
+            .iter()
+            .zip(&buffers)
+            .map(|(&index, pixels)| TileJob {
+                index,
+                previous_hash: grid.hash(index),
+                pixels,
+            })
+            .collect();
+        let results = compute_tiles(&jobs, depth, 4, &AtomicBool::new(false));
+        return grid.apply(results);
+    }
+
+    #[test]
+    fn luminance_bin_matches_hsluv_lightness() {
+        for &(r, g, b) in &[(0.0, 0.0, 0.0), (1.0, 1.0, 1.0), (0.8, 0.3, 0.1), (0.002, 0.001, 0.0)] {
+            let (_, _, l) = hsluv::rgb_to_hsluv(r, g, b);
+            let expected = l / 100.0 * BINS as f64;
+            let bin = luminance_bin(
+                crate::hsluv_lut::to_linear(r),
+                crate::hsluv_lut::to_linear(g),
+                crate::hsluv_lut::to_linear(b),
+            ) as f64;
+            assert!((bin - expected.floor()).abs() <= 1.0, "{bin} {expected}");
+        }
+    }
+
+    #[test]
+    fn depths_agree() {
+        let mut u8_bins = [0u32; BINS];
+        let mut u16_bins = [0u32; BINS];
+        let mut f16_bins = [0u32; BINS];
+        let mut f32_bins = [0u32; BINS];
+
+        accumulate(&mut u8_bins, &[0, 128, 255, 255], Depth::U8);
+        let u16_px: Vec<u8> = [0u16, 128 * 257, 65535, 65535]
+            .iter()
+            .flat_map(|c| c.to_le_bytes())
+            .collect();
+        accumulate(&mut u16_bins, &u16_px, Depth::U16);
+
+        let linear = [0.0, crate::hsluv_lut::to_linear(128.0 / 255.0), 1.0, 1.0];
+        let f32_px: Vec<u8> = linear.iter().flat_map(|&c| (c as f32).to_le_bytes()).collect();
+        accumulate(&mut f32_bins, &f32_px, Depth::F32);
+        // 0, ~0.2158 (0x32e8), 1, 1
+        let f16_px: Vec<u8> = [0x0000u16, 0x32e8, 0x3c00, 0x3c00]
+            .iter()
+            .flat_map(|c| c.to_le_bytes())
+            .collect();
+        accumulate(&mut f16_bins, &f16_px, Depth::F16);
+
+        assert_eq!(u8_bins, u16_bins);
+        assert_eq!(u8_bins, f32_bins);
+        assert_eq!(u8_bins, f16_bins);
+        assert!((f16_to_f32(0x32e8) - 0.2158).abs() < 0.001);
+        assert_eq!(f16_to_f32(0xbc00), -1.0);
+    }
+
+    #[test]
+    fn grid_updates_incrementally() {
+        let (width, height, tile) = (100, 70, 32);
+        let mut grid = TileGrid::new(width, height, tile);
+        assert_eq!(grid.tile_count(), 4 * 3);
+        assert_eq!(grid.rect(11), (96, 64, 4, 6));
+
+        let gray = |i: usize| {
+            let (_, _, w, h) = TileGrid::new(width, height, tile).rect(i);
+            return solid_u8(w, h, [128, 128, 128, 255]);
+        };
+        assert_eq!(count(&mut grid, gray, Depth::U8), 12);
+        assert!(grid.complete());
+        assert_eq!(grid.histogram().iter().sum::<u64>(), (width * height) as u64);
+        let median = grid.percentile(0.5).unwrap();
+
+        // nothing dirty: the rescan rereads tiles but finds nothing changed
+        let version = grid.version();
+        assert_eq!(count(&mut grid, gray, Depth::U8), 0);
+        assert_eq!(grid.version(), version);
+
+        // only the first tile turns white
+        grid.invalidate(0, 0, 10, 10);
+        assert_eq!(grid.next_tiles(usize::MAX), vec![0]);
+        grid.invalidate(0, 0, 10, 10);
+        let changed = count(
+            &mut grid,
+            |i| match i {
+                0 => solid_u8(tile, tile, [255, 255, 255, 255]),
+                _ => gray(i),
+            },
+            Depth::U8,
+        );
+        assert_eq!(changed, 1);
+        assert_eq!(grid.histogram()[BINS - 1], (tile * tile) as u64);
+        assert_eq!(grid.histogram().iter().sum::<u64>(), (width * height) as u64);
+        assert_eq!((grid.percentile(0.5).unwrap() * BINS as f64) as usize, (median * BINS as f64) as usize);
+        assert_eq!(grid.percentile(1.0).unwrap(), 1.0);
+    }
+
+    #[test]
+    fn cancel_skips_remaining_tiles() {
+        let pixels = solid_u8(16, 16, [0, 0, 0, 255]);
+        let jobs: Vec<TileJob> = (0..8)
+            .map(|index| TileJob {
+                index,
+                previous_hash: None,
+                pixels: &pixels,
+            })
+            .collect();
+
+        assert!(compute_tiles(&jobs, Depth::U8, 4, &AtomicBool::new(true)).is_empty());
+        assert_eq!(compute_tiles(&jobs, Depth::U8, 4, &AtomicBool::new(false)).len(), 8);
+    }
+}
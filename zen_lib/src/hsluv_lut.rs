@@ -0,0 +1,430 @@
+//! Optional lookup tables for `rgb_to_hsluv`.
+//!
+//! Once a table is installed with `install`, every HSLuv conversion in
+//! lib_zen goes through `rgb_to_hsluv` below:
+//!
+//! - 8 and 16 bit inputs (all channels exact multiples of 1/255 or 1/65535)
+//!   are linearized through 1-D tables. The tables hold the exact f64
+//!   values, so this path matches `hsluv::rgb_to_hsluv` to rounding error.
+//! - any other input is looked up in a `size`^3 grid of CIELUV (L, u, v)
+//!   samples with trilinear interpolation. Hue and saturation are derived
+//!   exactly from the interpolated (L, u, v). With the default 65^3 grid
+//!   the result stays within `MAX_L_ERROR` of the exact lightness and within
+//!   `MAX_LUV_ERROR` (euclidean, in LUV units) of the exact color, which is
+//!   well below a just noticeable difference. Converting the result back
+//!   with `hsluv_to_rgb` lands within `MAX_RGB_ERROR` (about 1.5/255) of the
+//!   input on every channel.
+//!
+//! The grid is stored little-endian in a cache file that is memory-mapped on
+//! later loads, so it is only ever built once per machine.
+use hsluv::rgb_to_hsluv as exact_rgb_to_hsluv;
+#[cfg(test)]
+use hsluv::hsluv_to_rgb;
+use memmap2::Mmap;
+use std::fs::File;
+use std::io;
+use std::path::Path;
+use std::sync::{Arc, OnceLock, RwLock};
+
+pub const DEFAULT_SIZE: usize = 65;
+pub const MAX_L_ERROR: f64 = 0.05;
+pub const MAX_LUV_ERROR: f64 = 0.25;
+pub const MAX_RGB_ERROR: f64 = 0.006;
+
+const MAGIC: &[u8; 8] = b"ZENHLUT\0";
+const VERSION: u32 = 1;
+const HEADER_LEN: usize = 16;
+
+const M_INV: [[f64; 3]; 3] = [
+    [0.41239079926595, 0.35758433938387, 0.18048078840183],
+    [0.21263900587151, 0.71516867876775, 0.072192315360733],
+    [0.019330818715591, 0.11919477979462, 0.95053215224966],
+];
+const M: [[f64; 3]; 3] = [
+    [3.240969941904521, -1.537383177570093, -0.498610760293],
+    [-0.96924363628087, 1.87596750150772, 0.041555057407175],
+    [0.055630079696993, -0.20397695888897, 1.056971514242878],
+];
+const REF_U: f64 = 0.19783000664283;
+const REF_V: f64 = 0.46831999493879;
+const KAPPA: f64 = 903.2962962;
+const EPSILON: f64 = 0.0088564516;
+
+pub fn to_linear(c: f64) -> f64 {
+    if c > 0.04045 {
+        return ((c + 0.055) / 1.055).powf(2.4);
+    }
+    return c / 12.92;
+}
+
+/// sRGB to linear for every 8 bit value.
+pub fn linear_u8() -> &'static [f64] {
+    static TABLE: OnceLock<Vec<f64>> = OnceLock::new();
+    return TABLE.get_or_init(|| (0..=255).map(|i| to_linear(i as f64 / 255.0)).collect());
+}
+
+/// sRGB to linear for every 16 bit value.
+pub fn linear_u16() -> &'static [f64] {
+    static TABLE: OnceLock<Vec<f64>> = OnceLock::new();
+    return TABLE.get_or_init(|| (0..=65535).map(|i| to_linear(i as f64 / 65535.0)).collect());
+}
+
+pub fn y_to_l(y: f64) -> f64 {
+    if y <= EPSILON {
+        return y * KAPPA;
+    }
+    return 116.0 * y.cbrt() - 16.0;
+}
+
+/// Linear RGB to CIELUV.
+pub fn linear_to_luv((r, g, b): (f64, f64, f64)) -> (f64, f64, f64) {
+    let x = M_INV[0][0] * r + M_INV[0][1] * g + M_INV[0][2] * b;
+    let y = M_INV[1][0] * r + M_INV[1][1] * g + M_INV[1][2] * b;
+    let z = M_INV[2][0] * r + M_INV[2][1] * g + M_INV[2][2] * b;
+
+    let l = y_to_l(y);
+    if l == 0.0 {
+        return (0.0, 0.0, 0.0);
+    }
+
+    let divider = x + 15.0 * y + 3.0 * z;
+    let u = 13.0 * l * (4.0 * x / divider - REF_U);
+    let v = 13.0 * l * (9.0 * y / divider - REF_V);
+
+    return (l, u, v);
+}
+
+fn max_chroma(l: f64, h: f64) -> f64 {
+    let h = h.to_radians();
+    let (sin_h, cos_h) = h.sin_cos();
+
+    let sub1 = (l + 16.0).powi(3) / 1560896.0;
+    let sub2 = if sub1 > EPSILON { sub1 } else { l / KAPPA };
+
+    let mut min = f64::MAX;
+    for [m1, m2, m3] in M {
+        for t in [0.0, 1.0] {
+            let top1 = (284517.0 * m1 - 94839.0 * m3) * sub2;
+            let top2 = (838422.0 * m3 + 769860.0 * m2 + 731718.0 * m1) * l * sub2
+                - 769860.0 * t * l;
+            let bottom = (632260.0 * m3 - 126452.0 * m2) * sub2 + 126452.0 * t;
+
+            let length = (top2 / bottom) / (sin_h - (top1 / bottom) * cos_h);
+            if length >= 0.0 && length < min {
+                min = length;
+            }
+        }
+    }
+
+    return min;
+}
+
+/// CIELUV to HSLuv, (h, s, l) in the same ranges as `hsluv::rgb_to_hsluv`.
+pub fn luv_to_hsluv((l, u, v): (f64, f64, f64)) -> (f64, f64, f64) {
+    let c = (u * u + v * v).sqrt();
+    let h = if c < 0.00000001 {
+        0.0
+    } else {
+        let h = v.atan2(u).to_degrees();
+        if h < 0.0 {
+            h + 360.0
+        } else {
+            h
+        }
+    };
+
+    if l > 99.9999999 {
+        return (h, 0.0, 100.0);
+    }
+    if l < 0.00000001 {
+        return (h, 0.0, 0.0);
+    }
+
+    return (h, c / max_chroma(l, h) * 100.0, l);
+}
+
+enum Table {
+    Owned(Vec<u8>),
+    Mapped(Mmap),
+}
+
+pub struct HsluvLut {
+    size: usize,
+    table: Table,
+}
+
+impl HsluvLut {
+    /// Samples (L, u, v) at every grid point, `size` points per channel.
+    pub fn build(size: usize) -> Self {
+        let size = size.max(2);
+        let step = (size - 1) as f64;
+        let mut bytes = Vec::<u8>::with_capacity(HEADER_LEN + size * size * size * 12);
+
+        bytes.extend_from_slice(MAGIC);
+        bytes.extend_from_slice(&VERSION.to_le_bytes());
+        bytes.extend_from_slice(&(size as u32).to_le_bytes());
+
+        for ri in 0..size {
+            for gi in 0..size {
+                for bi in 0..size {
+                    let (l, u, v) = linear_to_luv((
+                        to_linear(ri as f64 / step),
+                        to_linear(gi as f64 / step),
+                        to_linear(bi as f64 / step),
+                    ));
+
+                    bytes.extend_from_slice(&(l as f32).to_le_bytes());
+                    bytes.extend_from_slice(&(u as f32).to_le_bytes());
+                    bytes.extend_from_slice(&(v as f32).to_le_bytes());
+                }
+            }
+        }
+
+        return Self {
+            size,
+            table: Table::Owned(bytes),
+        };
+    }
+
+    /// Maps a cache file written by `save`.
+    pub fn load(path: &Path) -> io::Result<Self> {
+        let file = File::open(path)?;
+        // SAFETY: the cache file is only ever replaced atomically by `save`,
+        // never written in place.
+        let map = unsafe { Mmap::map(&file)? };
+
+        let invalid = |msg| io::Error::new(io::ErrorKind::InvalidData, msg);
+        if map.len() < HEADER_LEN || &map[0..8] != MAGIC {
+            return Err(invalid("not an hsluv lut file"));
+        }
+
+        let version = u32::from_le_bytes(map[8..12].try_into().unwrap());
+        let size = u32::from_le_bytes(map[12..16].try_into().unwrap()) as usize;
+        if version != VERSION {
+            return Err(invalid("unsupported hsluv lut version"));
+        }
+        if size < 2 || map.len() != HEADER_LEN + size * size * size * 12 {
+            return Err(invalid("truncated hsluv lut file"));
+        }
+
+        return Ok(Self {
+            size,
+            table: Table::Mapped(map),
+        });
+    }
+
+    /// Loads the cache file at `path`, building and saving it first when it
+    /// is missing, stale or has a different size. Returns the table and
+    /// whether it came from the cache file.
+    pub fn load_or_build(path: &Path, size: usize) -> (Self, bool) {
+        if let Ok(lut) = Self::load(path) {
+            if lut.size == size {
+                return (lut, true);
+            }
+        }
+
+        let lut = Self::build(size);
+        // a read-only cache directory only costs the next launch a rebuild
+        let _ = lut.save(path);
+
+        return (lut, false);
+    }
+
+    pub fn save(&self, path: &Path) -> io::Result<()> {
+        if let Some(dir) = path.parent() {
+            std::fs::create_dir_all(dir)?;
+        }
+
+        let tmp = path.with_extension("tmp");
+        std::fs::write(&tmp, self.bytes())?;
+        return std::fs::rename(&tmp, path);
+    }
+
+    pub fn size(&self) -> usize {
+        return self.size;
+    }
+
+    fn bytes(&self) -> &[u8] {
+        return match &self.table {
+            Table::Owned(bytes) => bytes,
+            Table::Mapped(map) => map,
+        };
+    }
+
+    fn sample(&self, bytes: &[u8], ri: usize, gi: usize, bi: usize) -> [f64; 3] {
+        let offset = HEADER_LEN + ((ri * self.size + gi) * self.size + bi) * 12;
+        let read = |o: usize| f32::from_le_bytes(bytes[o..o + 4].try_into().unwrap()) as f64;
+
+        return [read(offset), read(offset + 4), read(offset + 8)];
+    }
+
+    /// Trilinear (L, u, v) lookup for gamma encoded rgb.
+    pub fn luv(&self, (r, g, b): (f64, f64, f64)) -> (f64, f64, f64) {
+        let bytes = self.bytes();
+        let step = (self.size - 1) as f64;
+
+        let split = |c: f64| {
+            let x = c.clamp(0.0, 1.0) * step;
+            let i = (x as usize).min(self.size - 2);
+            return (i, x - i as f64);
+        };
+        let (ri, rt) = split(r);
+        let (gi, gt) = split(g);
+        let (bi, bt) = split(b);
+
+        let mut out = [0.0f64; 3];
+        for (dr, wr) in [(0, 1.0 - rt), (1, rt)] {
+            for (dg, wg) in [(0, 1.0 - gt), (1, gt)] {
+                for (db, wb) in [(0, 1.0 - bt), (1, bt)] {
+                    let weight = wr * wg * wb;
+                    let corner = self.sample(bytes, ri + dr, gi + dg, bi + db);
+
+                    out[0] += corner[0] * weight;
+                    out[1] += corner[1] * weight;
+                    out[2] += corner[2] * weight;
+                }
+            }
+        }
+
+        return (out[0], out[1], out[2]);
+    }
+
+    pub fn rgb_to_hsluv(&self, (r, g, b): (f64, f64, f64)) -> (f64, f64, f64) {
+        if let (Some(r), Some(g), Some(b)) = (as_u8(r), as_u8(g), as_u8(b)) {
+            let table = linear_u8();
+            return luv_to_hsluv(linear_to_luv((table[r], table[g], table[b])));
+        }
+        if let (Some(r), Some(g), Some(b)) = (as_u16(r), as_u16(g), as_u16(b)) {
+            let table = linear_u16();
+            return luv_to_hsluv(linear_to_luv((table[r], table[g], table[b])));
+        }
+
+        return luv_to_hsluv(self.luv((r, g, b)));
+    }
+}
+
+fn as_quantized(c: f64, max: f64) -> Option<usize> {
+    let x = c * max;
+    let i = x.round();
+
+    if i >= 0.0 && i <= max && (x - i).abs() < 0.000001 {
+        return Some(i as usize);
+    }
+    return None;
+}
+
+fn as_u8(c: f64) -> Option<usize> {
+    return as_quantized(c, 255.0);
+}
+
+fn as_u16(c: f64) -> Option<usize> {
+    return as_quantized(c, 65535.0);
+}
+
+static LUT: RwLock<Option<Arc<HsluvLut>>> = RwLock::new(None);
+
+pub fn install(lut: Option<HsluvLut>) {
+    *LUT.write().unwrap() = lut.map(Arc::new);
+}
+
+pub fn installed() -> Option<Arc<HsluvLut>> {
+    return LUT.read().unwrap().clone();
+}
+
+/// `hsluv::rgb_to_hsluv`, through the installed table if there is one.
+pub fn rgb_to_hsluv(r: f64, g: f64, b: f64) -> (f64, f64, f64) {
+    return match LUT.read().unwrap().as_deref() {
+        Some(lut) => lut.rgb_to_hsluv((r, g, b)),
+        None => exact_rgb_to_hsluv(r, g, b),
+    };
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn samples() -> Vec<(f64, f64, f64)> {
+        // deterministic lcg, no rand dependency
+        let mut state: u64 = 0x2545F4914F6CDD1D;
+        let mut next = || {
+            state = state.wrapping_mul(6364136223846793005).wrapping_add(1442695040888963407);
+            return (state >> 11) as f64 / (1u64 << 53) as f64;
+        };
+
+        return (0..20000).map(|_| (next(), next(), next())).collect();
+    }
+
+    fn exact_luv((r, g, b): (f64, f64, f64)) -> (f64, f64, f64) {
+        return linear_to_luv((to_linear(r), to_linear(g), to_linear(b)));
+    }
+
+    #[test]
+    fn quantized_inputs_are_exact() {
+        let lut = HsluvLut::build(DEFAULT_SIZE);
+        let colors = vec![
+            (176.0 / 255.0, 95.0 / 255.0, 110.0 / 255.0),
+            (0.0, 52.0 / 255.0, 52.0 / 255.0),
+            (1000.0 / 65535.0, 40000.0 / 65535.0, 65535.0 / 65535.0),
+        ];
+
+        for (r, g, b) in colors {
+            let (h, s, l) = exact_rgb_to_hsluv(r, g, b);
+            let (_h, _s, _l) = lut.rgb_to_hsluv((r, g, b));
+
+            let err = 0.000001;
+            assert!((h - _h).abs() < err);
+            assert!((s - _s).abs() < err);
+            assert!((l - _l).abs() < err);
+        }
+    }
+
+    #[test]
+    fn float_inputs_stay_within_error_bound() {
+        let lut = HsluvLut::build(DEFAULT_SIZE);
+
+        for rgb in samples() {
+            let (l, u, v) = exact_luv(rgb);
+            let (_l, _u, _v) = lut.luv(rgb);
+
+            let luv_err = ((l - _l).powi(2) + (u - _u).powi(2) + (v - _v).powi(2)).sqrt();
+            assert!((l - _l).abs() < MAX_L_ERROR, "{:?}: {} vs {}", rgb, l, _l);
+            assert!(luv_err < MAX_LUV_ERROR, "{:?}: {}", rgb, luv_err);
+
+            let (h, s, l) = lut.rgb_to_hsluv(rgb);
+            let (r, g, b) = hsluv_to_rgb(h, s, l);
+            let rgb_err = (r - rgb.0).abs().max((g - rgb.1).abs()).max((b - rgb.2).abs());
+            assert!(rgb_err < MAX_RGB_ERROR, "{:?}: {}", rgb, rgb_err);
+        }
+    }
+
+    #[test]
+    fn luv_to_hsluv_matches_hsluv() {
+        for (r, g, b) in samples().into_iter().take(1000) {
+            let (h, s, l) = exact_rgb_to_hsluv(r, g, b);
+            let (_h, _s, _l) = luv_to_hsluv(exact_luv((r, g, b)));
+
+            let err = 0.000001;
+            assert!((h - _h).abs() < err);
+            assert!((s - _s).abs() < err);
+            assert!((l - _l).abs() < err);
+        }
+    }
+
+    #[test]
+    fn save_and_load_round_trips() {
+        let path = std::env::temp_dir().join(format!("zen_hsluv_lut_{}.bin", std::process::id()));
+        let lut = HsluvLut::build(9);
+        lut.save(&path).unwrap();
+
+        let loaded = HsluvLut::load(&path).unwrap();
+        assert_eq!(loaded.size(), 9);
+        assert_eq!(loaded.bytes(), lut.bytes());
+
+        let (_, from_cache) = HsluvLut::load_or_build(&path, 9);
+        assert!(from_cache);
+        let (_, from_cache) = HsluvLut::load_or_build(&path, 5);
+        assert!(!from_cache);
+
+        std::fs::remove_file(&path).unwrap();
+    }
+}
@@ -1,14 +1,92 @@
 use pyo3::prelude::*;
 
+mod batch;
+mod buffers;
+mod color_index;
 mod color_ops;
+mod display_lut;
+mod docker_state;
+mod gradient;
+mod histogram;
+mod hsluv_lut;
+mod palette;
+mod plane;
+mod slider;
 
 /// A Python module implemented in Rust.
 #[pymodule]
 #[pyo3(name = "lib_zen")]
 mod zen_lib {
     use super::*;
-    use crate::color_ops::{blend_colors, FTuple, Hsv, Rgbf};
-    use hsluv::{hsluv_to_rgb, rgb_to_hsluv};
+    use crate::batch::{fill_colors, map_colors, nth_color, Component};
+    use crate::buffers::{fill_bytes, new_array, overlaps, readable, writable};
+    use crate::color_index::{self, rgb_to_luv};
+    use crate::color_ops::{self, FTuple};
+    use crate::display_lut;
+    use crate::docker_state::{self, Light};
+    use crate::gradient::{fill_gradient, lerp, BYTES_PER_PIXEL};
+    use crate::histogram::{self, compute_tiles, Depth, TileGrid, TileJob};
+    use crate::slider::{apply_channel, channel_position, fill_channel, Channel};
+    use crate::hsluv_lut::{self, HsluvLut};
+    use crate::palette::{self, kmeans, sample_row, Sample};
+    use crate::plane::{self, fill_hue, fill_plane, PlaneMode};
+    use pyo3::buffer::{Element, PyBuffer};
+    use pyo3::exceptions::PyValueError;
+    use std::path::PathBuf;
+    use std::sync::atomic::{AtomicBool, Ordering};
+    use std::sync::{Arc, Mutex};
+
+    /// `threads`, or one per core when None.
+    fn thread_count(threads: Option<usize>) -> usize {
+        return threads.unwrap_or_else(|| {
+            std::thread::available_parallelism().map_or(1, |n| n.get())
+        });
+    }
+
+    fn parse_depth(depth: &str) -> PyResult<Depth> {
+        return Depth::parse(depth)
+            .ok_or_else(|| PyValueError::new_err(format!("unsupported color depth {depth}")));
+    }
+
+    /// The channel a `ColorSlider` edits.
+    #[pyclass(eq, eq_int, frozen, hash)]
+    #[derive(Clone, Copy, PartialEq, Hash)]
+    enum SliderChannel {
+        Red,
+        Green,
+        Blue,
+        Saturation,
+        Value,
+    }
+
+    impl From<SliderChannel> for Channel {
+        fn from(channel: SliderChannel) -> Self {
+            return match channel {
+                SliderChannel::Red => Channel::Red,
+                SliderChannel::Green => Channel::Green,
+                SliderChannel::Blue => Channel::Blue,
+                SliderChannel::Saturation => Channel::Saturation,
+                SliderChannel::Value => Channel::Value,
+            };
+        }
+    }
+
+    /// The color model of an `SvPlane`.
+    #[pyclass(eq, eq_int, frozen, hash)]
+    #[derive(Clone, Copy, PartialEq, Hash)]
+    enum PlaneKind {
+        Hsluv,
+        Hsv,
+    }
+
+    impl From<PlaneKind> for PlaneMode {
+        fn from(kind: PlaneKind) -> Self {
+            return match kind {
+                PlaneKind::Hsluv => PlaneMode::Hsluv,
+                PlaneKind::Hsv => PlaneMode::Hsv,
+            };
+        }
+    }
 
     #[pyfunction()]
     fn clamp(val: f64, val_min: f64, val_max: f64) -> f64 {
@@ -17,92 +95,468 @@ mod zen_lib {
 
     #[pyfunction]
     fn color_shift(rgb: FTuple, shift_s: f64, shift_v: f64) -> FTuple {
-        let mut hsv: Hsv = Rgbf::from(rgb).into();
-        let (_, s, v) = hsv.to_tuple();
-        hsv.set(s + shift_s, v + shift_v);
-        return Rgbf::from(hsv).into_tuple();
+        return color_ops::color_shift(rgb, shift_s, shift_v);
     }
 
     #[pyfunction]
     fn saturation_shift(rgb: FTuple, shift: f64) -> FTuple {
-        let mut hsv: Hsv = Rgbf::from(rgb).into();
-        let (_, _, v) = hsv.to_tuple();
-        hsv.set(shift, v);
-        return Rgbf::from(hsv).into_tuple();
+        return color_ops::saturation_shift(rgb, shift);
     }
 
     #[pyfunction]
     fn saturation_shift_uv(rgb: FTuple, shift: f64) -> FTuple {
-        let (r, g, b) = rgb;
-        let (h, _, v) = rgb_to_hsluv(r, g, b);
-
-        return hsluv_to_rgb(h, shift * 100.0, v);
+        return color_ops::saturation_shift_uv(rgb, shift);
     }
 
     #[pyfunction]
     fn value_shift(rgb: FTuple, shift: f64) -> FTuple {
-        let mut hsv: Hsv = Rgbf::from(rgb).into();
-        let (_, s, _) = hsv.to_tuple();
-        hsv.set(s, shift);
-        return Rgbf::from(hsv).into_tuple();
+        return color_ops::value_shift(rgb, shift);
     }
 
     #[pyfunction]
     fn value_shift_uv(rgb: FTuple, shift: f64) -> FTuple {
-        let (r, g, b) = rgb;
-        let (h, s, _) = rgb_to_hsluv(r, g, b);
-
-        return hsluv_to_rgb(h, s, shift * 100.0);
+        return color_ops::value_shift_uv(rgb, shift);
     }
 
     #[pyfunction]
     fn relative_color_shift(rgb: FTuple, shift_s: f64, shift_v: f64) -> FTuple {
-        let mut hsv: Hsv = Rgbf::from(rgb).into();
-        let (_, s, v) = hsv.to_tuple();
-        hsv.set(s - (shift_s * s), v - (shift_v * v));
-        return Rgbf::from(hsv).into_tuple();
+        return color_ops::relative_color_shift(rgb, shift_s, shift_v);
     }
 
     #[pyfunction]
     fn to_hsv(rgb: FTuple) -> FTuple {
-        let (r, g, b) = rgb;
-        let rgb = Rgbf::new(r, g, b);
-        let hsv = Hsv::from(rgb);
-
-        return hsv.to_tuple();
+        return color_ops::to_hsv(rgb);
     }
 
     #[pyfunction]
     fn to_hsluv(rgb: FTuple) -> FTuple {
-        let (r, g, b) = rgb;
-
-        let (h, s, v) = rgb_to_hsluv(r, g, b);
-        return (h / 360.0, s / 100.0, v / 100.0) as FTuple;
+        return color_ops::to_hsluv(rgb);
     }
 
     #[pyfunction]
     fn match_value(stable: FTuple, variable: FTuple) -> FTuple {
-        let (r, g, b) = stable;
-        let (_r, _g, _b) = variable;
+        return color_ops::match_value(stable, variable);
+    }
+
+    #[pyfunction]
+    fn mix(a: FTuple, b: FTuple, t: f64) -> FTuple {
+        return color_ops::mix(a, b, t);
+    }
 
-        let (_, _, v) = rgb_to_hsluv(r, g, b);
-        let (_h, _s, _) = rgb_to_hsluv(_r, _g, _b);
-        let (_r, _g, _b) = hsluv_to_rgb(_h, _s, v);
+    /// Components per color of a color batch: the last dimension of an
+    /// (N, 3) or (N, 4) array, 3 for flat buffers of packed RGB.
+    fn channels_of<T: Element>(colors: &PyBuffer<T>) -> PyResult<usize> {
+        let channels = match colors.shape() {
+            [_] => 3,
+            [_, channels] => *channels,
+            _ => 0,
+        };
+        if (channels != 3 && channels != 4) || colors.item_count() % channels != 0 {
+            return Err(PyValueError::new_err(
+                "colors must hold packed RGB triples or be an (N, 3) or (N, 4) array",
+            ));
+        }
+        return Ok(channels);
+    }
 
-        return (_r, _g, _b);
+    /// A new buffer for `count` colors of `channels` components of `T` to
+    /// write the results for `colors` into: a numpy array of the dtype of
+    /// `colors`, flat when `colors` is, for numpy arrays, an `array('d')`
+    /// or `array('f')` otherwise.
+    fn new_like<'py, T: Component>(
+        py: Python<'py>,
+        colors: &Bound<'py, PyAny>,
+        count: usize,
+        channels: usize,
+        flat: bool,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        if colors.hasattr("__array_interface__")? {
+            let empty = py.import("numpy")?.getattr("empty")?;
+            let dtype = colors.getattr("dtype")?;
+            if flat {
+                return empty.call1((count * channels, dtype));
+            }
+            return empty.call1(((count, channels), dtype));
+        }
+        return new_array::<T>(py, count * channels);
+    }
+
+    /// Runs `run(colors, out, channels)` with the GIL released over a batch
+    /// of `T` components, see `channels_of` for the layouts, where `out`
+    /// holds `per_color` colors of as many components for every color of
+    /// `colors`. Writes into `out` when given, which may be `colors` itself
+    /// for one color per color, otherwise into a new buffer, see `new_like`.
+    fn run_colors<'py, T, F>(
+        py: Python<'py>,
+        colors: &Bound<'py, PyAny>,
+        buffer: PyBuffer<T>,
+        out: Option<Bound<'py, PyAny>>,
+        per_color: usize,
+        run: F,
+    ) -> PyResult<Bound<'py, PyAny>>
+    where
+        T: Component + Element,
+        F: FnOnce(&[T], &mut [T], usize) + Send,
+    {
+        let channels = channels_of(&buffer)?;
+        let count = buffer.item_count() / channels * per_color;
+        let given = out.is_some();
+        let out = match out {
+            Some(out) => out,
+            None => new_like::<T>(py, colors, count, channels, buffer.shape().len() == 1)?,
+        };
+
+        let target = PyBuffer::<T>::get(&out)?;
+        if given && channels_of(&target).ok() != Some(channels) {
+            return Err(PyValueError::new_err(
+                "out must have as many components per color as colors",
+            ));
+        }
+        // an in-place batch reads a copy, never the slice being written
+        let copy;
+        let input = if overlaps(&buffer, &target) {
+            copy = buffer.to_vec(py)?;
+            copy.as_slice()
+        } else {
+            readable(&buffer)?
+        };
+        let output = writable(&target, count * channels)?;
+        py.allow_threads(|| run(input, output, channels));
+
+        target.release(py);
+        buffer.release(py);
+        return Ok(out);
+    }
+
+    /// Runs `op(i, rgb)` over every color of `colors` on `threads` threads
+    /// (one per core when None) for large batches. `colors` is any float32
+    /// or float64 buffer (`array('d')`, a numpy array, ...) of packed RGB
+    /// triples or an (N, 3) or (N, 4) array, read without a copy. Alpha is
+    /// passed through. The results go to `out`, a buffer of the same dtype
+    /// and size, when given, see `run_colors`.
+    fn map_batch<'py, F>(
+        py: Python<'py>,
+        colors: &Bound<'py, PyAny>,
+        out: Option<Bound<'py, PyAny>>,
+        threads: Option<usize>,
+        op: F,
+    ) -> PyResult<Bound<'py, PyAny>>
+    where
+        F: Fn(usize, FTuple) -> FTuple + Sync + Send,
+    {
+        let threads = thread_count(threads);
+        if let Ok(buffer) = PyBuffer::<f64>::get(colors) {
+            return run_colors(py, colors, buffer, out, 1, |input, output, channels| {
+                map_colors(input, output, channels, threads, op)
+            });
+        }
+
+        let buffer = PyBuffer::<f32>::get(colors).map_err(|_| {
+            PyValueError::new_err("colors must be a float32 or float64 buffer")
+        })?;
+        return run_colors(py, colors, buffer, out, 1, |input, output, channels| {
+            map_colors(input, output, channels, threads, op)
+        });
+    }
+
+    /// Colors in a float32 or float64 color batch.
+    fn batch_len(colors: &Bound<'_, PyAny>) -> PyResult<usize> {
+        return match PyBuffer::<f64>::get(colors) {
+            Ok(buffer) => Ok(buffer.item_count() / channels_of(&buffer)?),
+            Err(_) => {
+                let buffer = PyBuffer::<f32>::get(colors)?;
+                Ok(buffer.item_count() / channels_of(&buffer)?)
+            }
+        };
+    }
+
+    /// Whether `colors` shares any memory with `out`, a float32 or float64
+    /// buffer.
+    fn shares_memory<T: Element>(
+        py: Python<'_>,
+        colors: &PyBuffer<T>,
+        out: &Bound<'_, PyAny>,
+    ) -> PyResult<bool> {
+        let shared = match PyBuffer::<f64>::get(out) {
+            Ok(buffer) => {
+                let shared = overlaps(colors, &buffer);
+                buffer.release(py);
+                shared
+            }
+            Err(_) => {
+                let buffer = PyBuffer::<f32>::get(out)?;
+                let shared = overlaps(colors, &buffer);
+                buffer.release(py);
+                shared
+            }
+        };
+        return Ok(shared);
+    }
+
+    /// `map_batch` with `op(rgb, paired_rgb)`, pairing every color of
+    /// `colors` with the color at the same index of `paired`, or with its
+    /// only color. `paired` is read in place, copied only when it shares
+    /// memory with `out`.
+    fn map_paired<'py, T, F>(
+        py: Python<'py>,
+        colors: &Bound<'py, PyAny>,
+        paired: &PyBuffer<T>,
+        out: Option<Bound<'py, PyAny>>,
+        threads: Option<usize>,
+        op: F,
+    ) -> PyResult<Bound<'py, PyAny>>
+    where
+        T: Component + Element,
+        F: Fn(FTuple, FTuple) -> FTuple + Sync + Send,
+    {
+        let channels = channels_of(paired)?;
+        let len = paired.item_count();
+        if len != channels && len != batch_len(colors)? * channels {
+            return Err(PyValueError::new_err(
+                "paired colors must hold one color or one per color of the batch",
+            ));
+        }
+
+        let copy;
+        let shared = match &out {
+            Some(out) => shares_memory(py, paired, out)?,
+            None => false,
+        };
+        let paired = if shared {
+            copy = paired.to_vec(py)?;
+            copy.as_slice()
+        } else {
+            readable(paired)?
+        };
+        return map_batch(py, colors, out, threads, |i, rgb| {
+            op(rgb, nth_color(paired, channels, i))
+        });
+    }
+
+    /// `map_paired` for a float32 or float64 `paired` batch.
+    fn map_paired_batch<'py, F>(
+        py: Python<'py>,
+        colors: &Bound<'py, PyAny>,
+        paired: &Bound<'py, PyAny>,
+        out: Option<Bound<'py, PyAny>>,
+        threads: Option<usize>,
+        op: F,
+    ) -> PyResult<Bound<'py, PyAny>>
+    where
+        F: Fn(FTuple, FTuple) -> FTuple + Sync + Send,
+    {
+        if let Ok(buffer) = PyBuffer::<f64>::get(paired) {
+            let result = map_paired(py, colors, &buffer, out, threads, op);
+            buffer.release(py);
+            return result;
+        }
+
+        let buffer = PyBuffer::<f32>::get(paired).map_err(|_| {
+            PyValueError::new_err("paired colors must be a float32 or float64 buffer")
+        })?;
+        let result = map_paired(py, colors, &buffer, out, threads, op);
+        buffer.release(py);
+        return result;
     }
 
     #[pyfunction]
-    fn mix(a: FTuple, b: FTuple, t: f64) -> FTuple {
-        return blend_colors(Rgbf::from(a), Rgbf::from(b), t).into_tuple();
+    #[pyo3(signature = (colors, shift_s, shift_v, out=None, threads=None))]
+    fn color_shift_batch<'py>(
+        py: Python<'py>,
+        colors: Bound<'py, PyAny>,
+        shift_s: f64,
+        shift_v: f64,
+        out: Option<Bound<'py, PyAny>>,
+        threads: Option<usize>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        return map_batch(py, &colors, out, threads, |_, rgb| {
+            color_ops::color_shift(rgb, shift_s, shift_v)
+        });
     }
 
     #[pyfunction]
-    fn generate_color_gradient(a: FTuple, b: FTuple, patch_count: u16) -> Vec<FTuple> {
+    #[pyo3(signature = (colors, shift, out=None, threads=None))]
+    fn saturation_shift_batch<'py>(
+        py: Python<'py>,
+        colors: Bound<'py, PyAny>,
+        shift: f64,
+        out: Option<Bound<'py, PyAny>>,
+        threads: Option<usize>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        return map_batch(py, &colors, out, threads, |_, rgb| {
+            color_ops::saturation_shift(rgb, shift)
+        });
+    }
+
+    #[pyfunction]
+    #[pyo3(signature = (colors, shift, out=None, threads=None))]
+    fn saturation_shift_uv_batch<'py>(
+        py: Python<'py>,
+        colors: Bound<'py, PyAny>,
+        shift: f64,
+        out: Option<Bound<'py, PyAny>>,
+        threads: Option<usize>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        return map_batch(py, &colors, out, threads, |_, rgb| {
+            color_ops::saturation_shift_uv(rgb, shift)
+        });
+    }
+
+    #[pyfunction]
+    #[pyo3(signature = (colors, shift, out=None, threads=None))]
+    fn value_shift_batch<'py>(
+        py: Python<'py>,
+        colors: Bound<'py, PyAny>,
+        shift: f64,
+        out: Option<Bound<'py, PyAny>>,
+        threads: Option<usize>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        return map_batch(py, &colors, out, threads, |_, rgb| {
+            color_ops::value_shift(rgb, shift)
+        });
+    }
+
+    #[pyfunction]
+    #[pyo3(signature = (colors, shift, out=None, threads=None))]
+    fn value_shift_uv_batch<'py>(
+        py: Python<'py>,
+        colors: Bound<'py, PyAny>,
+        shift: f64,
+        out: Option<Bound<'py, PyAny>>,
+        threads: Option<usize>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        return map_batch(py, &colors, out, threads, |_, rgb| {
+            color_ops::value_shift_uv(rgb, shift)
+        });
+    }
+
+    #[pyfunction]
+    #[pyo3(signature = (colors, shift_s, shift_v, out=None, threads=None))]
+    fn relative_color_shift_batch<'py>(
+        py: Python<'py>,
+        colors: Bound<'py, PyAny>,
+        shift_s: f64,
+        shift_v: f64,
+        out: Option<Bound<'py, PyAny>>,
+        threads: Option<usize>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        return map_batch(py, &colors, out, threads, |_, rgb| {
+            color_ops::relative_color_shift(rgb, shift_s, shift_v)
+        });
+    }
+
+    #[pyfunction]
+    #[pyo3(signature = (colors, out=None, threads=None))]
+    fn to_hsv_batch<'py>(
+        py: Python<'py>,
+        colors: Bound<'py, PyAny>,
+        out: Option<Bound<'py, PyAny>>,
+        threads: Option<usize>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        return map_batch(py, &colors, out, threads, |_, rgb| color_ops::to_hsv(rgb));
+    }
+
+    #[pyfunction]
+    #[pyo3(signature = (colors, out=None, threads=None))]
+    fn to_hsluv_batch<'py>(
+        py: Python<'py>,
+        colors: Bound<'py, PyAny>,
+        out: Option<Bound<'py, PyAny>>,
+        threads: Option<usize>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        return map_batch(py, &colors, out, threads, |_, rgb| color_ops::to_hsluv(rgb));
+    }
+
+    /// `match_value` for every color of `stable`, paired with the color at
+    /// the same index of `variable`, or with its only color.
+    #[pyfunction]
+    #[pyo3(signature = (stable, variable, out=None, threads=None))]
+    fn match_value_batch<'py>(
+        py: Python<'py>,
+        stable: Bound<'py, PyAny>,
+        variable: Bound<'py, PyAny>,
+        out: Option<Bound<'py, PyAny>>,
+        threads: Option<usize>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        return map_paired_batch(py, &stable, &variable, out, threads, color_ops::match_value);
+    }
+
+    /// `mix` of every color of `a` with the color at the same index of `b`,
+    /// or with its only color.
+    #[pyfunction]
+    #[pyo3(signature = (a, b, t, out=None, threads=None))]
+    fn mix_batch<'py>(
+        py: Python<'py>,
+        a: Bound<'py, PyAny>,
+        b: Bound<'py, PyAny>,
+        t: f64,
+        out: Option<Bound<'py, PyAny>>,
+        threads: Option<usize>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        return map_paired_batch(py, &a, &b, out, threads, |rgb, paired| {
+            color_ops::mix(rgb, paired, t)
+        });
+    }
+
+    /// `steps` colors from `rgb` fully lit by `key_light`, through `rgb`, to
+    /// its deepest shadow under `ambient_light`. Lights are `(rgb,
+    /// intensity)`, `contrast` scales how far the ends are from `rgb`.
+    #[pyfunction]
+    fn shade_ramp(
+        rgb: FTuple,
+        key_light: (FTuple, f64),
+        ambient_light: (FTuple, f64),
+        steps: usize,
+        contrast: f64,
+    ) -> Vec<FTuple> {
+        let (key_rgb, key_intensity) = key_light;
+        let (ambient_rgb, ambient_intensity) = ambient_light;
+        return docker_state::shade_ramp(
+            rgb,
+            Light::from((key_rgb, key_intensity, false)),
+            Light::from((ambient_rgb, ambient_intensity, true)),
+            steps,
+            contrast,
+        );
+    }
+
+    /// Mixes every color of `colors` with every light of `lights`, `(rgb,
+    /// intensity, shadow)` each, in one call. `colors` is a float32 or
+    /// float64 batch like for `map_batch`, alpha is passed through. The mix
+    /// of color `i` with light `j` is color `i * len(lights) + j` of the
+    /// result, which has the layout of `colors`. `out` can't be `colors`.
+    #[pyfunction]
+    #[pyo3(signature = (colors, lights, out=None, threads=None))]
+    fn mix_lights<'py>(
+        py: Python<'py>,
+        colors: Bound<'py, PyAny>,
+        lights: Vec<(FTuple, f64, bool)>,
+        out: Option<Bound<'py, PyAny>>,
+        threads: Option<usize>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        let lights: Vec<Light> = lights.into_iter().map(Light::from).collect();
+        let threads = thread_count(threads);
+        let per_color = lights.len();
+        if let Ok(buffer) = PyBuffer::<f64>::get(&colors) {
+            return run_colors(py, &colors, buffer, out, per_color, |input, output, channels| {
+                docker_state::mix_lights(input, &lights, output, channels, threads)
+            });
+        }
+
+        let buffer = PyBuffer::<f32>::get(&colors).map_err(|_| {
+            PyValueError::new_err("colors must be a float32 or float64 buffer")
+        })?;
+        return run_colors(py, &colors, buffer, out, per_color, |input, output, channels| {
+            docker_state::mix_lights(input, &lights, output, channels, threads)
+        });
+    }
+
+    #[pyfunction]
+    fn generate_color_gradient(a: FTuple, b: FTuple, patch_count: usize) -> Vec<FTuple> {
         let p = patch_count as f64;
         let f_patch_count = if p > 0.0f64 { p } else { 1.0f64 };
 
-        let mut gradient = Vec::<FTuple>::with_capacity(patch_count.into());
+        let mut gradient = Vec::<FTuple>::with_capacity(patch_count);
 
         for i in 0..patch_count {
             let i = i as f64 / f_patch_count;
@@ -117,6 +571,595 @@ mod zen_lib {
         return gradient;
     }
 
+    /// Writes `color(i)` for each of the first `count` colors of `buffer`
+    /// with the GIL released.
+    fn fill_batch<T, F>(py: Python<'_>, buffer: PyBuffer<T>, count: usize, color: F) -> PyResult<()>
+    where
+        T: Component + Element,
+        F: Fn(usize) -> FTuple + Send,
+    {
+        let channels = channels_of(&buffer)?;
+        let output = writable(&buffer, count * channels)?;
+        py.allow_threads(|| fill_colors(output, channels, color));
+
+        buffer.release(py);
+        return Ok(());
+    }
+
+    /// `generate_color_gradient` written into `out`, a float32 or float64
+    /// buffer of packed RGB or an (N, 3) or (N, 4) array holding at least
+    /// `patch_count` colors, or into a new `array('d')` when None. Returns
+    /// the buffer.
+    #[pyfunction]
+    #[pyo3(signature = (a, b, patch_count, out=None))]
+    fn generate_color_gradient_batch<'py>(
+        py: Python<'py>,
+        a: FTuple,
+        b: FTuple,
+        patch_count: usize,
+        out: Option<Bound<'py, PyAny>>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        let out = match out {
+            Some(out) => out,
+            None => new_array::<f64>(py, patch_count * 3)?,
+        };
+        let steps = patch_count.max(1) as f64;
+        let gradient = |i: usize| lerp(a, b, i as f64 / steps);
+
+        match PyBuffer::<f64>::get(&out) {
+            Ok(buffer) => fill_batch(py, buffer, patch_count, gradient)?,
+            Err(_) => fill_batch(py, PyBuffer::<f32>::get(&out)?, patch_count, gradient)?,
+        }
+        return Ok(out);
+    }
+
+    /// Writes a `width` pixel RGBA8 gradient from `a` to `b` into `out`, or
+    /// into a new `bytearray` when `out` is None, and returns the buffer.
+    /// The result can be wrapped as a `QImage` (Format_RGBA8888) without a
+    /// copy.
+    #[pyfunction]
+    #[pyo3(signature = (a, b, width, out=None))]
+    fn gradient_scanline<'py>(
+        py: Python<'py>,
+        a: FTuple,
+        b: FTuple,
+        width: usize,
+        out: Option<Bound<'py, PyAny>>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        return fill_bytes(py, width * BYTES_PER_PIXEL, out, |scanline| {
+            fill_gradient(a, b, scanline)
+        });
+    }
+
+    /// Returns the color picked by dragging a `channel` slider to `t`.
+    #[pyfunction]
+    fn apply_slider_channel(
+        rgb: FTuple,
+        channel: SliderChannel,
+        t: f64,
+        luminosity_lock: bool,
+    ) -> FTuple {
+        return apply_channel(rgb, channel.into(), t, luminosity_lock);
+    }
+
+    /// Returns the cursor position of a `channel` slider for `rgb`, in [0, 1].
+    #[pyfunction]
+    fn slider_position(rgb: FTuple, channel: SliderChannel) -> f64 {
+        return channel_position(rgb, channel.into());
+    }
+
+    /// Writes the color every pixel column of a `channel` slider would pick
+    /// as a `width` pixel RGBA8 scanline, see `gradient_scanline`.
+    #[pyfunction]
+    #[pyo3(signature = (rgb, channel, luminosity_lock, width, out=None))]
+    fn slider_scanline<'py>(
+        py: Python<'py>,
+        rgb: FTuple,
+        channel: SliderChannel,
+        luminosity_lock: bool,
+        width: usize,
+        out: Option<Bound<'py, PyAny>>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        return fill_bytes(py, width * BYTES_PER_PIXEL, out, |scanline| {
+            fill_channel(rgb, channel.into(), luminosity_lock, scanline)
+        });
+    }
+
+    /// Color at saturation `s` and lightness `v` of `hue` in `kind`, all in
+    /// [0, 1].
+    #[pyfunction]
+    fn plane_color(hue: f64, s: f64, v: f64, kind: PlaneKind) -> FTuple {
+        return plane::plane_color(hue, s, v, kind.into());
+    }
+
+    /// Hue, saturation and lightness of `rgb` in `kind`, all in [0, 1].
+    #[pyfunction]
+    fn plane_coordinates(rgb: FTuple, kind: PlaneKind) -> FTuple {
+        return plane::plane_coordinates(rgb, kind.into());
+    }
+
+    /// Writes every hue from 0 to 1, at full saturation and a constant
+    /// lightness, as a `width` pixel RGBA8 scanline, see `gradient_scanline`.
+    #[pyfunction]
+    #[pyo3(signature = (kind, width, out=None))]
+    fn hue_scanline<'py>(
+        py: Python<'py>,
+        kind: PlaneKind,
+        width: usize,
+        out: Option<Bound<'py, PyAny>>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        return fill_bytes(py, width * BYTES_PER_PIXEL, out, |scanline| {
+            fill_hue(kind.into(), scanline)
+        });
+    }
+
+    /// Writes the saturation/lightness plane of `hue` as a `width` x
+    /// `height` RGBA8 image, saturation to the right and lightness to the
+    /// top, in one call. Large planes are split over `threads` threads (one
+    /// per core when None), see `gradient_scanline` for `out`.
+    #[pyfunction]
+    #[pyo3(signature = (hue, kind, width, height, out=None, threads=None))]
+    fn sv_plane<'py>(
+        py: Python<'py>,
+        hue: f64,
+        kind: PlaneKind,
+        width: usize,
+        height: usize,
+        out: Option<Bound<'py, PyAny>>,
+        threads: Option<usize>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        let threads = thread_count(threads);
+        return fill_bytes(py, width * height * BYTES_PER_PIXEL, out, |pixels| {
+            fill_plane(hue, kind.into(), width, pixels, threads)
+        });
+    }
+
+    /// Routes every HSLuv conversion in lib_zen through lookup tables, see
+    /// `hsluv_lut.rs` for the error bounds. The float table is memory-mapped
+    /// from `cache_path`, or built and written there when missing. Returns
+    /// whether the table was loaded from the cache file.
+    #[pyfunction]
+    #[pyo3(signature = (cache_path=None, size=crate::hsluv_lut::DEFAULT_SIZE))]
+    fn enable_hsluv_lut(py: Python<'_>, cache_path: Option<PathBuf>, size: usize) -> bool {
+        let (lut, from_cache) = py.allow_threads(|| match cache_path {
+            Some(path) => HsluvLut::load_or_build(&path, size),
+            None => (HsluvLut::build(size), false),
+        });
+        hsluv_lut::install(Some(lut));
+
+        return from_cache;
+    }
+
+    #[pyfunction]
+    fn disable_hsluv_lut() {
+        hsluv_lut::install(None);
+    }
+
+    #[pyfunction]
+    fn hsluv_lut_enabled() -> bool {
+        return hsluv_lut::installed().is_some();
+    }
+
+    /// Result of `DockerEngine.compute`. `positions` and `endpoints` follow
+    /// the slider order the engine was created with.
+    #[pyclass(frozen)]
+    struct DockerFrame {
+        /// The mix with each light, in the order they were passed.
+        #[pyo3(get)]
+        mixes: Vec<FTuple>,
+        #[pyo3(get)]
+        positions: Vec<f64>,
+        #[pyo3(get)]
+        endpoints: Vec<(FTuple, FTuple)>,
+    }
+
+    /// Computes everything a docker sync tick needs in one call: the cursor
+    /// position and endpoint colors of every slider, plus the mix with every
+    /// light.
+    #[pyclass]
+    struct DockerEngine {
+        sliders: Vec<(Channel, bool)>,
+    }
+
+    #[pymethods]
+    impl DockerEngine {
+        /// `sliders` holds `(channel, luminosity_lock)` per slider.
+        #[new]
+        fn new(sliders: Vec<(SliderChannel, bool)>) -> Self {
+            return Self {
+                sliders: sliders
+                    .into_iter()
+                    .map(|(channel, lock)| (channel.into(), lock))
+                    .collect(),
+            };
+        }
+
+        /// `lights` holds `(rgb, intensity, shadow)` per light. Runs with the
+        /// GIL released, so it can be called from a worker thread without
+        /// holding up the Qt thread.
+        fn compute(
+            &self,
+            py: Python<'_>,
+            rgb: FTuple,
+            lights: Vec<(FTuple, f64, bool)>,
+        ) -> DockerFrame {
+            let lights: Vec<Light> = lights.into_iter().map(Light::from).collect();
+            let frame = py.allow_threads(|| docker_state::compute(rgb, &lights, &self.sliders));
+
+            return DockerFrame {
+                mixes: frame.mixes,
+                positions: frame.sliders.iter().map(|s| s.position).collect(),
+                endpoints: frame.sliders.iter().map(|s| (s.left, s.right)).collect(),
+            };
+        }
+    }
+
+    /// HSLuv lightness histogram of a document's projection, built and
+    /// kept up to date tile by tile, see `histogram.rs`. Python reads the
+    /// tiles returned by `next_tiles` with `Document.pixelData` and hands
+    /// them to `process`.
+    #[pyclass(frozen)]
+    struct HistogramEngine {
+        depth: Depth,
+        grid: Mutex<TileGrid>,
+        cancel: AtomicBool,
+    }
+
+    #[pymethods]
+    impl HistogramEngine {
+        /// `depth` is the document's `colorDepth()`, the document has to be
+        /// RGBA.
+        #[new]
+        #[pyo3(signature = (width, height, depth, tile_size=histogram::DEFAULT_TILE_SIZE))]
+        fn new(width: usize, height: usize, depth: &str, tile_size: usize) -> PyResult<Self> {
+            return Ok(Self {
+                depth: parse_depth(depth)?,
+                grid: Mutex::new(TileGrid::new(width, height, tile_size)),
+                cancel: AtomicBool::new(false),
+            });
+        }
+
+        #[getter]
+        fn tile_count(&self) -> usize {
+            return self.grid.lock().unwrap().tile_count();
+        }
+
+        /// Bumped every time the histogram changes.
+        #[getter]
+        fn version(&self) -> u64 {
+            return self.grid.lock().unwrap().version();
+        }
+
+        /// True once every tile has been counted and nothing is dirty.
+        #[getter]
+        fn complete(&self) -> bool {
+            return self.grid.lock().unwrap().complete();
+        }
+
+        /// Up to `limit` tiles to read next, as (index, x, y, width,
+        /// height). Tiles touched by `invalidate` come first, then a round
+        /// robin rescan of the whole document. Starts a new pass: a
+        /// `cancel` from here on stops the `process` call counting them.
+        fn next_tiles(&self, limit: usize) -> Vec<(usize, usize, usize, usize, usize)> {
+            self.cancel.store(false, Ordering::Relaxed);
+            let mut grid = self.grid.lock().unwrap();
+
+            return grid
+                .next_tiles(limit)
+                .into_iter()
+                .map(|index| {
+                    let (x, y, width, height) = grid.rect(index);
+                    (index, x, y, width, height)
+                })
+                .collect();
+        }
+
+        /// Counts `tiles`, (index, pixel data) pairs for tiles returned by
+        /// `next_tiles`, on `threads` worker threads (one per core when
+        /// None) with the GIL released. Tiles whose pixels did not change
+        /// since they were last counted are skipped. Returns how many tiles
+        /// changed the histogram.
+        #[pyo3(signature = (tiles, threads=None))]
+        fn process(
+            &self,
+            py: Python<'_>,
+            tiles: Vec<(usize, Bound<'_, PyAny>)>,
+            threads: Option<usize>,
+        ) -> PyResult<usize> {
+            let mut buffers = Vec::with_capacity(tiles.len());
+            {
+                let grid = self.grid.lock().unwrap();
+                for (index, data) in tiles {
+                    if index >= grid.tile_count() {
+                        return Err(PyValueError::new_err(format!("no tile {index}")));
+                    }
+
+                    let (_, _, width, height) = grid.rect(index);
+                    let len = width * height * self.depth.bytes_per_pixel();
+                    let buffer = PyBuffer::<u8>::get(&data)?;
+                    if buffer.item_count() != len {
+                        return Err(PyValueError::new_err(format!(
+                            "tile {} holds {} bytes, {} expected",
+                            index,
+                            buffer.item_count(),
+                            len
+                        )));
+                    }
+
+                    buffers.push((index, grid.hash(index), buffer));
+                }
+            }
+
+            // the pixels are read in place, the buffers keep them alive
+            let mut jobs = Vec::with_capacity(buffers.len());
+            for (index, previous_hash, buffer) in &buffers {
+                jobs.push(TileJob {
+                    index: *index,
+                    previous_hash: *previous_hash,
+                    pixels: readable(buffer)?,
+                });
+            }
+            let threads = thread_count(threads);
+            let results =
+                py.allow_threads(|| compute_tiles(&jobs, self.depth, threads, &self.cancel));
+            for (_, _, buffer) in buffers {
+                buffer.release(py);
+            }
+
+            return Ok(self.grid.lock().unwrap().apply(results));
+        }
+
+        /// Stops the `process` call of the current pass, running on another
+        /// thread or not started yet, after the tiles it already started.
+        /// Tiles it did not get to stay dirty.
+        fn cancel(&self) {
+            self.cancel.store(true, Ordering::Relaxed);
+        }
+
+        /// Marks the tiles overlapping the rectangle for reading first.
+        fn invalidate(&self, x: usize, y: usize, width: usize, height: usize) {
+            self.grid.lock().unwrap().invalidate(x, y, width, height);
+        }
+
+        fn invalidate_all(&self) {
+            self.grid.lock().unwrap().invalidate_all();
+        }
+
+        /// Pixel count of each of the 256 lightness bins.
+        fn histogram(&self) -> Vec<u64> {
+            return self.grid.lock().unwrap().histogram().to_vec();
+        }
+
+        /// Lightness in [0, 1] below which `p` of the counted pixels fall,
+        /// None while nothing was counted.
+        fn percentile(&self, p: f64) -> Option<f64> {
+            return self.grid.lock().unwrap().percentile(p);
+        }
+    }
+
+    /// Samples pixel data on a grid and extracts its dominant colors, see
+    /// `palette.rs`. The samples are kept, so `extract` can be called again
+    /// with another color count without reading the image again.
+    #[pyclass(frozen)]
+    struct PaletteSampler {
+        // swapped whole by `sample`, so `extract` never holds the lock while
+        // it runs without the GIL
+        samples: Mutex<Arc<Vec<Sample>>>,
+    }
+
+    #[pymethods]
+    impl PaletteSampler {
+        #[new]
+        fn new() -> Self {
+            return Self {
+                samples: Mutex::new(Arc::new(Vec::new())),
+            };
+        }
+
+        /// Grid spacing to sample a `width` x `height` image with.
+        #[staticmethod]
+        #[pyo3(signature = (width, height, max_samples=palette::DEFAULT_MAX_SAMPLES))]
+        fn stride_for(width: usize, height: usize, max_samples: usize) -> usize {
+            return palette::stride_for(width, height, max_samples);
+        }
+
+        #[getter]
+        fn sample_count(&self) -> usize {
+            return self.samples.lock().unwrap().len();
+        }
+
+        /// Replaces the samples with every `stride`-th pixel of `rows`, RGBA
+        /// pixel data of `depth` (Krita's `colorDepth()`). `masks` holds one
+        /// selection row (`Selection.pixelData`) per row. Returns the number
+        /// of samples.
+        #[pyo3(signature = (rows, depth, stride, masks=None))]
+        fn sample(
+            &self,
+            py: Python<'_>,
+            rows: Vec<Bound<'_, PyAny>>,
+            depth: &str,
+            stride: usize,
+            masks: Option<Vec<Bound<'_, PyAny>>>,
+        ) -> PyResult<usize> {
+            let depth = parse_depth(depth)?;
+            if masks.as_ref().is_some_and(|masks| masks.len() != rows.len()) {
+                return Err(PyValueError::new_err("masks and rows differ in length"));
+            }
+
+            let to_vec = |data: &Bound<'_, PyAny>| -> PyResult<Vec<u8>> {
+                let buffer = PyBuffer::<u8>::get(data)?;
+                let bytes = buffer.to_vec(py)?;
+                buffer.release(py);
+                return Ok(bytes);
+            };
+            let rows = rows.iter().map(&to_vec).collect::<PyResult<Vec<_>>>()?;
+            let masks = match masks {
+                Some(masks) => Some(masks.iter().map(&to_vec).collect::<PyResult<Vec<_>>>()?),
+                None => None,
+            };
+
+            let samples = py.allow_threads(|| {
+                let mut samples = Vec::new();
+                for (i, row) in rows.iter().enumerate() {
+                    let mask = masks.as_ref().map(|masks| masks[i].as_slice());
+                    sample_row(row, mask, depth, stride, &mut samples);
+                }
+                return samples;
+            });
+
+            let count = samples.len();
+            *self.samples.lock().unwrap() = Arc::new(samples);
+            return Ok(count);
+        }
+
+        fn clear(&self) {
+            *self.samples.lock().unwrap() = Arc::new(Vec::new());
+        }
+
+        /// Up to `count` dominant colors of the samples, most common first,
+        /// as (rgb, share of samples). Runs on `threads` threads (one per
+        /// core when None) with the GIL released.
+        #[pyo3(signature = (count, iterations=palette::DEFAULT_ITERATIONS, threads=None))]
+        fn extract(
+            &self,
+            py: Python<'_>,
+            count: usize,
+            iterations: usize,
+            threads: Option<usize>,
+        ) -> Vec<(FTuple, f64)> {
+            let samples = Arc::clone(&self.samples.lock().unwrap());
+            let threads = thread_count(threads);
+
+            return py.allow_threads(|| {
+                kmeans(&samples, count, iterations, threads)
+                    .into_iter()
+                    .map(|swatch| (swatch.rgb, swatch.weight))
+                    .collect()
+            });
+        }
+    }
+
+    /// The display transform of a canvas sampled on a `size`^3 RGB grid,
+    /// converting colors and RGBA8 buffers like `colorForCanvas` would, see
+    /// `display_lut.rs`.
+    #[pyclass(frozen)]
+    struct DisplayLut {
+        lut: display_lut::DisplayLut,
+    }
+
+    #[pymethods]
+    impl DisplayLut {
+        /// `samples` holds the display RGB of every grid point as packed
+        /// doubles, `size` points per channel from 0 to 1, red varying
+        /// slowest and blue fastest.
+        #[new]
+        fn new(py: Python<'_>, size: usize, samples: &Bound<'_, PyAny>) -> PyResult<Self> {
+            let buffer = PyBuffer::<f64>::get(samples)?;
+            let lut = display_lut::DisplayLut::new(size, readable(&buffer)?);
+            buffer.release(py);
+
+            let lut = lut.ok_or_else(|| {
+                PyValueError::new_err(format!("samples must hold {size}^3 RGB triples"))
+            })?;
+            return Ok(Self { lut });
+        }
+
+        #[getter]
+        fn size(&self) -> usize {
+            return self.lut.size();
+        }
+
+        /// Whether no color moves by more than `tolerance` in any channel,
+        /// so the transform can be skipped.
+        fn is_identity(&self, tolerance: f64) -> bool {
+            return self.lut.is_identity(tolerance);
+        }
+
+        fn apply(&self, rgb: FTuple) -> FTuple {
+            return self.lut.apply(rgb);
+        }
+
+        /// Converts the RGBA8 pixels of `pixels` (a `bytearray`,
+        /// `QImage.bits()`, ...) in place with the GIL released, on
+        /// `threads` threads (one per core when None) for large buffers.
+        /// Returns `pixels`.
+        #[pyo3(signature = (pixels, threads=None))]
+        fn apply_pixels<'py>(
+            &self,
+            py: Python<'py>,
+            pixels: Bound<'py, PyAny>,
+            threads: Option<usize>,
+        ) -> PyResult<Bound<'py, PyAny>> {
+            let buffer = PyBuffer::<u8>::get(&pixels)?;
+            let len = buffer.item_count() / BYTES_PER_PIXEL * BYTES_PER_PIXEL;
+            let bytes = writable(&buffer, len)?;
+            let threads = thread_count(threads);
+            py.allow_threads(|| self.lut.apply_pixels(bytes, threads));
+
+            buffer.release(py);
+            return Ok(pixels);
+        }
+    }
+
+    /// Nearest color lookups over a list of colors, such as the saved
+    /// colors, see `color_index.rs`. Positions follow the list as long as it
+    /// is only changed through `insert` and `swap_remove`.
+    #[pyclass(frozen)]
+    struct ColorIndex {
+        index: Mutex<color_index::ColorIndex>,
+        #[pyo3(get)]
+        tolerance: f64,
+    }
+
+    #[pymethods]
+    impl ColorIndex {
+        /// `tolerance` is the delta E in CIELUV below which `insert` treats
+        /// two colors as the same.
+        #[new]
+        #[pyo3(signature = (tolerance=color_index::DEFAULT_TOLERANCE))]
+        fn new(tolerance: f64) -> Self {
+            return Self {
+                index: Mutex::new(color_index::ColorIndex::new()),
+                tolerance,
+            };
+        }
+
+        fn __len__(&self) -> usize {
+            return self.index.lock().unwrap().len();
+        }
+
+        /// Appends `rgb` unless a color within `tolerance` is indexed already.
+        /// Returns (position of the new or the existing color, added).
+        fn insert(&self, rgb: FTuple) -> (usize, bool) {
+            return self.index.lock().unwrap().insert(rgb_to_luv(rgb), self.tolerance);
+        }
+
+        /// Removes the color at `position`, moving the last one into its place.
+        fn swap_remove(&self, position: usize) -> PyResult<()> {
+            let mut index = self.index.lock().unwrap();
+            if position >= index.len() {
+                return Err(PyValueError::new_err(format!("no color at {position}")));
+            }
+            index.swap_remove(position);
+            return Ok(());
+        }
+
+        fn clear(&self) {
+            self.index.lock().unwrap().clear();
+        }
+
+        /// Position of the closest color within `tolerance` of `rgb`.
+        #[pyo3(signature = (rgb, tolerance=0.0))]
+        fn find(&self, rgb: FTuple, tolerance: f64) -> Option<usize> {
+            return self.index.lock().unwrap().find(&rgb_to_luv(rgb), tolerance);
+        }
+
+        /// Closest color to `rgb` as (position, delta E), None when empty.
+        fn nearest(&self, rgb: FTuple) -> Option<(usize, f64)> {
+            return self.index.lock().unwrap().nearest(&rgb_to_luv(rgb));
+        }
+    }
+
     #[cfg(test)]
     mod test {
         use super::*;
@@ -0,0 +1,292 @@
+//! Dominant colors of an image by k-means in CIELUV.
+//!
+//! Pixels are sampled on a `stride` grid into a buffer of `Sample`s, which
+//! is kept so the palette can be extracted again with another color count
+//! without reading the image again. Clustering uses CIELUV distances, while
+//! each palette color is the mean of its pixels in linear RGB.
+use crate::color_ops::FTuple;
+use crate::histogram::{decode_linear, Depth};
+use crate::hsluv_lut::linear_to_luv;
+
+/// Enough samples for stable clusters, whatever the image size.
+pub const DEFAULT_MAX_SAMPLES: usize = 1 << 18;
+pub const DEFAULT_ITERATIONS: usize = 16;
+
+#[derive(Clone, Copy, Default)]
+pub struct Sample {
+    pub luv: [f32; 3],
+    pub linear: [f32; 3],
+}
+
+/// One color of a palette and the share of samples it stands for.
+pub struct Swatch {
+    pub rgb: FTuple,
+    pub weight: f64,
+}
+
+fn from_linear(c: f64) -> f64 {
+    let c = c.clamp(0.0, 1.0);
+    if c > 0.0031308 {
+        return 1.055 * c.powf(1.0 / 2.4) - 0.055;
+    }
+    return 12.92 * c;
+}
+
+/// Grid spacing that keeps a `width` x `height` image under `max_samples`.
+pub fn stride_for(width: usize, height: usize, max_samples: usize) -> usize {
+    let pixels = (width * height) as f64;
+    return ((pixels / max_samples.max(1) as f64).sqrt().ceil() as usize).max(1);
+}
+
+/// Appends every `stride`-th pixel of a row of BGRA pixel data. Transparent
+/// pixels, and pixels less than half selected in `mask` (one byte per
+/// pixel), are skipped.
+pub fn sample_row(row: &[u8], mask: Option<&[u8]>, depth: Depth, stride: usize, out: &mut Vec<Sample>) {
+    let bpp = depth.bytes_per_pixel();
+
+    for x in (0..row.len() / bpp).step_by(stride.max(1)) {
+        if mask.is_some_and(|mask| mask.get(x).map_or(true, |&m| m < 128)) {
+            continue;
+        }
+        let Some(rgb) = decode_linear(&row[x * bpp..(x + 1) * bpp], depth) else {
+            continue;
+        };
+
+        let (l, u, v) = linear_to_luv(rgb);
+        out.push(Sample {
+            luv: [l as f32, u as f32, v as f32],
+            linear: [rgb.0 as f32, rgb.1 as f32, rgb.2 as f32],
+        });
+    }
+}
+
+fn distance(a: &[f32; 3], b: &[f32; 3]) -> f32 {
+    let d = [a[0] - b[0], a[1] - b[1], a[2] - b[2]];
+    return d[0] * d[0] + d[1] * d[1] + d[2] * d[2];
+}
+
+fn nearest(luv: &[f32; 3], centers: &[[f32; 3]]) -> usize {
+    let mut best = 0;
+    let mut best_distance = f32::MAX;
+    for (i, center) in centers.iter().enumerate() {
+        let d = distance(luv, center);
+        if d < best_distance {
+            best = i;
+            best_distance = d;
+        }
+    }
+    return best;
+}
+
+/// Deterministic xorshift, so the same image always gives the same palette.
+struct Rng(u64);
+
+impl Rng {
+    fn next_f64(&mut self) -> f64 {
+        self.0 ^= self.0 << 13;
+        self.0 ^= self.0 >> 7;
+        self.0 ^= self.0 << 17;
+        return (self.0 >> 11) as f64 / (1u64 << 53) as f64;
+    }
+}
+
+/// k-means++ seeding: every next center is picked with a probability
+/// proportional to its squared distance to the closest center so far.
+fn seed_centers(samples: &[Sample], k: usize) -> Vec<[f32; 3]> {
+    let mut rng = Rng(0x9e37_79b9_7f4a_7c15);
+    let mut centers = vec![samples[(rng.next_f64() * samples.len() as f64) as usize].luv];
+    let mut distances: Vec<f32> = samples.iter().map(|s| distance(&s.luv, &centers[0])).collect();
+
+    while centers.len() < k {
+        let total: f64 = distances.iter().map(|&d| d as f64).sum();
+        if total <= 0.0 {
+            // fewer distinct colors than k
+            break;
+        }
+
+        let mut target = rng.next_f64() * total;
+        let mut pick = samples.len() - 1;
+        for (i, &d) in distances.iter().enumerate() {
+            target -= d as f64;
+            if target <= 0.0 {
+                pick = i;
+                break;
+            }
+        }
+
+        let center = samples[pick].luv;
+        for (d, sample) in distances.iter_mut().zip(samples) {
+            *d = d.min(distance(&sample.luv, &center));
+        }
+        centers.push(center);
+    }
+
+    return centers;
+}
+
+/// Per cluster sums of one chunk of samples.
+struct Partial {
+    luv: Vec<[f64; 3]>,
+    linear: Vec<[f64; 3]>,
+    counts: Vec<usize>,
+    moved: usize,
+}
+
+fn assign(samples: &[Sample], labels: &mut [u32], centers: &[[f32; 3]]) -> Partial {
+    let k = centers.len();
+    let mut partial = Partial {
+        luv: vec![[0.0; 3]; k],
+        linear: vec![[0.0; 3]; k],
+        counts: vec![0; k],
+        moved: 0,
+    };
+
+    for (sample, label) in samples.iter().zip(labels.iter_mut()) {
+        let cluster = nearest(&sample.luv, centers);
+        if *label != cluster as u32 {
+            *label = cluster as u32;
+            partial.moved += 1;
+        }
+
+        partial.counts[cluster] += 1;
+        for c in 0..3 {
+            partial.luv[cluster][c] += sample.luv[c] as f64;
+            partial.linear[cluster][c] += sample.linear[c] as f64;
+        }
+    }
+
+    return partial;
+}
+
+/// Clusters `samples` into at most `k` colors on `threads` threads and
+/// returns them most common first. Stops after `iterations` rounds or once
+/// no sample changes its cluster.
+pub fn kmeans(samples: &[Sample], k: usize, iterations: usize, threads: usize) -> Vec<Swatch> {
+    if samples.is_empty() || k == 0 {
+        return Vec::new();
+    }
+
+    let mut centers = seed_centers(samples, k.min(samples.len()));
+    let mut labels = vec![u32::MAX; samples.len()];
+    let chunk = samples.len().div_ceil(threads.max(1));
+    let mut totals = None;
+
+    for _ in 0..iterations.max(1) {
+        let partials: Vec<Partial> = std::thread::scope(|scope| {
+            let centers = &centers;
+            let workers: Vec<_> = samples
+                .chunks(chunk)
+                .zip(labels.chunks_mut(chunk))
+                .map(|(samples, labels)| scope.spawn(move || assign(samples, labels, centers)))
+                .collect();
+            workers.into_iter().map(|worker| worker.join().unwrap()).collect()
+        });
+
+        let mut total = Partial {
+            luv: vec![[0.0; 3]; centers.len()],
+            linear: vec![[0.0; 3]; centers.len()],
+            counts: vec![0; centers.len()],
+            moved: 0,
+        };
+        for partial in partials {
+            total.moved += partial.moved;
+            for i in 0..centers.len() {
+                total.counts[i] += partial.counts[i];
+                for c in 0..3 {
+                    total.luv[i][c] += partial.luv[i][c];
+                    total.linear[i][c] += partial.linear[i][c];
+                }
+            }
+        }
+
+        for (i, center) in centers.iter_mut().enumerate() {
+            let n = total.counts[i];
+            if n > 0 {
+                *center = total.luv[i].map(|sum| (sum / n as f64) as f32);
+            }
+        }
+
+        let done = total.moved == 0;
+        totals = Some(total);
+        if done {
+            break;
+        }
+    }
+
+    let total = totals.unwrap();
+    let mut swatches: Vec<Swatch> = (0..centers.len())
+        .filter(|&i| total.counts[i] > 0)
+        .map(|i| {
+            let n = total.counts[i] as f64;
+            let [r, g, b] = total.linear[i].map(|sum| from_linear(sum / n));
+            return Swatch {
+                rgb: (r, g, b),
+                weight: n / samples.len() as f64,
+            };
+        })
+        .collect();
+    swatches.sort_by(|a, b| b.weight.total_cmp(&a.weight));
+
+    return swatches;
+}
+
+#[cfg(test)]
+mod test {
+    use super::*;
+    use crate::hsluv_lut::to_linear;
+
+    fn bgra(rgb: [u8; 3]) -> [u8; 4] {
+        return [rgb[2], rgb[1], rgb[0], 255];
+    }
+
+    #[test]
+    fn finds_dominant_colors() {
+        // 60% red, 30% blue, 10% near-white, with a little noise
+        let mut row = Vec::new();
+        for i in 0..1000u32 {
+            let noise = (i * 7 % 5) as u8;
+            let px = match i % 10 {
+                0..=5 => bgra([200 + noise, 30, 30]),
+                6..=8 => bgra([20, 40 + noise, 180]),
+                _ => bgra([250, 250, 245 + noise]),
+            };
+            row.extend_from_slice(&px);
+        }
+
+        let mut samples = Vec::new();
+        sample_row(&row, None, Depth::U8, 1, &mut samples);
+        assert_eq!(samples.len(), 1000);
+
+        let swatches = kmeans(&samples, 3, DEFAULT_ITERATIONS, 4);
+        assert_eq!(swatches.len(), 3);
+        assert!((swatches[0].weight - 0.6).abs() < 1e-9);
+        assert!((swatches[1].weight - 0.3).abs() < 1e-9);
+
+        let (r, g, b) = swatches[0].rgb;
+        assert!((r * 255.0 - 202.0).abs() < 2.0 && (g * 255.0 - 30.0).abs() < 1.0 && b < 0.2);
+        let (r, _, b) = swatches[1].rgb;
+        assert!(r < 0.1 && (b * 255.0 - 180.0).abs() < 1.0);
+
+        // asking for more colors than there are distinct ones
+        let single = vec![samples[0]; 10];
+        assert_eq!(kmeans(&single, 4, DEFAULT_ITERATIONS, 2).len(), 1);
+    }
+
+    #[test]
+    fn sampling_respects_stride_and_mask() {
+        let row: Vec<u8> = (0..8).flat_map(|_| bgra([128, 128, 128])).collect();
+        let mask = [255, 0, 255, 0, 255, 0, 0, 255];
+
+        let mut samples = Vec::new();
+        sample_row(&row, None, Depth::U8, 3, &mut samples);
+        assert_eq!(samples.len(), 3);
+
+        samples.clear();
+        sample_row(&row, Some(&mask), Depth::U8, 1, &mut samples);
+        assert_eq!(samples.len(), 4);
+        assert!((samples[0].linear[0] as f64 - to_linear(128.0 / 255.0)).abs() < 1e-6);
+
+        assert_eq!(stride_for(100, 100, 10_000), 1);
+        assert_eq!(stride_for(12_000, 9_000, DEFAULT_MAX_SAMPLES), 21);
+    }
+}
@@ -0,0 +1,126 @@
+//! Saturation/lightness plane of one hue and the strip of every hue, in
+//! HSLuv or HSV. Saturation grows to the right and lightness (or value) to
+//! the top, all coordinates are in [0, 1].
+use crate::batch::fill_rows;
+use crate::color_ops::{to_hsluv, to_hsv, FTuple, Hsv, Rgbf};
+use crate::gradient::{write_pixel, BYTES_PER_PIXEL};
+use hsluv::hsluv_to_rgb;
+
+#[derive(Clone, Copy, PartialEq, Debug)]
+pub enum PlaneMode {
+    Hsluv,
+    Hsv,
+}
+
+pub fn plane_color(hue: f64, s: f64, v: f64, mode: PlaneMode) -> FTuple {
+    let (s, v) = (s.clamp(0.0, 1.0), v.clamp(0.0, 1.0));
+
+    let (r, g, b) = match mode {
+        PlaneMode::Hsluv => hsluv_to_rgb(hue * 360.0, s * 100.0, v * 100.0),
+        PlaneMode::Hsv => Rgbf::from(Hsv::new((hue, s, v))).into_tuple(),
+    };
+    // HSLuv round trips can land just outside the gamut
+    return (r.clamp(0.0, 1.0), g.clamp(0.0, 1.0), b.clamp(0.0, 1.0));
+}
+
+/// Hue, saturation and lightness of `rgb` in `mode`.
+pub fn plane_coordinates(rgb: FTuple, mode: PlaneMode) -> FTuple {
+    return match mode {
+        PlaneMode::Hsluv => to_hsluv(rgb),
+        PlaneMode::Hsv => to_hsv(rgb),
+    };
+}
+
+/// Saturation and lightness every hue of a hue strip is shown at.
+pub fn hue_strip_tone(mode: PlaneMode) -> (f64, f64) {
+    return match mode {
+        PlaneMode::Hsluv => (1.0, 0.65),
+        PlaneMode::Hsv => (1.0, 1.0),
+    };
+}
+
+/// Fills `scanline` with every hue from 0 to 1 at the tone of
+/// `hue_strip_tone`, one RGBA8 pixel per column.
+pub fn fill_hue(mode: PlaneMode, scanline: &mut [u8]) {
+    let width = scanline.len() / BYTES_PER_PIXEL;
+    let (s, v) = hue_strip_tone(mode);
+
+    for (x, pixel) in scanline.chunks_exact_mut(BYTES_PER_PIXEL).enumerate() {
+        let hue = (x as f64 + 0.5) / width as f64;
+        write_pixel(pixel, plane_color(hue, s, v, mode));
+    }
+}
+
+/// Fills `pixels`, RGBA8 rows of `width` pixels, with the plane of `hue`.
+/// Pixel centers are sampled, so every pixel shows the color picked at it.
+pub fn fill_plane(hue: f64, mode: PlaneMode, width: usize, pixels: &mut [u8], threads: usize) {
+    let row_len = width * BYTES_PER_PIXEL;
+    if row_len == 0 {
+        return;
+    }
+    let height = pixels.len() / row_len;
+
+    fill_rows(pixels, row_len, threads, |y, row| {
+        let v = 1.0 - (y as f64 + 0.5) / height as f64;
+        for (x, pixel) in row.chunks_exact_mut(BYTES_PER_PIXEL).enumerate() {
+            let s = (x as f64 + 0.5) / width as f64;
+            write_pixel(pixel, plane_color(hue, s, v, mode));
+        }
+    });
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::gradient::channel_to_u8;
+
+    #[test]
+    fn plane_color_round_trips() {
+        for mode in [PlaneMode::Hsluv, PlaneMode::Hsv] {
+            let rgb = (176.0 / 255.0, 95.0 / 255.0, 110.0 / 255.0);
+            let (h, s, v) = plane_coordinates(rgb, mode);
+            let (r, g, b) = plane_color(h, s, v, mode);
+            assert!((r - rgb.0).abs() < 1e-6 && (g - rgb.1).abs() < 1e-6 && (b - rgb.2).abs() < 1e-6);
+        }
+    }
+
+    #[test]
+    fn fill_plane_matches_plane_color() {
+        let (width, height) = (96, 80);
+        for mode in [PlaneMode::Hsluv, PlaneMode::Hsv] {
+            let mut pixels = vec![0u8; width * height * BYTES_PER_PIXEL];
+            fill_plane(0.3, mode, width, &mut pixels, 4);
+
+            for (x, y) in [(0, 0), (95, 0), (40, 41), (95, 79)] {
+                let s = (x as f64 + 0.5) / width as f64;
+                let v = 1.0 - (y as f64 + 0.5) / height as f64;
+                let (r, g, b) = plane_color(0.3, s, v, mode);
+                let at = (y * width + x) * BYTES_PER_PIXEL;
+                assert_eq!(
+                    &pixels[at..at + BYTES_PER_PIXEL],
+                    &[channel_to_u8(r), channel_to_u8(g), channel_to_u8(b), 255]
+                );
+            }
+        }
+    }
+
+    #[test]
+    fn fill_hue_spans_the_hue_circle() {
+        let mut scanline = vec![0u8; 360 * BYTES_PER_PIXEL];
+        fill_hue(PlaneMode::Hsv, &mut scanline);
+
+        // red at both ends, green a third of the way, blue two thirds
+        assert_eq!(&scanline[..4], &[255, 2, 0, 255]);
+        assert_eq!(&scanline[120 * 4..121 * 4], &[0, 255, 2, 255]);
+        assert_eq!(&scanline[240 * 4..241 * 4], &[2, 0, 255, 255]);
+        assert_eq!(&scanline[359 * 4..], &[255, 0, 2, 255]);
+
+        fill_hue(PlaneMode::Hsluv, &mut scanline);
+        let (s, l) = hue_strip_tone(PlaneMode::Hsluv);
+        let (r, g, b) = plane_color(180.5 / 360.0, s, l, PlaneMode::Hsluv);
+        assert_eq!(
+            &scanline[180 * 4..181 * 4],
+            &[channel_to_u8(r), channel_to_u8(g), channel_to_u8(b), 255]
+        );
+    }
+}
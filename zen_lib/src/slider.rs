@@ -0,0 +1,140 @@
+use crate::color_ops::FTuple;
+use crate::gradient::{write_pixel, BYTES_PER_PIXEL};
+use crate::hsluv_lut::rgb_to_hsluv;
+use hsluv::hsluv_to_rgb;
+
+/// Sliders never hand out the extremes of a channel.
+pub const SLIDER_MIN: f64 = 0.02;
+pub const SLIDER_MAX: f64 = 0.98;
+
+#[derive(Clone, Copy, PartialEq, Debug)]
+pub enum Channel {
+    Red,
+    Green,
+    Blue,
+    /// HSLuv saturation
+    Saturation,
+    /// HSLuv lightness
+    Value,
+}
+
+pub fn match_value(stable: FTuple, variable: FTuple) -> FTuple {
+    let (_, _, v) = rgb_to_hsluv(stable.0, stable.1, stable.2);
+    let (h, s, _) = rgb_to_hsluv(variable.0, variable.1, variable.2);
+
+    return hsluv_to_rgb(h, s, v);
+}
+
+/// Returns the color picked when dragging a `channel` slider to `t`.
+pub fn apply_channel(rgb: FTuple, channel: Channel, t: f64, luminosity_lock: bool) -> FTuple {
+    let t = t.clamp(SLIDER_MIN, SLIDER_MAX);
+    let (r, g, b) = rgb;
+
+    let shifted = match channel {
+        Channel::Red => (t, g, b),
+        Channel::Green => (r, t, b),
+        Channel::Blue => (r, g, t),
+        Channel::Saturation => {
+            let (h, _, v) = rgb_to_hsluv(r, g, b);
+            hsluv_to_rgb(h, t * 100.0, v)
+        }
+        Channel::Value => {
+            let (h, s, _) = rgb_to_hsluv(r, g, b);
+            hsluv_to_rgb(h, s, t * 100.0)
+        }
+    };
+
+    if luminosity_lock {
+        return match_value(rgb, shifted);
+    }
+    return shifted;
+}
+
+/// Returns where the cursor of a `channel` slider sits for `rgb`, in [0, 1].
+pub fn channel_position(rgb: FTuple, channel: Channel) -> f64 {
+    let (r, g, b) = rgb;
+
+    return match channel {
+        Channel::Red => r,
+        Channel::Green => g,
+        Channel::Blue => b,
+        Channel::Saturation => rgb_to_hsluv(r, g, b).1 / 100.0,
+        Channel::Value => rgb_to_hsluv(r, g, b).2 / 100.0,
+    };
+}
+
+/// Fills `scanline` with the color every pixel column of a `channel` slider
+/// would pick, one RGBA8 pixel per column.
+pub fn fill_channel(rgb: FTuple, channel: Channel, luminosity_lock: bool, scanline: &mut [u8]) {
+    let width = scanline.len() / BYTES_PER_PIXEL;
+    let f_width = if width > 0 { width as f64 } else { 1.0f64 };
+
+    // hue, saturation and lightness of `rgb` are the same for every column
+    let (h, s, v) = rgb_to_hsluv(rgb.0, rgb.1, rgb.2);
+
+    for (i, pixel) in scanline.chunks_exact_mut(BYTES_PER_PIXEL).enumerate() {
+        let t = (i as f64 / f_width).clamp(SLIDER_MIN, SLIDER_MAX);
+
+        let color = match channel {
+            // HSLuv saturation keeps lightness, the lock would be a no-op
+            Channel::Saturation => hsluv_to_rgb(h, t * 100.0, v),
+            Channel::Value if !luminosity_lock => hsluv_to_rgb(h, s, t * 100.0),
+            _ => apply_channel(rgb, channel, t, luminosity_lock),
+        };
+
+        write_pixel(pixel, color);
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::gradient::channel_to_u8;
+
+    #[test]
+    fn fill_channel_matches_apply_channel() {
+        let rgb = (169.0 / 255.0, 133.0 / 255.0, 102.0 / 255.0);
+        let channels = vec![
+            (Channel::Red, true),
+            (Channel::Green, true),
+            (Channel::Blue, false),
+            (Channel::Saturation, true),
+            (Channel::Value, false),
+        ];
+        let width = 64;
+
+        for (channel, lock) in channels {
+            let mut scanline = vec![0u8; width * BYTES_PER_PIXEL];
+            fill_channel(rgb, channel, lock, &mut scanline);
+
+            for i in 0..width {
+                let (r, g, b) = apply_channel(rgb, channel, i as f64 / width as f64, lock);
+                let pixel = &scanline[i * BYTES_PER_PIXEL..(i + 1) * BYTES_PER_PIXEL];
+
+                assert_eq!(
+                    pixel,
+                    &[channel_to_u8(r), channel_to_u8(g), channel_to_u8(b), 255]
+                );
+            }
+        }
+    }
+
+    #[test]
+    fn channel_position_round_trips() {
+        let rgb = (146.0 / 255.0, 144.0 / 255.0, 39.0 / 255.0);
+        let channels = vec![
+            Channel::Red,
+            Channel::Green,
+            Channel::Blue,
+            Channel::Saturation,
+            Channel::Value,
+        ];
+
+        for channel in channels {
+            let t = 0.4;
+            let shifted = apply_channel(rgb, channel, t, false);
+
+            assert!((channel_position(shifted, channel) - t).abs() < 0.0001);
+        }
+    }
+}
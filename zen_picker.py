@@ -1,4 +1,4 @@
-from typing import Callable
+from typing import TYPE_CHECKING, Callable
 
 try:
     from PyQt6.QtGui import QColor
@@ -29,47 +29,107 @@ from krita import (
     Krita,
     DockWidget,
     ManagedColor,
-    DockWidgetFactory,
-    DockWidgetFactoryBase,
 )
 
-from .app import App
-from .lib_zen import (
-        color_shift, 
-        to_hsv, 
-        to_hsluv, 
-        value_shift,
-        value_shift_uv,
-        saturation_shift,
-        saturation_shift_uv
-)
-from .color_slider import ColorSlider
-from .color_manager import ColorManager
-from .app_settings import AppSettingsUI
-from .utils import q_to_managed_color, managed_to_q_color, copy_managed_color
+from .tracing import traced
+
+if TYPE_CHECKING:
+    from .app import App
+    from .lib_zen import PlaneKind
+    from .sv_plane import SvPlane
+    from .hue_strip import HueStrip
+    from .color_manager import ColorManager
+    from .frame_worker import FrameWorker
 
 # constants
 PLUGIN_NAME = "zen picker"
-sync_interval = 30
 
 class ZenDocker(DockWidget):
+    """
+    Krita creates a docker of every registered factory for each window,
+    whether it is ever shown or not. So only the title is set up here: the
+    App, the widgets and the timers are built on first show, and the timers
+    only run while the docker is visible. The modules behind them, lib_zen
+    included, are only imported then too.
+    """
     def __init__(self):
         super().__init__()
+        self.setWindowTitle(i18n(PLUGIN_NAME))
 
-        self.app = App(self)
-
-        self.timer_pulse = None
+        self.app: "App" = None
+        self.timer_pulse: QTimer = None
         self.widget = QWidget()
         self.sliders = []
-        self.color_manager: ColorManager = None
+        self.sv_plane: "SvPlane" = None
+        self.hue_strip: "HueStrip" = None
+        self.frame_worker: "FrameWorker" = None
+        self.color_manager: "ColorManager" = None
+        # the display transform is checked on the next sync
+        self.display_dirty = True
+
+    @property
+    def built(self) -> bool:
+        return self.app is not None
+
+    @traced("ZenDocker.build")
+    def build(self):
+        from .app import App
+
+        self.app = App(self)
 
         self.setup_ui()
         self.Init_Sync_Timer()
+        self.app.value_histogram.start()
+        # after the first paint, the stored state is not needed to show up
+        QTimer.singleShot(0, self.restore_state)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self.built:
+            self.build()
+            return
+
+        self.app.sync_engine.wake()
+        self.timer_pulse.start(self.app.sync_engine.interval)
+        self.app.value_histogram.start()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        if self.built:
+            self.timer_pulse.stop()
+            self.app.value_histogram.stop()
+            # the next submit after showing starts a new worker thread
+            self.frame_worker.stop()
+
+    def restore_state(self):
+        self.app.restore_state()
+        self.color_manager.update_from_app()
+        self.app.sync_engine.wake()
 
     def canvasChanged(self, canvas):
-        pass
+        if not self.built:
+            return
+
+        self.app.sync_engine.invalidate_view()
+        self.app.value_histogram.reset()
+        self.display_dirty = True
+
+    def enterEvent(self, event):
+        if not self.built:
+            return
+
+        self.app.sync_engine.wake()
+        # the display settings may have changed while the pointer was away
+        self.display_dirty = True
 
     def setup_ui(self):
+        from .lib_zen import SliderChannel
+        from .color_slider import ColorSlider
+        from .sv_plane import SvPlane
+        from .hue_strip import HueStrip
+        from .color_manager import ColorManager
+        from .frame_worker import FrameWorker
+
         top_layout = QVBoxLayout()
         main_layout = QHBoxLayout()
         slider_layout = QVBoxLayout()
@@ -93,140 +153,100 @@ class ZenDocker(DockWidget):
         scroll_area.setWidget(self.color_manager)
         scroll_area.setWidgetResizable(True)
 
-        current_color = self.app.current_color()
+        self.sv_plane = SvPlane(self.app)
+        self.hue_strip = HueStrip(self.app, self.sv_plane.kind)
+        self.sv_plane.kind_changed.connect(self.set_plane_kind)
 
         self.sliders = [
-        #red slider
-        ColorSlider(
-            self.app, 
-            lambda rgba: (
-                [0.0, rgba[1], rgba[2], rgba[3]], 
-                [1.0, rgba[1], rgba[2], rgba[3]], 
-                rgba[0]
-            ),
-            lambda rgba, color_comp: [color_comp, rgba[1], rgba[2], rgba[3]],
-            copy_managed_color(current_color),
-            copy_managed_color(current_color)
-        ),
-        #green slider
-        ColorSlider(
-            self.app, 
-            lambda rgba: (
-                [rgba[0], 0.0, rgba[2], rgba[3]], 
-                [rgba[0], 1.0, rgba[2], rgba[3]],
-                rgba[1]
-            ),
-            lambda rgba, color_comp: [rgba[0], color_comp, rgba[2], rgba[3]],
-            copy_managed_color(current_color),
-            copy_managed_color(current_color)
-        ),
-        #blue slider
-        ColorSlider(
-            self.app, 
-            lambda rgba: (
-                [rgba[0], rgba[1], 0.0, rgba[3]], 
-                [rgba[0], rgba[1], 1.0, rgba[3]],
-                rgba[2]
-            ),
-            lambda rgba, color_comp: [rgba[0], rgba[1], color_comp, rgba[3]],
-            copy_managed_color(current_color),
-            copy_managed_color(current_color)
-        ),
-        #saturation slider
-        ColorSlider(
-            self.app, 
-            lambda rgba: (
-                [*saturation_shift_uv((rgba[0], rgba[1], rgba[2]), 0.0), rgba[3]], 
-                [*saturation_shift_uv((rgba[0], rgba[1], rgba[2]), 1.0), rgba[3]],
-                to_hsluv((rgba[0],rgba[1],rgba[2]))[1]
-            ),
-            lambda rgba, color_comp: [
-                *saturation_shift_uv((rgba[0], rgba[1], rgba[2]), color_comp), 
-                rgba[3]
-            ],
-            copy_managed_color(current_color),
-            copy_managed_color(current_color),
-        ),
-        #value slider
-        ColorSlider(
-            self.app, 
-            lambda rgba: (
-                [0.0, 0.0, 0.0, rgba[3]], 
-                [1.0, 1.0, 1.0, rgba[3]],
-                to_hsluv((rgba[0],rgba[1],rgba[2]))[2]
-            ),
-            lambda rgba, color_comp: [
-                *value_shift_uv((rgba[0], rgba[1], rgba[2]), color_comp), 
-                rgba[3]
-            ],
-            copy_managed_color(current_color),
-            copy_managed_color(current_color),
-            False
-        )]
+            ColorSlider(self.app, SliderChannel.Red),
+            ColorSlider(self.app, SliderChannel.Green),
+            ColorSlider(self.app, SliderChannel.Blue),
+            ColorSlider(self.app, SliderChannel.Saturation),
+            ColorSlider(self.app, SliderChannel.Value, False)
+        ]
+
+        self.frame_worker = FrameWorker(
+            [(slider.channel, slider.luminosity_lock) for slider in self.sliders],
+            self
+        )
+        self.frame_worker.ready.connect(self.apply_frame)
 
         # compose elements
+        slider_layout.addWidget(self.hue_strip)
         for slider in self.sliders:
             slider_layout.addWidget(slider)
 
         top_layout.addWidget(scroll_area)
+        top_layout.addWidget(self.sv_plane)
         top_layout.setAlignment(Qt.AlignTop)
         top_layout.addLayout(main_layout)
         main_layout.addWidget(settings_button)
         main_layout.addLayout(slider_layout)
 
         self.widget.setLayout(top_layout)
-        self.setWindowTitle(i18n(PLUGIN_NAME))
         self.setWidget(self.widget)
         [x.show() for x in self.sliders]
 
     def Init_Sync_Timer(self):
         self.timer_pulse = QTimer(self)
         self.timer_pulse.timeout.connect(self.Sync)
-        self.timer_pulse.start(sync_interval)
-
+        self.timer_pulse.start(self.app.sync_engine.interval)
+        self.app.sync_engine.timer = self.timer_pulse
 
+    @traced("ZenDocker.Sync")
     def Sync(self):
-        self.app.sync()
+        size = self.widget.size()
+        if self.app.sync((size.width(), size.height())):
+            rgb = self.app.current_rgba.rgb
+            self.frame_worker.submit(
+                rgb,
+                self.app.light_inputs(),
+                [slider.strip_to_render(rgb) for slider in self.sliders]
+            )
+
+        # after the sync, so the foreground color is the new canvas' one
+        if self.display_dirty:
+            changed = self.app.refresh_display_transform()
+            # until a new transform is completely sampled
+            self.display_dirty = self.app.display_sampling
+            if changed:
+                self.redraw()
+
+        interval = self.app.sync_engine.interval
+        if self.timer_pulse.interval() != interval:
+            self.timer_pulse.setInterval(interval)
+
+    @traced("ZenDocker.apply_frame")
+    def apply_frame(self):
+        """Shows the frame `frame_worker` finished, unless a newer one is on its way."""
+        result = self.frame_worker.take()
+        if result is None:
+            return
+
+        frame = result.frame
+        self.app.offer_color_mix(result.rgb, result.lights, frame.mixes)
         self.color_manager.update_color_row()
-        for slider in self.sliders:
-            slider.update_color()
-
-    def write_settings(self):
-        setting = ";".join(
-            [
-                self.color_to_settings(line.left)
-                + "|"
-                + self.color_to_settings(line.right)
-                for line in self.sliders
-            ]
-        )
-
-        self.app.krita_instance.writeSetting("", settings("colors"), setting)
-
-    # TODO: temp
-    def color_to_settings(self, managedcolor):
-        return ",".join(
-            [
-                managedcolor.colorModel(),
-                managedcolor.colorDepth(),
-                managedcolor.colorProfile(),
-            ]
-            + [str(c) for c in managedcolor.components()]
-        )
+        for slider, position, strip in zip(self.sliders, frame.positions, result.strips):
+            slider.update_color(result.rgb, position, strip)
+        self.sv_plane.update_color(result.rgb)
+        self.hue_strip.update_color(result.rgb)
+
+    def set_plane_kind(self, kind: "PlaneKind"):
+        """Shows the hues of the color model the plane was switched to."""
+        self.hue_strip.kind = kind
+        self.hue_strip.update_color(self.app.current_rgba.rgb)
+
+    def redraw(self):
+        """Repaints every strip, plane and swatch, e.g. in a new display transform."""
+        for widget in (*self.sliders, self.sv_plane, self.hue_strip):
+            widget.need_redraw = True
+            widget.update()
+        self.color_manager.update()
 
     def render_settings_ui(self):
+        # the settings dialog pulls in the range slider and dialog modules,
+        # which are not needed until it is opened
+        from .app_settings import AppSettingsUI
+
         ui = AppSettingsUI(self.app)
         ui.initialize()
-
-
-def settings(name: str):
-    return PLUGIN_NAME + name
-
-
-Application.addDockWidgetFactory(
-    DockWidgetFactory(
-        "zen_picker_docker",
-        DockWidgetFactoryBase.DockPosition.DockRight,
-        ZenDocker,
-    )
-)